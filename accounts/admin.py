@@ -1,17 +1,21 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+
+from steppelibrary.admin import LargeTableAdminMixin
 from .models import UserProfile
 
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
     can_delete = False
+    readonly_fields = ['unpaid_fines_total', 'unpaid_fines_count']
 
 
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(LargeTableAdminMixin, BaseUserAdmin):
     inlines = [UserProfileInline]
     list_display = ['username', 'first_name', 'last_name', 'email', 'get_role']
+    list_select_related = ['profile']
 
     def get_role(self, obj):
         return obj.profile.get_role_display() if hasattr(obj, 'profile') else '-'
@@ -0,0 +1,105 @@
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from accounts.models import UserProfile
+
+
+PASSWORD = 'bench-password'
+PROFILE_TABLE = UserProfile._meta.db_table
+
+
+def _classify(queries):
+    counts = Counter()
+    for query in queries:
+        sql = query['sql']
+        verb = sql.split(None, 1)[0].upper()
+        if verb in ('SELECT', 'INSERT', 'UPDATE', 'DELETE'):
+            counts[verb] += 1
+            if verb != 'SELECT' and PROFILE_TABLE in sql:
+                counts['profile_writes'] += 1
+    return counts
+
+
+def _storm(usernames):
+    login_url, home_url = reverse('accounts:login'), reverse('home')
+    login, page = Counter(), Counter()
+    try:
+        for username in usernames:
+            client = Client()
+            with CaptureQueriesContext(connection) as context:
+                client.post(login_url, {'username': username, 'password': PASSWORD})
+            login.update(_classify(context.captured_queries))
+            with CaptureQueriesContext(connection) as context:
+                client.get(home_url)
+            page.update(_classify(context.captured_queries))
+    finally:
+        connections.close_all()
+    return login, page
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест входа: запросы и записи в БД на один вход и на одну страницу после него'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Сколько входов выполнить')
+        parser.add_argument('--threads', type=int, default=4, help='Параллельных потоков')
+
+    # Password hashing is the same before and after; a fast hasher keeps the
+    # benchmark about database work
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def handle(self, *args, **options):
+        db = connections['default']
+        original_name = db.settings_dict['NAME']
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                connections.close_all()
+                db.settings_dict['NAME'] = str(Path(tmp) / 'bench.sqlite3')
+                call_command('migrate', verbosity=0)
+                self._run(options)
+        finally:
+            connections.close_all()
+            db.settings_dict['NAME'] = original_name
+
+    def _run(self, options):
+        password = make_password(PASSWORD)
+        users = User.objects.bulk_create(
+            User(username=f'reader{i}', password=password) for i in range(options['users'])
+        )
+        UserProfile.objects.bulk_create(UserProfile(user=user) for user in users)
+        usernames = [user.username for user in users]
+        threads = options['threads']
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            results = list(pool.map(_storm, [usernames[i::threads] for i in range(threads)]))
+        seconds = time.perf_counter() - started
+
+        login, page = Counter(), Counter()
+        for thread_login, thread_page in results:
+            login.update(thread_login)
+            page.update(thread_page)
+
+        n = len(usernames)
+
+        def line(counts):
+            writes = counts['INSERT'] + counts['UPDATE'] + counts['DELETE']
+            return (
+                f'SELECT {counts["SELECT"] / n:.2f}, записей {writes / n:.2f} '
+                f'(из них в профиль {counts["profile_writes"] / n:.2f})'
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{n} входов в {threads} потоках: {n / seconds:.0f} входов/с'))
+        self.stdout.write(f'  на вход:     {line(login)}')
+        self.stdout.write(f'  на страницу: {line(page)}')
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:36
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_balances(apps, schema_editor):
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    Fine = apps.get_model('loans', 'Fine')
+    balances = Fine.objects.filter(is_paid=False).values('loan__borrower').annotate(
+        total=Sum('amount'), count=Count('pk')
+    )
+    for row in balances:
+        UserProfile.objects.filter(user_id=row['loan__borrower']).update(
+            unpaid_fines_total=row['total'], unpaid_fines_count=row['count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('loans', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unpaid_fines_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Неоплаченных штрафов'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='unpaid_fines_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Неоплаченные штрафы (KZT)'),
+        ),
+        migrations.RunPython(fill_balances, migrations.RunPython.noop),
+    ]
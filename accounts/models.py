@@ -14,6 +14,11 @@ class UserProfile(models.Model):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='student', verbose_name='Роль')
     student_id = models.CharField(max_length=20, blank=True, verbose_name='Студенческий ID')
     phone = models.CharField(max_length=20, blank=True, verbose_name='Телефон')
+    # Kept in step by loans.Fine.save()/delete(); reconcile_fine_balances repairs drift
+    unpaid_fines_total = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, verbose_name='Неоплаченные штрафы (KZT)'
+    )
+    unpaid_fines_count = models.PositiveIntegerField(default=0, verbose_name='Неоплаченных штрафов')
 
     class Meta:
         verbose_name = 'Профиль'
@@ -22,6 +27,30 @@ class UserProfile(models.Model):
     def __str__(self):
         return f'{self.user.get_full_name()} ({self.get_role_display()})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        profile = super().from_db(db, field_names, values)
+        profile._loaded = profile._editable_values()
+        return profile
+
+    def _editable_values(self):
+        # The fine balance is never written back from memory: loans.Fine moves it with F() updates
+        return {
+            f.attname: self.__dict__[f.attname] for f in self._meta.concrete_fields
+            if f.attname in self.__dict__ and f.attname not in ('id', 'unpaid_fines_total', 'unpaid_fines_count')
+        }
+
+    def save(self, *args, **kwargs):
+        # A full save of a loaded profile writes only the fields that changed, or nothing
+        if not self._state.adding and kwargs.get('update_fields') is None and '_loaded' in self.__dict__:
+            current = self._editable_values()
+            changed = [name for name, value in current.items() if self._loaded.get(name) != value]
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        self._loaded = self._editable_values()
+
     @property
     def is_librarian(self):
         return self.role == 'librarian'
@@ -32,20 +61,11 @@ class UserProfile(models.Model):
 
     @property
     def has_unpaid_fines(self):
-        from loans.models import Fine
-        return Fine.objects.filter(
-            loan__borrower=self.user,
-            is_paid=False
-        ).exists()
+        return self.unpaid_fines_count > 0
 
     @property
     def total_unpaid_fines(self):
-        from loans.models import Fine
-        result = Fine.objects.filter(
-            loan__borrower=self.user,
-            is_paid=False
-        ).aggregate(total=models.Sum('amount'))
-        return result['total'] or 0
+        return self.unpaid_fines_total
 
 
 @receiver(post_save, sender=User)
@@ -53,8 +73,3 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
 
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
@@ -1,3 +1,40 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import BACKEND_SESSION_KEY, authenticate, get_user
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+
+from .models import UserProfile
+
+
+class ProfileModelBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('librarian', password='секрет-123')
+        UserProfile.objects.filter(user=self.user).update(role='librarian')
+
+    def session_user(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        return get_user(request)
+
+    def test_login_stores_the_profile_backend(self):
+        response = self.client.post('/accounts/login/', {'username': 'librarian', 'password': 'секрет-123'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], 'accounts.backends.ProfileModelBackend')
+
+    def test_session_user_comes_with_its_profile(self):
+        self.client.login(username='librarian', password='секрет-123')
+        with self.assertNumQueries(2):
+            # The session, then the user joined with its profile
+            user = self.session_user()
+            self.assertTrue(user.profile.is_librarian)
+
+    def test_failed_login_checks_the_password_once(self):
+        with mock.patch.object(User, 'check_password', autospec=True, return_value=False) as check_password:
+            self.assertIsNone(authenticate(username='librarian', password='не тот'))
+        self.assertEqual(check_password.call_count, 1)
+
+    def test_inactive_users_are_not_restored_from_the_session(self):
+        self.client.login(username='librarian', password='секрет-123')
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertFalse(self.session_user().is_authenticated)
@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html
+
+from steppelibrary.admin import LargeTableAdminMixin
 from .models import Genre, Author, Book, BookInstance
 
 
@@ -10,7 +14,7 @@ class GenreAdmin(admin.ModelAdmin):
 
 
 @admin.register(Author)
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['last_name', 'first_name']
     search_fields = ['last_name', 'first_name']
 
@@ -29,27 +33,45 @@ class BookInstanceInline(admin.TabularInline):
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['title', 'display_authors', 'isbn', 'language', 'available_count', 'total_count']
     list_filter = ['genres', 'language', 'date_added']
     search_fields = ['title', 'isbn', 'authors__last_name']
-    filter_horizontal = ['authors', 'genres']
+    autocomplete_fields = ['authors']
+    filter_horizontal = ['genres']
     inlines = [BookInstanceInline]
 
+    def get_queryset(self, request):
+        # Subqueries rather than a joined GROUP BY: they run for the shown page only,
+        # and the paginator's COUNT(*) leaves them out
+        copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book')
+        count = copies.annotate(n=Count('pk')).values('n')
+        available = copies.filter(status='available').annotate(n=Count('pk')).values('n')
+        return super().get_queryset(request).annotate(
+            available_n=Coalesce(Subquery(available), 0),
+            total_n=Coalesce(Subquery(count), 0),
+        ).prefetch_related('authors')
+
     def available_count(self, obj):
-        return obj.available_copies
+        return obj.available_n
     available_count.short_description = 'Доступно'
+    available_count.admin_order_field = 'available_n'
 
     def total_count(self, obj):
-        return obj.total_copies
+        return obj.total_n
     total_count.short_description = 'Всего'
+    total_count.admin_order_field = 'total_n'
 
 
 @admin.register(BookInstance)
-class BookInstanceAdmin(admin.ModelAdmin):
+class BookInstanceAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['inventory_number', 'book', 'status', 'qr_code_preview']
     list_filter = ['status']
     search_fields = ['inventory_number', 'book__title']
+    list_select_related = ['book']
+    autocomplete_fields = ['book']
+    # The model's order goes through the book join; this one walks the unique index
+    ordering = ['inventory_number']
     readonly_fields = ['id', 'qr_code_preview_large']
 
     def qr_code_preview(self, obj):
@@ -0,0 +1,32 @@
+import hashlib
+
+# Kazakh Cyrillic order (a superset of the Russian alphabet), then Latin
+CYRILLIC = 'АӘБВГҒДЕЁЖЗИЙКҚЛМНҢОӨПРСТУҰҮФХҺЦЧШЩЪЫІЬЭЮЯ'
+LATIN = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+ALPHABET = CYRILLIC + LATIN
+OTHER = '#'
+
+
+def bucket_letter(name):
+    letter = (name or '').strip()[:1].upper()
+    return letter if letter and letter in ALPHABET else OTHER
+
+
+def letter_order(letter):
+    return ALPHABET.index(letter) if letter in ALPHABET else len(ALPHABET)
+
+
+def initials(first_name, last_name, fallback=''):
+    result = f'{(first_name or "").strip()[:1]}{(last_name or "").strip()[:1]}'.upper()
+    if result:
+        return result
+    parts = str(fallback).strip().split()
+    if not parts:
+        return 'AU'
+    if len(parts) == 1:
+        return parts[0][:2].upper()
+    return f'{parts[0][0]}{parts[1][0]}'.upper()
+
+
+def avatar_hue(text):
+    return int(hashlib.md5(str(text).encode('utf-8')).hexdigest(), 16) % 360
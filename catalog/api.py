@@ -0,0 +1,360 @@
+import base64
+import binascii
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Q
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_GET
+
+from .models import Book, Author, CatalogVersion, Genre, BookInstance
+from .coalesce import CoalescingCache
+
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Public field name -> database column. Relations are loaded separately.
+BOOK_COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'isbn': 'isbn',
+    'language': 'language',
+    'summary': 'summary',
+    'cover': 'cover',
+    'date_added': 'date_added',
+}
+BOOK_RELATIONS = {'authors', 'genres', 'availability'}
+BOOK_DEFAULT_FIELDS = ['id', 'title', 'authors', 'availability']
+
+AUTHOR_COLUMNS = {
+    'id': 'id',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'bio': 'bio',
+    'book_count': 'book_count',
+}
+AUTHOR_DEFAULT_FIELDS = ['id', 'first_name', 'last_name', 'book_count']
+
+
+kiosk_cache = CoalescingCache('kiosk', ttl=settings.KIOSK_CACHE_SECONDS)
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _catalog_etag():
+    # No row where the database has no triggers to keep one current
+    version = CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first()
+    return None if version is None else f'"catalog-{version}"'
+
+
+def _validated(response, etag):
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def api_view(view_func):
+    @require_GET
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        # One primary-key read answers a revalidation without building the body.
+        # Read before the body: a change in between only costs the client a refetch
+        etag = _catalog_etag()
+        if etag is not None:
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                return _validated(response, etag)
+        try:
+            payload = view_func(request, *args, **kwargs)
+        except ApiError as exc:
+            return JsonResponse({'error': exc.message}, status=exc.status, json_dumps_params={'ensure_ascii': False})
+        return _conditional_json(request, payload, etag)
+    return wrapper
+
+
+def async_api_view(view_func):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        try:
+            payload = await view_func(request, *args, **kwargs)
+        except ApiError as exc:
+            return JsonResponse({'error': exc.message}, status=exc.status, json_dumps_params={'ensure_ascii': False})
+        # Kiosk answers include reservation queues, which the catalog version does
+        # not follow; the payload comes from kiosk_cache, so hashing it is cheap
+        return _conditional_json(request, payload)
+    return wrapper
+
+
+def _conditional_json(request, payload, etag=None):
+    body = json.dumps(payload, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    etag = etag or f'"{hashlib.md5(body.encode("utf-8")).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    return _validated(response, etag)
+
+
+def _parse_fields(request, columns, relations, default):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in columns and f not in relations]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+    return list(dict.fromkeys(fields))
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        raise ApiError('Параметр limit должен быть числом.')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _decode_cursor(request):
+    raw = request.GET.get('cursor')
+    if not raw:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(raw.encode('ascii')).decode('ascii'))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ApiError('Некорректный курсор.')
+
+
+def _encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode('ascii')).decode('ascii')
+
+
+def _next_url(request, last_pk):
+    params = request.GET.copy()
+    params['cursor'] = _encode_cursor(last_pk)
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def _paginate(request, queryset, column_names):
+    # Keyset pagination on the primary key: constant cost at any depth
+    limit = _page_size(request)
+    cursor = _decode_cursor(request)
+    if cursor is not None:
+        queryset = queryset.filter(pk__gt=cursor)
+    select = list(dict.fromkeys(['id'] + column_names))
+    rows = list(queryset.order_by('pk').values_list(*select)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_url = _next_url(request, rows[-1][0]) if has_more else None
+    return select, rows, next_url
+
+
+def _cover_url(path):
+    return f'{settings.MEDIA_URL}{path}' if path else None
+
+
+def _book_authors(book_ids):
+    authors = {}
+    rows = Book.authors.through.objects.filter(book_id__in=book_ids).order_by(
+        'author__last_name', 'author__first_name'
+    ).values_list('book_id', 'author_id', 'author__first_name', 'author__last_name')
+    for book_id, author_id, first_name, last_name in rows:
+        authors.setdefault(book_id, []).append(
+            {'id': author_id, 'first_name': first_name, 'last_name': last_name}
+        )
+    return authors
+
+
+def _book_genres(book_ids):
+    genres = {}
+    rows = Book.genres.through.objects.filter(book_id__in=book_ids).order_by(
+        'genre__name'
+    ).values_list('book_id', 'genre_id', 'genre__name')
+    for book_id, genre_id, name in rows:
+        genres.setdefault(book_id, []).append({'id': genre_id, 'name': name})
+    return genres
+
+
+def _book_availability(book_ids):
+    rows = BookInstance.objects.filter(book_id__in=book_ids).values('book_id').annotate(
+        total=Count('pk'),
+        available=Count('pk', filter=Q(status='available')),
+    ).values_list('book_id', 'available', 'total')
+    return {book_id: {'available': available, 'total': total} for book_id, available, total in rows}
+
+
+def _serialize_books(select, rows, fields):
+    book_ids = [row[0] for row in rows]
+    authors = _book_authors(book_ids) if 'authors' in fields else {}
+    genres = _book_genres(book_ids) if 'genres' in fields else {}
+    availability = _book_availability(book_ids) if 'availability' in fields else {}
+    empty_availability = {'available': 0, 'total': 0}
+
+    positions = [(field, select.index(BOOK_COLUMNS[field])) for field in fields if field in BOOK_COLUMNS]
+    results = []
+    for row in rows:
+        item = {field: row[index] for field, index in positions}
+        if 'cover' in item:
+            item['cover'] = _cover_url(item['cover'])
+        if 'authors' in fields:
+            item['authors'] = authors.get(row[0], [])
+        if 'genres' in fields:
+            item['genres'] = genres.get(row[0], [])
+        if 'availability' in fields:
+            item['availability'] = availability.get(row[0], empty_availability)
+        results.append(item)
+    return results
+
+
+def _filter_books(request, books):
+    q = request.GET.get('q', '').strip()
+    if q:
+        books = books.filter(
+            Q(title__icontains=q) |
+            Q(authors__last_name__icontains=q) |
+            Q(authors__first_name__icontains=q) |
+            Q(isbn__icontains=q)
+        ).distinct()
+    genre = request.GET.get('genre')
+    if genre:
+        if not genre.isdigit():
+            raise ApiError('Параметр genre должен быть числом.')
+        books = books.filter(genres=genre)
+    language = request.GET.get('language')
+    if language:
+        books = books.filter(language=language)
+    if request.GET.get('available_only') in ('1', 'true', 'on'):
+        books = books.filter(instances__status='available').distinct()
+    return books
+
+
+@api_view
+def book_list(request):
+    fields = _parse_fields(request, BOOK_COLUMNS, BOOK_RELATIONS, BOOK_DEFAULT_FIELDS)
+    columns = [BOOK_COLUMNS[f] for f in fields if f in BOOK_COLUMNS]
+    select, rows, next_url = _paginate(request, _filter_books(request, Book.objects.all()), columns)
+    return {'results': _serialize_books(select, rows, fields), 'next': next_url}
+
+
+@api_view
+def book_detail(request, pk):
+    fields = _parse_fields(request, BOOK_COLUMNS, BOOK_RELATIONS, list(BOOK_COLUMNS) + sorted(BOOK_RELATIONS))
+    select = list(dict.fromkeys(['id'] + [BOOK_COLUMNS[f] for f in fields if f in BOOK_COLUMNS]))
+    rows = list(Book.objects.filter(pk=pk).values_list(*select))
+    if not rows:
+        raise ApiError('Книга не найдена.', status=404)
+    return _serialize_books(select, rows, fields)[0]
+
+
+@api_view
+def book_availability(request, pk):
+    if not Book.objects.filter(pk=pk).exists():
+        raise ApiError('Книга не найдена.', status=404)
+    instances = [
+        {'inventory_number': inventory_number, 'status': status}
+        for inventory_number, status in BookInstance.objects.filter(book_id=pk).order_by(
+            'inventory_number'
+        ).values_list('inventory_number', 'status')
+    ]
+    return {
+        'book': pk,
+        'available': sum(1 for i in instances if i['status'] == 'available'),
+        'total': len(instances),
+        'instances': instances,
+    }
+
+
+@api_view
+def author_list(request):
+    fields = _parse_fields(request, AUTHOR_COLUMNS, set(), AUTHOR_DEFAULT_FIELDS)
+    authors = Author.objects.all()
+    if 'book_count' in fields:
+        authors = authors.annotate(book_count=Count('books'))
+    columns = [AUTHOR_COLUMNS[f] for f in fields]
+    select, rows, next_url = _paginate(request, authors, columns)
+    positions = [(field, select.index(AUTHOR_COLUMNS[field])) for field in fields]
+    return {
+        'results': [{field: row[index] for field, index in positions} for row in rows],
+        'next': next_url,
+    }
+
+
+@api_view
+def genre_list(request):
+    rows = Genre.objects.annotate(book_count=Count('books')).order_by('name').values_list('id', 'name', 'book_count')
+    return {'results': [{'id': pk, 'name': name, 'book_count': count} for pk, name, count in rows]}
+
+
+# ===== Kiosk polling (async) =====
+
+async def _fetch_book_availability(pk):
+    from loans.models import Reservation
+    try:
+        book = await Book.objects.only('id', 'title').aget(pk=pk)
+    except Book.DoesNotExist:
+        return None
+    instances = []
+    async for inventory_number, status in BookInstance.objects.filter(book_id=pk).order_by(
+        'inventory_number'
+    ).values_list('inventory_number', 'status'):
+        instances.append({'inventory_number': inventory_number, 'status': status})
+    return {
+        'book': book.pk,
+        'title': book.title,
+        'available': sum(1 for i in instances if i['status'] == 'available'),
+        'total': len(instances),
+        'queue': await Reservation.objects.filter(book_id=pk, is_active=True).acount(),
+        'instances': instances,
+    }
+
+
+async def _fetch_instance_status(inventory_number):
+    from loans.models import Loan, Reservation
+    try:
+        instance = await BookInstance.objects.select_related('book').only(
+            'inventory_number', 'status', 'book__id', 'book__title'
+        ).aget(inventory_number=inventory_number)
+    except BookInstance.DoesNotExist:
+        return None
+    due_date = None
+    if instance.status == 'on_loan':
+        due_date = await Loan.objects.filter(
+            book_instance_id=instance.pk, is_returned=False
+        ).values_list('due_date', flat=True).afirst()
+    return {
+        'inventory_number': instance.inventory_number,
+        'status': instance.status,
+        'status_display': instance.get_status_display(),
+        'book': {'id': instance.book.pk, 'title': instance.book.title},
+        'due_date': due_date,
+        'queue': await Reservation.objects.filter(book_id=instance.book.pk, is_active=True).acount(),
+    }
+
+
+@async_api_view
+async def kiosk_book_availability(request, pk):
+    payload = await kiosk_cache.get_or_fetch(('book', pk), lambda: _fetch_book_availability(pk))
+    if payload is None:
+        raise ApiError('Книга не найдена.', status=404)
+    return payload
+
+
+@async_api_view
+async def kiosk_instance_status(request, inventory_number):
+    inventory_number = inventory_number.removeprefix('STEPPE-LIB:')
+    payload = await kiosk_cache.get_or_fetch(
+        ('instance', inventory_number), lambda: _fetch_instance_status(inventory_number)
+    )
+    if payload is None:
+        raise ApiError('Экземпляр не найден.', status=404)
+    return payload
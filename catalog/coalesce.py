@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+from steppelibrary.metrics import CACHE_LOOKUPS
+
+
+class CoalescingCache:
+    """Short-lived per-process cache where concurrent misses for one key share a single fetch."""
+
+    def __init__(self, name, ttl=2.0, max_entries=2048):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._values = {}
+        self._inflight = {}
+        # Under WSGI each request runs its own loop in its own thread
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lookups = {result: CACHE_LOOKUPS.labels(name, result) for result in ('hit', 'miss', 'coalesced')}
+
+    async def get_or_fetch(self, key, fetch):
+        entry = self._values.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self._lookups['hit'].inc()
+            return entry[1]
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            future = self._inflight.get(key)
+            # Futures are bound to their loop; under WSGI every request has its own
+            leader = future is None or future.get_loop() is not loop
+            if leader:
+                future = self._inflight[key] = loop.create_future()
+        if not leader:
+            self.coalesced += 1
+            self._lookups['coalesced'].inc()
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # The leader was cancelled (its client went away): fetch again
+            return await self.get_or_fetch(key, fetch)
+
+        self.misses += 1
+        self._lookups['miss'].inc()
+        try:
+            value = await fetch()
+        except BaseException as exc:
+            # Followers wait on the future: it must be resolved whatever ended the fetch
+            if isinstance(exc, Exception):
+                future.set_exception(exc)
+                # Mark as retrieved so a fetch nobody else waited on does not warn
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        else:
+            future.set_result(value)
+            self._store(key, value)
+            return value
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def _store(self, key, value):
+        with self._lock:
+            if key not in self._values and len(self._values) >= self.max_entries:
+                self._values.pop(next(iter(self._values)), None)
+            self._values[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key):
+        self._values.pop(key, None)
+
+    def clear(self):
+        self._values.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
@@ -0,0 +1,75 @@
+import os
+import posixpath
+import re
+from dataclasses import dataclass
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Case, Value, When
+
+from .models import Book, cover_storage
+
+
+DIRECTORY = 'covers'
+CHUNK = 500
+HASHED = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+@dataclass
+class DedupeResult:
+    files: int = 0
+    unique: int = 0
+    removed: int = 0
+    bytes_freed: int = 0
+    books_updated: int = 0
+
+
+def legacy_files(storage):
+    """Cover files saved before content addressing, as storage names."""
+    root = storage.path(DIRECTORY)
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.startswith('.upload-'):
+                continue
+            relative = os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, '/')
+            if not HASHED.match(relative):
+                yield posixpath.join(DIRECTORY, relative)
+
+
+def dedupe(dry_run=False):
+    """Move legacy covers to their content-hash names, point books at them and drop the copies."""
+    storage = cover_storage()
+    result = DedupeResult()
+    renames, targets = {}, set()
+    for name in sorted(legacy_files(storage)):
+        with storage.open(name) as content:
+            target = storage.hashed_name(name, File(content, name))
+            stored = target in targets or storage.exists(target)
+            if not stored and not dry_run:
+                storage.save(name, content)
+        result.files += 1
+        if stored:
+            result.bytes_freed += storage.size(name)
+        else:
+            result.unique += 1
+        renames[name] = target
+        targets.add(target)
+
+    if dry_run:
+        result.books_updated = Book.objects.filter(cover__in=list(renames)).count()
+        result.removed = result.files
+        return result
+
+    # Every target is on disk before any row points at it, and rows move
+    # before the old files go, so a cover is never missing
+    names = list(renames)
+    with transaction.atomic():
+        for start in range(0, len(names), CHUNK):
+            chunk = names[start:start + CHUNK]
+            result.books_updated += Book.objects.filter(cover__in=chunk).update(
+                cover=Case(*(When(cover=name, then=Value(renames[name])) for name in chunk))
+            )
+    for name in names:
+        storage.delete(name)
+        result.removed += 1
+    return result
@@ -27,6 +27,12 @@ class BookSearchForm(forms.Form):
         required=False,
         label='Только в наличии'
     )
+    sort = forms.ChoiceField(
+        choices=[('', 'Сначала новые'), ('popular', 'Сначала популярные')],
+        required=False,
+        label='Сортировка',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
 
 
 class BookForm(forms.ModelForm):
@@ -0,0 +1,154 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+
+from catalog.api import kiosk_cache
+from catalog.models import Book
+
+
+def _summary(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (
+        f'{label}: {len(latencies)} запросов за {elapsed:.2f} с, '
+        f'{len(latencies) / elapsed:.0f} rps, '
+        f'p50 {statistics.median(latencies) * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс'
+    )
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест киоск-эндпоинта доступности: ASGI (async) против WSGI (потоки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=300, help='Одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=10, help='Запросов на клиента')
+        parser.add_argument('--threads', type=int, default=16, help='Потоков WSGI-воркера')
+        parser.add_argument('--book', type=int, help='ID книги (по умолчанию первая)')
+
+    def handle(self, *args, **options):
+        book_id = options['book'] or Book.objects.values_list('pk', flat=True).first()
+        if book_id is None:
+            raise CommandError('В каталоге нет книг. Запустите seed_data.')
+        path = reverse('catalog:api_kiosk_book', args=[book_id])
+        clients, per_client = options['clients'], options['requests']
+
+        self.stdout.write(f'{path}: {clients} клиентов x {per_client} запросов')
+
+        kiosk_cache.clear()
+        before = kiosk_cache.stats()
+        latencies, elapsed = asyncio.run(self._run_asgi(path, clients, per_client))
+        after = kiosk_cache.stats()
+        self.stdout.write(_summary('ASGI', latencies, elapsed))
+        self.stdout.write(
+            f'  чтений из БД: {after["misses"] - before["misses"]}, '
+            f'объединено: {after["coalesced"] - before["coalesced"]}, '
+            f'из кэша: {after["hits"] - before["hits"]}'
+        )
+
+        kiosk_cache.clear()
+        before = kiosk_cache.stats()
+        latencies, elapsed = self._run_wsgi(path, clients, per_client, options['threads'])
+        after = kiosk_cache.stats()
+        self.stdout.write(_summary(f'WSGI ({options["threads"]} потоков)', latencies, elapsed))
+        self.stdout.write(
+            f'  чтений из БД: {after["misses"] - before["misses"]}, '
+            f'из кэша: {after["hits"] - before["hits"]}'
+        )
+
+    async def _run_asgi(self, path, clients, per_client):
+        from steppelibrary.asgi import application
+
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+
+        async def one_request():
+            sent = False
+            status = None
+
+            async def receive():
+                nonlocal sent
+                if not sent:
+                    sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await asyncio.Event().wait()
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+
+            started = time.perf_counter()
+            await application(dict(scope), receive, send)
+            if status != 200:
+                raise CommandError(f'ASGI вернул {status}')
+            return time.perf_counter() - started
+
+        async def client():
+            return [await one_request() for _ in range(per_client)]
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+        return [latency for result in results for latency in result], elapsed
+
+    def _run_wsgi(self, path, clients, per_client, threads):
+        from steppelibrary.wsgi import application
+
+        def one_request(started):
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': '',
+                'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'localhost',
+                'wsgi.version': (1, 0),
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': BytesIO(),
+                'wsgi.errors': BytesIO(),
+                'wsgi.multithread': True,
+                'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            statuses = []
+            response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            b''.join(response)
+            response.close()
+            if not statuses or not statuses[0].startswith('200'):
+                raise CommandError(f'WSGI вернул {statuses}')
+            return time.perf_counter() - started
+
+        def client(submitted):
+            # The first request also waits for a free worker thread, as it would behind a real server
+            try:
+                latencies = [one_request(submitted)]
+                latencies += [one_request(time.perf_counter()) for _ in range(per_client - 1)]
+                return latencies
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            futures = [pool.submit(client, time.perf_counter()) for _ in range(clients)]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+        return [latency for result in results for latency in result], elapsed
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from catalog import covers
+
+
+class Command(BaseCommand):
+    help = 'Свернуть одинаковые файлы обложек в один и перевести обложки на имена по хешу содержимого'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать')
+
+    def handle(self, *args, **options):
+        result = covers.dedupe(dry_run=options['dry_run'])
+        freed = f'{result.bytes_freed / 1024 / 1024:.1f} МБ'
+        if options['dry_run']:
+            self.stdout.write(
+                f'Файлов со старыми именами: {result.files}, уникальных: {result.unique}. '
+                f'Можно освободить {freed}, обложек книг к переписыванию: {result.books_updated}'
+            )
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Файлов перенесено: {result.files}, уникальных: {result.unique}, '
+            f'освобождено {freed}, обложек книг переписано: {result.books_updated}'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from catalog import popularity
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать популярность книг по всей истории выдач и бронирований'
+
+    def handle(self, *args, **options):
+        count = popularity.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Готово. Книг с выдачами или бронированиями: {count}'))
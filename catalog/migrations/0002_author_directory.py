@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:39
+
+from django.db import migrations, models
+
+from catalog import alphabet
+
+
+def fill_display_attributes(apps, schema_editor):
+    Author = apps.get_model('catalog', 'Author')
+    authors = list(Author.objects.all())
+    for author in authors:
+        name = f'{author.last_name} {author.first_name}'
+        author.letter = alphabet.bucket_letter(author.last_name)
+        author.initials = alphabet.initials(author.first_name, author.last_name, name)
+        author.avatar_hue = alphabet.avatar_hue(name)
+    Author.objects.bulk_update(authors, ['letter', 'initials', 'avatar_hue'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='avatar_hue',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Цвет аватара'),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='initials',
+            field=models.CharField(blank=True, editable=False, max_length=4, verbose_name='Инициалы'),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='letter',
+            field=models.CharField(default='#', editable=False, max_length=1, verbose_name='Буква'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['letter', 'last_name', 'first_name'], name='author_letter_name_idx'),
+        ),
+        migrations.RunPython(fill_display_attributes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:59
+
+from django.db import migrations, models
+
+from catalog import popularity
+
+
+def fill_popularity(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    scores = {}
+    events = [
+        (apps.get_model('loans', 'Loan'), 'book_instance__book_id', 'issue_date', popularity.LOAN_WEIGHT),
+        (apps.get_model('loans', 'ArchivedLoan'), 'book_instance__book_id', 'issue_date', popularity.LOAN_WEIGHT),
+        (apps.get_model('loans', 'Reservation'), 'book_id', 'created_at', popularity.RESERVATION_WEIGHT),
+    ]
+    for model, book, when, weight in events:
+        for book_id, at in model.objects.values_list(book, when).iterator(chunk_size=5000):
+            scores[book_id] = scores.get(book_id, 0) + weight * popularity.growth(at)
+    books = list(Book.objects.filter(pk__in=scores))
+    for book in books:
+        book.popularity = scores[book.pk]
+    Book.objects.bulk_update(books, ['popularity'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_author_directory'),
+        ('loans', '0005_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-popularity', 'title'], name='book_popularity_idx'),
+        ),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:20
+
+import catalog.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_book_popularity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='cover',
+            field=models.ImageField(blank=True, null=True, storage=catalog.models.cover_storage, upload_to='covers/', verbose_name='Обложка'),
+        ),
+    ]
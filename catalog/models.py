@@ -1,10 +1,13 @@
 import uuid
-import qrcode
 from io import BytesIO
 from django.db import models
 from django.core.files import File
+from django.core.files.storage import storages
 from django.urls import reverse
 
+from . import alphabet
+from .signals import instance_status_changed
+
 
 class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name='Название')
@@ -22,19 +25,39 @@ class Author(models.Model):
     first_name = models.CharField(max_length=100, verbose_name='Имя')
     last_name = models.CharField(max_length=100, verbose_name='Фамилия')
     bio = models.TextField(blank=True, verbose_name='Биография')
+    # Derived from the name in save(): directory bucket and avatar, so listings never hash per render
+    letter = models.CharField(max_length=1, default=alphabet.OTHER, editable=False, verbose_name='Буква')
+    initials = models.CharField(max_length=4, blank=True, editable=False, verbose_name='Инициалы')
+    avatar_hue = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Цвет аватара')
 
     class Meta:
         verbose_name = 'Автор'
         verbose_name_plural = 'Авторы'
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['letter', 'last_name', 'first_name'], name='author_letter_name_idx'),
+        ]
 
     def __str__(self):
         return f'{self.last_name} {self.first_name}'
 
+    def save(self, *args, **kwargs):
+        self.letter = alphabet.bucket_letter(self.last_name)
+        self.initials = alphabet.initials(self.first_name, self.last_name, self)
+        self.avatar_hue = alphabet.avatar_hue(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'letter', 'initials', 'avatar_hue'}
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('catalog:author_detail', args=[self.pk])
 
 
+def cover_storage():
+    return storages['covers']
+
+
 class Book(models.Model):
     LANGUAGE_CHOICES = [
         ('kk', 'Казахский'),
@@ -47,14 +70,21 @@ class Book(models.Model):
     genres = models.ManyToManyField(Genre, related_name='books', blank=True, verbose_name='Жанры')
     isbn = models.CharField('ISBN', max_length=13, unique=True, help_text='13-значный ISBN')
     summary = models.TextField(verbose_name='Описание', blank=True)
-    cover = models.ImageField(upload_to='covers/', blank=True, null=True, verbose_name='Обложка')
+    cover = models.ImageField(
+        upload_to='covers/', storage=cover_storage, blank=True, null=True, verbose_name='Обложка'
+    )
     language = models.CharField(max_length=5, choices=LANGUAGE_CHOICES, default='ru', verbose_name='Язык')
     date_added = models.DateField(auto_now_add=True, verbose_name='Дата добавления')
+    # Loans and reservations with exponential decay, see catalog.popularity
+    popularity = models.FloatField(default=0, editable=False, verbose_name='Популярность')
 
     class Meta:
         verbose_name = 'Книга'
         verbose_name_plural = 'Книги'
         ordering = ['-date_added', 'title']
+        indexes = [
+            models.Index(fields=['-popularity', 'title'], name='book_popularity_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -104,14 +134,35 @@ class BookInstance(models.Model):
     def __str__(self):
         return f'{self.book.title} [{self.inventory_number}]'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance._loaded_status = instance.status
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.inventory_number:
             self.inventory_number = f'INV-{str(self.id)[:8].upper()}'
         if not self.qr_code:
             self._generate_qr_code()
+        old_status = None if self._state.adding else self.__dict__.get('_loaded_status', self.status)
         super().save(*args, **kwargs)
+        if old_status != self.status:
+            self._loaded_status = self.status
+            instance_status_changed.send(
+                sender=BookInstance,
+                instance_id=self.pk,
+                book_id=self.book_id,
+                inventory_number=self.inventory_number,
+                old=old_status,
+                new=self.status,
+            )
 
     def _generate_qr_code(self):
+        # qrcode pulls in Pillow: imported here so processes that never draw a code skip it
+        import qrcode
+
         qr = qrcode.QRCode(version=1, box_size=10, border=4)
         qr_data = f'STEPPE-LIB:{self.inventory_number}'
         qr.add_data(qr_data)
@@ -131,3 +182,19 @@ class BookInstance(models.Model):
             'on_loan': 'bg-primary',
             'lost': 'bg-danger',
         }.get(self.status, 'bg-secondary')
+
+
+class CatalogVersion(models.Model):
+    """One row whose number grows with every change the catalog API can show; the API's ETag.
+
+    SQLite triggers from migration 0005 bump it, so bulk and raw-SQL updates count too.
+    On other databases the migration leaves the table empty and the API hashes its bodies.
+    """
+    version = models.BigIntegerField(default=0, verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Версия каталога'
+        verbose_name_plural = 'Версии каталога'
+
+    def __str__(self):
+        return str(self.version)
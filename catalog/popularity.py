@@ -0,0 +1,51 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Book
+
+
+# Every event is stored already scaled up by 2 ** (age of EPOCH / half-life)
+# instead of decaying all scores as time passes: the common factor does not
+# change the order, so Book.popularity sorts like the decayed score at any
+# moment and a new event is a single UPDATE. Floats hold the factor for
+# about 1000 half-lives past EPOCH.
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+LOAN_WEIGHT = 1.0
+RESERVATION_WEIGHT = 0.5
+
+
+def growth(when=None):
+    half_life = settings.POPULARITY_HALF_LIFE_DAYS * 86400
+    return 2 ** (((when or timezone.now()) - EPOCH).total_seconds() / half_life)
+
+
+def record(book_id, weight, when=None):
+    Book.objects.filter(pk=book_id).update(popularity=F('popularity') + weight * growth(when))
+
+
+def decayed(book, when=None):
+    """The score in event units as of `when`: a loan today counts 1, one a half-life ago 0.5."""
+    return book.popularity / growth(when)
+
+
+def rebuild():
+    from loans.models import ArchivedLoan, Loan, Reservation
+
+    scores = {}
+    events = [
+        (Loan.objects.values_list('book_instance__book_id', 'issue_date'), LOAN_WEIGHT),
+        (ArchivedLoan.objects.values_list('book_instance__book_id', 'issue_date'), LOAN_WEIGHT),
+        (Reservation.objects.values_list('book_id', 'created_at'), RESERVATION_WEIGHT),
+    ]
+    for rows, weight in events:
+        for book_id, when in rows.iterator(chunk_size=5000):
+            scores[book_id] = scores.get(book_id, 0) + weight * growth(when)
+    books = list(Book.objects.only('pk'))
+    for book in books:
+        book.popularity = scores.get(book.pk, 0)
+    Book.objects.bulk_update(books, ['popularity'], batch_size=1000)
+    return len(scores)
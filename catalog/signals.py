@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+
+# Sent after a BookInstance changes status, whether through save() or a
+# conditional UPDATE. Arguments: instance_id, book_id, inventory_number, old, new,
+# and counted=True from loans.services, which counts the change in its own stats.
+instance_status_changed = Signal()
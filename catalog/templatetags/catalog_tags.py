@@ -1,8 +1,12 @@
 import hashlib
 import re
+from functools import lru_cache
 
 from django import template
 
+from catalog import alphabet
+from catalog.models import Author
+
 register = template.Library()
 
 
@@ -31,24 +35,26 @@ def pattern_index(value):
     return (seed % 6) + 1
 
 
+@lru_cache(maxsize=4096)
+def _initials(first_name, last_name, fallback):
+    return alphabet.initials(first_name, last_name, fallback)
+
+
+@lru_cache(maxsize=4096)
+def _hue(text):
+    return alphabet.avatar_hue(text)
+
+
 @register.filter
 def author_initials(author):
-    if hasattr(author, 'first_name') and hasattr(author, 'last_name'):
-        first = (author.first_name or '').strip()[:1]
-        last = (author.last_name or '').strip()[:1]
-        initials = f'{first}{last}'.upper()
-        if initials:
-            return initials
-
-    parts = str(author).strip().split()
-    if not parts:
-        return 'AU'
-    if len(parts) == 1:
-        return parts[0][:2].upper()
-    return f'{parts[0][0]}{parts[1][0]}'.upper()
+    # Authors carry precomputed initials; other people (borrowers) are memoized
+    if getattr(author, 'initials', ''):
+        return author.initials
+    return _initials(getattr(author, 'first_name', ''), getattr(author, 'last_name', ''), str(author))
 
 
 @register.filter
 def avatar_hue(author):
-    seed = int(hashlib.md5(str(author).encode('utf-8')).hexdigest(), 16)
-    return seed % 360
+    if isinstance(author, Author) and 'avatar_hue' in author.__dict__:
+        return author.avatar_hue
+    return _hue(str(author))
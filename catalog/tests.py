@@ -1,3 +1,206 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import tempfile
+from datetime import timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from loans import services
+from loans.models import Reservation
+from . import covers, popularity
+from .coalesce import CoalescingCache
+from .models import Author, Book, BookInstance, CatalogVersion, Genre
+
+
+class BookApiTests(TestCase):
+    URL = '/catalog/api/books/?limit=100&fields=id,title,authors,genres,availability'
+
+    @classmethod
+    def setUpTestData(cls):
+        genre = Genre.objects.create(name='Роман')
+        for n in range(100):
+            book = Book.objects.create(title=f'Книга {n}', isbn=f'97860100{n:05d}')
+            book.authors.add(*(Author.objects.create(first_name='Имя', last_name=f'Автор {n}-{k}') for k in range(2)))
+            book.genres.add(genre)
+            for k in range(2):
+                BookInstance.objects.create(book=book, inventory_number=f'INV-API{n}-{k}', qr_code='qr.png')
+
+    def test_list_queries_do_not_grow_with_books(self):
+        # Catalog version, the page, authors, genres and availability
+        with self.assertNumQueries(5):
+            response = self.client.get(self.URL)
+        results = response.json()['results']
+        self.assertEqual(len(results), 100)
+        self.assertEqual(len(results[0]['authors']), 2)
+        self.assertEqual(results[0]['availability'], {'available': 2, 'total': 2})
+
+    def test_revalidation_skips_the_body_until_the_catalog_changes(self):
+        etag = self.client.get(self.URL)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        # A raw status update, as circulation does it, still moves the version
+        BookInstance.objects.filter(inventory_number='INV-API0-0').update(status='on_loan')
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['availability'], {'available': 1, 'total': 2})
+
+    def test_without_a_catalog_version_the_body_is_hashed(self):
+        # As migrated on a database without triggers
+        CatalogVersion.objects.all().delete()
+        response = self.client.get(self.URL)
+        self.assertEqual(response['ETag'], f'"{hashlib.md5(response.content).hexdigest()}"')
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        Book.objects.filter(title='Книга 0').update(title='Книга нуль')
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_popularity_does_not_invalidate(self):
+        etag = self.client.get(self.URL)['ETag']
+        popularity.record(Book.objects.first().pk, popularity.LOAN_WEIGHT)
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        self.old = Book.objects.create(title='Көшпенділер', isbn='9786010000201')
+        self.new = Book.objects.create(title='Абай жолы', isbn='9786010000202')
+        self.reader = User.objects.create_user('reader')
+
+    def issue(self, book, days_ago):
+        instance = BookInstance.objects.create(book=book, inventory_number=f'INV-P{book.pk}-{days_ago}', qr_code='qr.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            services.issue_loan(instance, self.reader, when=timezone.now() - timedelta(days=days_ago))
+
+    def test_recent_loans_outrank_decayed_ones(self):
+        half_life = settings.POPULARITY_HALF_LIFE_DAYS
+        self.issue(self.old, 2 * half_life)
+        self.issue(self.new, 0)
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        self.assertAlmostEqual(popularity.decayed(self.old), 0.25, places=3)
+        self.assertAlmostEqual(popularity.decayed(self.new), 1, places=3)
+        self.assertEqual(list(Book.objects.order_by('-popularity', 'title')), [self.new, self.old])
+
+    def test_reservation_scores_after_commit(self):
+        self.client.force_login(self.reader)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('loans:reserve_book', args=[self.old.pk]))
+        self.assertTrue(Reservation.objects.filter(user=self.reader, book=self.old).exists())
+        self.assertEqual(Book.objects.get(pk=self.old.pk).popularity, 0)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(Book.objects.get(pk=self.old.pk).popularity, 0)
+
+    def test_rebuild_matches_incremental_scores(self):
+        self.issue(self.old, 30)
+        Reservation.objects.create(user=self.reader, book=self.old)
+        popularity.record(self.old.pk, popularity.RESERVATION_WEIGHT)
+        expected = Book.objects.get(pk=self.old.pk).popularity
+        popularity.rebuild()
+        self.assertAlmostEqual(Book.objects.get(pk=self.old.pk).popularity / expected, 1, places=6)
+
+
+class CoverStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.root = Path(media.name)
+        settings_override = self.settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def covers_on_disk(self):
+        return sorted(str(p.relative_to(self.root)) for p in (self.root / 'covers').rglob('*') if p.is_file())
+
+    def test_same_bytes_are_stored_once_under_their_hash(self):
+        first = Book.objects.create(title='1984', isbn='9786010000701')
+        second = Book.objects.create(title='1984 (переиздание)', isbn='9786010000702')
+        first.cover.save('1984.jpg', ContentFile(b'cover-bytes'))
+        second.cover.save('1984.JPG', ContentFile(b'cover-bytes'))
+
+        digest = hashlib.sha256(b'cover-bytes').hexdigest()
+        self.assertEqual(first.cover.name, f'covers/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(second.cover.name, first.cover.name)
+        self.assertEqual(self.covers_on_disk(), [first.cover.name])
+
+    def test_dedupe_folds_legacy_copies_and_rewrites_books(self):
+        (self.root / 'covers').mkdir()
+        for name, data in [('1984.jpg', b'same'), ('1984_osrrhps.jpg', b'same'), ('abay.jpg', b'other')]:
+            (self.root / 'covers' / name).write_bytes(data)
+        old = Book.objects.create(title='1984', isbn='9786010000703', cover='covers/1984.jpg')
+        reimported = Book.objects.create(title='1984', isbn='9786010000704', cover='covers/1984_osrrhps.jpg')
+
+        result = covers.dedupe()
+
+        self.assertEqual((result.files, result.unique, result.bytes_freed, result.books_updated), (3, 2, 4, 2))
+        old.refresh_from_db()
+        reimported.refresh_from_db()
+        self.assertEqual(old.cover.name, reimported.cover.name)
+        self.assertEqual(old.cover.read(), b'same')
+        self.assertEqual(len(self.covers_on_disk()), 2)
+        self.assertEqual(covers.dedupe().files, 0)
+
+
+class CoalescingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = CoalescingCache('test')
+        self.fetches = 0
+
+    async def slow_fetch(self):
+        self.fetches += 1
+        await asyncio.sleep(0.01)
+        return self.fetches
+
+    def test_concurrent_misses_share_one_fetch(self):
+        async def run():
+            return await asyncio.gather(*(self.cache.get_or_fetch('k', self.slow_fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), [1] * 5)
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 1, 'coalesced': 4})
+
+    def test_followers_get_the_leaders_error(self):
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise LookupError('нет')
+
+        async def run():
+            return await asyncio.gather(
+                *(self.cache.get_or_fetch('k', failing) for _ in range(3)), return_exceptions=True
+            )
+
+        self.assertTrue(all(isinstance(result, LookupError) for result in asyncio.run(run())))
+        self.assertEqual(self.cache._inflight, {})
+
+    def test_cancelled_leader_does_not_strand_followers(self):
+        async def run():
+            leader = asyncio.create_task(self.cache.get_or_fetch('k', self.slow_fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(self.cache.get_or_fetch('k', self.slow_fetch))
+            await asyncio.sleep(0)
+            leader.cancel()
+            # The follower fetches for itself instead of waiting forever
+            return await asyncio.wait_for(follower, timeout=1)
+
+        self.assertEqual(asyncio.run(run()), 2)
+        self.assertEqual(self.cache._inflight, {})
+
+    def test_cancelled_follower_leaves_the_fetch_running(self):
+        async def run():
+            leader = asyncio.create_task(self.cache.get_or_fetch('k', self.slow_fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(self.cache.get_or_fetch('k', self.slow_fetch))
+            await asyncio.sleep(0)
+            follower.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await follower
+            return await leader
+
+        self.assertEqual(asyncio.run(run()), 1)
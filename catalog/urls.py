@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, api
 
 app_name = 'catalog'
 
@@ -8,4 +8,13 @@ urlpatterns = [
     path('book/<int:pk>/', views.book_detail, name='book_detail'),
     path('authors/', views.author_list, name='author_list'),
     path('author/<int:pk>/', views.author_detail, name='author_detail'),
+
+    # JSON API
+    path('api/books/', api.book_list, name='api_book_list'),
+    path('api/books/<int:pk>/', api.book_detail, name='api_book_detail'),
+    path('api/books/<int:pk>/availability/', api.book_availability, name='api_book_availability'),
+    path('api/authors/', api.author_list, name='api_author_list'),
+    path('api/genres/', api.genre_list, name='api_genre_list'),
+    path('api/kiosk/books/<int:pk>/', api.kiosk_book_availability, name='api_kiosk_book'),
+    path('api/kiosk/instances/<str:inventory_number>/', api.kiosk_instance_status, name='api_kiosk_instance'),
 ]
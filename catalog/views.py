@@ -2,6 +2,8 @@ from django.shortcuts import render, get_object_or_404
 from django.db.models import Q, Count
 from django.core.paginator import Paginator
 
+from loans.recommendations import related_books
+from . import alphabet
 from .models import Book, Author, Genre, BookInstance
 from .forms import BookSearchForm
 
@@ -33,6 +35,9 @@ def book_list(request):
         if available_only:
             books = books.filter(instances__status='available').distinct()
 
+        if form.cleaned_data.get('sort') == 'popular':
+            books = books.order_by('-popularity', 'title')
+
     paginator = Paginator(books, 12)
     page = request.GET.get('page')
     books_page = paginator.get_page(page)
@@ -54,27 +59,62 @@ def book_detail(request, pk):
 
     has_reservation = False
     queue_position = None
+    wait = None
+    available_count = available.count()
     if request.user.is_authenticated:
         from loans.models import Reservation
+        from loans.waits import estimate
         reservation = Reservation.objects.filter(
             user=request.user, book=book, is_active=True
         ).first()
         if reservation:
             has_reservation = True
             queue_position = reservation.queue_position
+            if not reservation.notified:
+                wait, = estimate([(book.pk, queue_position)])
+        elif available_count == 0:
+            # Where a reader joining the queue now would end up
+            position = Reservation.objects.filter(book=book, is_active=True).count() + 1
+            wait, = estimate([(book.pk, position)])
 
     return render(request, 'catalog/book_detail.html', {
         'book': book,
         'instances': instances,
-        'available_count': available.count(),
+        'available_count': available_count,
         'has_reservation': has_reservation,
         'queue_position': queue_position,
+        'wait': wait,
+        'related_books': related_books(book),
     })
 
 
+AUTHORS_PER_PAGE = 48
+
+
 def author_list(request):
-    authors = Author.objects.annotate(book_count=Count('books')).all()
-    return render(request, 'catalog/author_list.html', {'authors': authors})
+    letters = sorted(
+        Author.objects.values_list('letter').annotate(count=Count('pk')).order_by(),
+        key=lambda row: alphabet.letter_order(row[0]),
+    )
+    counts = dict(letters)
+    letter = request.GET.get('letter')
+    if letter not in counts:
+        letter = letters[0][0] if letters else None
+
+    authors = Author.objects.filter(letter=letter).annotate(
+        book_count=Count('books')
+    ).order_by('last_name', 'first_name')
+    paginator = Paginator(authors, AUTHORS_PER_PAGE)
+    # The bucket size is already known from the grouped query
+    paginator.count = counts.get(letter, 0)
+    authors_page = paginator.get_page(request.GET.get('page'))
+
+    return render(request, 'catalog/author_list.html', {
+        'authors': authors_page,
+        'letters': letters,
+        'letter': letter,
+        'total': sum(counts.values()),
+    })
 
 
 def author_detail(request, pk):
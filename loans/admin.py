@@ -1,22 +1,91 @@
 from django.contrib import admin
-from .models import Loan, Fine, Reservation
+
+from steppelibrary.admin import LargeTableAdminMixin
+from .models import (
+    Loan, ArchivedLoan, Fine, Reservation, CirculationDay, Notification, RecommendationRun, ScheduledJob,
+)
 
 
 @admin.register(Loan)
-class LoanAdmin(admin.ModelAdmin):
+class LoanAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['borrower', 'book_instance', 'issue_date', 'due_date', 'is_returned', 'is_overdue']
     list_filter = ['is_returned', 'issue_date', 'due_date']
     search_fields = ['borrower__username', 'borrower__last_name', 'book_instance__inventory_number']
     readonly_fields = ['issue_date']
+    list_select_related = ['borrower', 'book_instance__book']
+    autocomplete_fields = ['borrower', 'book_instance']
+    # Newest first by primary key: no sort over the whole table before LIMIT
+    ordering = ['-pk']
+
+
+@admin.register(ArchivedLoan)
+class ArchivedLoanAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['borrower', 'book_instance', 'issue_date', 'return_date', 'fine_amount', 'archived_at']
+    search_fields = ['borrower__username', 'book_instance__inventory_number']
+    list_select_related = ['borrower', 'book_instance__book']
+    raw_id_fields = ['borrower', 'book_instance']
+    ordering = ['-pk']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Fine)
-class FineAdmin(admin.ModelAdmin):
+class FineAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['loan', 'amount', 'is_paid', 'created_at']
     list_filter = ['is_paid', 'created_at']
+    list_select_related = ['loan__borrower', 'loan__book_instance__book']
+    autocomplete_fields = ['loan']
+    ordering = ['-pk']
 
 
 @admin.register(Reservation)
-class ReservationAdmin(admin.ModelAdmin):
+class ReservationAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['user', 'book', 'created_at', 'is_active', 'notified']
     list_filter = ['is_active', 'notified']
+    list_select_related = ['user', 'book']
+    autocomplete_fields = ['user', 'book']
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['kind', 'user', 'email', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['kind', 'status']
+    search_fields = ['email', 'user__username', 'idempotency_key']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+
+
+@admin.register(CirculationDay)
+class CirculationDayAdmin(admin.ModelAdmin):
+    list_display = ['date', 'loans_issued', 'loans_returned', 'fines_issued', 'fines_paid', 'overdue', 'on_loan']
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(RecommendationRun)
+class RecommendationRunAdmin(admin.ModelAdmin):
+    list_display = ['finished_at', 'metric', 'top_k', 'min_support', 'full', 'pairs_added', 'books_updated']
+    list_filter = ['full', 'metric']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'schedule', 'last_status', 'last_started_at', 'last_duration', 'next_run_at', 'lease_owner']
+    list_filter = ['last_status']
+    readonly_fields = ['name', 'schedule', 'lease_owner', 'lease_until', 'last_started_at', 'last_duration',
+                       'last_status', 'last_output', 'run_count', 'failure_count']
+
+    def has_add_permission(self, request):
+        return False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LoansConfig(AppConfig):
     name = 'loans'
+
+    def ready(self):
+        from . import events, preview, stats  # noqa: F401
@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F, Q, Value
+from django.utils import timezone
+
+from steppelibrary.db import immediate_atomic
+from .models import ArchivedLoan, Fine, Loan
+
+
+def archivable(older_than_days):
+    # Returned long enough ago, and either never fined or the fine is paid
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return Loan.objects.filter(is_returned=True, return_date__lt=cutoff).filter(
+        Q(fine__isnull=True) | Q(fine__is_paid=True)
+    )
+
+
+ARCHIVE_COLUMNS = [
+    ('id', 'l.id'),
+    ('borrower_id', 'l.borrower_id'),
+    ('book_instance_id', 'l.book_instance_id'),
+    ('issue_date', 'l.issue_date'),
+    ('due_date', 'l.due_date'),
+    ('return_date', 'l.return_date'),
+    ('fine_amount', 'f.amount'),
+    ('fine_created_at', 'f.created_at'),
+    ('fine_paid_date', 'f.paid_date'),
+]
+
+
+def archive_batch(older_than_days, batch_size=1000):
+    """Move one chunk of archivable loans in its own transaction; returns how many moved."""
+    # Plain SQL keeps the move in the database: instantiating and collecting
+    # model objects costs far more than the three statements themselves
+    qn = connection.ops.quote_name
+    loans, fines = qn(Loan._meta.db_table), qn(Fine._meta.db_table)
+    with immediate_atomic():
+        ids = list(archivable(older_than_days).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(ids))
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            # ON CONFLICT makes a rerun after an interrupted batch harmless
+            cursor.execute(
+                f'INSERT INTO {qn(ArchivedLoan._meta.db_table)} '
+                f'({", ".join(qn(c) for c, _ in ARCHIVE_COLUMNS)}, {qn("archived_at")}) '
+                f'SELECT {", ".join(expr for _, expr in ARCHIVE_COLUMNS)}, %s '
+                f'FROM {loans} l LEFT JOIN {fines} f ON f.loan_id = l.id '
+                f'WHERE l.id IN ({placeholders}) ON CONFLICT ({qn("id")}) DO NOTHING',
+                [now, *ids],
+            )
+            # Only paid fines get here, so no reader balance changes
+            cursor.execute(f'DELETE FROM {fines} WHERE loan_id IN ({placeholders})', ids)
+            cursor.execute(f'DELETE FROM {loans} WHERE id IN ({placeholders})', ids)
+    return len(ids)
+
+
+HISTORY_FIELDS = {
+    'book_id': F('book_instance__book_id'),
+    'title': F('book_instance__book__title'),
+    'inventory_number': F('book_instance__inventory_number'),
+}
+
+
+def history(user, include_archive=False):
+    """Returned loans of a reader, newest first, as dicts; the archive is read only when asked."""
+    live = Loan.objects.filter(borrower=user, is_returned=True).values(
+        'id', 'issue_date', 'due_date', 'return_date',
+        penalty=F('fine__amount'), archived=Value(False), **HISTORY_FIELDS,
+    )
+    if not include_archive:
+        return live.order_by('-return_date')
+    archived = ArchivedLoan.objects.filter(borrower=user).values(
+        'id', 'issue_date', 'due_date', 'return_date',
+        penalty=F('fine_amount'), archived=Value(True), **HISTORY_FIELDS,
+    )
+    return live.order_by().union(archived.order_by(), all=True).order_by('-return_date')
@@ -0,0 +1,153 @@
+import csv
+
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from catalog.models import BookInstance
+from catalog.signals import instance_status_changed
+from steppelibrary.db import immediate_atomic
+from .models import AuditScan
+
+
+# Copies in these statuses should be on a shelf; everything else should not
+SHELF_STATUSES = ('available', 'reserved')
+BATCH = 5000
+LIST_LIMIT = 100
+
+
+def normalize(code):
+    code = code.strip().removeprefix('STEPPE-LIB:').strip()
+    if not code or len(code) > AuditScan._meta.get_field('inventory_number').max_length:
+        return None
+    return code
+
+
+def record_scans(session, codes):
+    """Store scanned codes in batches; repeats of a code in the session are ignored."""
+    batch = []
+    for code in codes:
+        code = normalize(code)
+        if code:
+            batch.append(code)
+        if len(batch) >= BATCH:
+            _save_scans(session, batch)
+            batch = []
+    _save_scans(session, batch)
+    return session.scans.count()
+
+
+def _save_scans(session, codes):
+    # Raw executemany: a stocktaking pass streams in the whole collection,
+    # and building a model object per code costs far more than the insert
+    if not codes:
+        return
+    qn = connection.ops.quote_name
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    sql = (
+        f'INSERT INTO {qn(AuditScan._meta.db_table)} '
+        f'({qn("session_id")}, {qn("inventory_number")}, {qn("scanned_at")}) VALUES (%s, %s, %s) '
+        f'ON CONFLICT ({qn("session_id")}, {qn("inventory_number")}) DO NOTHING'
+    )
+    with immediate_atomic(), connection.cursor() as cursor:
+        cursor.executemany(sql, [(session.pk, code, now) for code in codes])
+
+
+def scope(session):
+    copies = BookInstance.objects.all()
+    if session.book_id:
+        copies = copies.filter(book_id=session.book_id)
+    elif session.genre_id:
+        copies = copies.filter(book__genres=session.genre_id)
+    return copies
+
+
+def _scanned(session):
+    return Exists(AuditScan.objects.filter(session=session, inventory_number=OuterRef('inventory_number')))
+
+
+def expected(session):
+    return scope(session).filter(status__in=SHELF_STATUSES)
+
+
+def missing(session):
+    return expected(session).filter(~_scanned(session))
+
+
+def misstatus(session):
+    # On the shelf although the catalogue says it is out on loan or lost
+    return scope(session).exclude(status__in=SHELF_STATUSES).filter(_scanned(session))
+
+
+def unexpected(session):
+    # Unknown codes and copies from outside the audited scope
+    in_scope = scope(session).filter(inventory_number=OuterRef('inventory_number'))
+    return session.scans.filter(~Exists(in_scope))
+
+
+def reconcile(session):
+    # Every set is an anti- or semi-join on indexed inventory numbers, so the
+    # work stays in the database and memory does not grow with the collection
+    session.expected = expected(session).count()
+    session.seen = session.scans.count()
+    session.missing = missing(session).count()
+    session.unexpected = unexpected(session).count()
+    session.misstatus = misstatus(session).count()
+    session.reconciled_at = timezone.now()
+    session.save(update_fields=['expected', 'seen', 'missing', 'unexpected', 'misstatus', 'reconciled_at'])
+    return session
+
+
+def report(session):
+    known = BookInstance.objects.filter(inventory_number=OuterRef('inventory_number'))
+    return {
+        'missing': missing(session).select_related('book').order_by('inventory_number')[:LIST_LIMIT],
+        'misstatus': misstatus(session).select_related('book').order_by('inventory_number')[:LIST_LIMIT],
+        'unexpected': unexpected(session).annotate(known=Exists(known)).order_by('inventory_number')[:LIST_LIMIT],
+    }
+
+
+def mark_missing_lost(session):
+    """Mark every copy still unscanned and still expected on a shelf as lost, then close the session."""
+    marked = 0
+    with immediate_atomic():
+        # Re-read inside the write lock: a copy issued since the last reconcile
+        # is no longer expected and must not be written off. Marked copies
+        # leave the missing set, so each pass takes the next batch.
+        while True:
+            copies = list(missing(session).only('pk', 'book_id', 'inventory_number', 'status')[:BATCH])
+            if not copies:
+                break
+            old = {copy.pk: copy.status for copy in copies}
+            for copy in copies:
+                copy.status = 'lost'
+            BookInstance.objects.bulk_update(copies, ['status'])
+            for copy in copies:
+                instance_status_changed.send(
+                    sender=BookInstance, instance_id=copy.pk, book_id=copy.book_id,
+                    inventory_number=copy.inventory_number, old=old[copy.pk], new='lost',
+                )
+            marked += len(copies)
+        session.marked_lost = marked
+        session.status = 'closed'
+        session.closed_at = timezone.now()
+        session.save(update_fields=['marked_lost', 'status', 'closed_at'])
+    return marked
+
+
+EXPORTS = {
+    'missing': ('Не найдены', lambda session: missing(session).values_list('inventory_number', 'book__title', 'status')),
+    'misstatus': ('Неверный статус', lambda session: misstatus(session).values_list('inventory_number', 'book__title', 'status')),
+    'unexpected': ('Лишние', lambda session: unexpected(session).values_list('inventory_number')),
+}
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_rows(session, kind):
+    writer = csv.writer(_Echo())
+    rows = EXPORTS[kind][1](session).order_by('inventory_number').iterator(chunk_size=BATCH)
+    return (writer.writerow(row) for row in rows)
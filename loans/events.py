@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import json
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from catalog.signals import instance_status_changed
+from .models import Loan, Reservation
+
+
+STAFF_CHANNEL = 'staff'
+
+
+def book_channel(book_id):
+    return f'book:{book_id}'
+
+
+class Subscription:
+    def __init__(self, hub, channel, loop, max_pending):
+        self.hub = hub
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def _deliver(self, event):
+        # Runs on the subscriber's loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client that cannot keep up gets one reset instead of a growing backlog
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """In-process fan-out: one producer publishes, every open stream on the channel receives."""
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event_type, data):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        if not subscribers:
+            return
+        event = (next(self._ids), event_type, json.dumps(data, ensure_ascii=False, default=str))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # The loop is gone: the stream ended without unsubscribing
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._channels.values())
+
+
+hub = EventHub()
+
+
+def format_event(event):
+    event_id, event_type, data = event
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+
+
+def _publish_on_commit(channel, event_type, data):
+    transaction.on_commit(lambda: hub.publish(channel, event_type, data))
+
+
+@receiver(instance_status_changed)
+def publish_status_change(sender, instance_id, book_id, inventory_number, old, new, **kwargs):
+    data = {'book': book_id, 'inventory_number': inventory_number, 'old': old, 'new': new}
+    _publish_on_commit(book_channel(book_id), 'status', data)
+    _publish_on_commit(STAFF_CHANNEL, 'status', data)
+
+
+@receiver(post_save, sender=Loan)
+def publish_new_loan(sender, instance, created, **kwargs):
+    if not created:
+        return
+    _publish_on_commit(STAFF_CHANNEL, 'loan', {
+        'loan': instance.pk,
+        'book': instance.book_instance.book_id,
+        'inventory_number': instance.book_instance.inventory_number,
+        'borrower': instance.borrower.username,
+        'due_date': instance.due_date.isoformat(),
+    })
+
+
+@receiver(post_save, sender=Reservation)
+def publish_new_reservation(sender, instance, created, **kwargs):
+    if not created:
+        return
+    _publish_on_commit(book_channel(instance.book_id), 'queue', {'book': instance.book_id})
+    _publish_on_commit(STAFF_CHANNEL, 'reservation', {
+        'reservation': instance.pk,
+        'book': instance.book_id,
+        'user': instance.user.username,
+    })
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
-from catalog.models import BookInstance
+from catalog.models import Book, BookInstance, Genre
+from .models import AuditSession, Loan
 
 
 class IssueLoanForm(forms.Form):
@@ -27,21 +28,23 @@ class IssueLoanForm(forms.Form):
         if inv.startswith('STEPPE-LIB:'):
             inv = inv.replace('STEPPE-LIB:', '')
         try:
-            instance = BookInstance.objects.get(inventory_number=inv)
+            instance = BookInstance.objects.select_related('book').get(inventory_number=inv)
         except BookInstance.DoesNotExist:
             raise forms.ValidationError('Экземпляр с таким номером не найден.')
         if instance.status != 'available':
             raise forms.ValidationError(f'Экземпляр недоступен (статус: {instance.get_status_display()}).')
+        self.book_instance = instance
         return inv
 
     def clean_borrower_username(self):
         username = self.cleaned_data['borrower_username']
         try:
-            user = User.objects.get(username=username)
+            user = User.objects.select_related('profile').get(username=username)
         except User.DoesNotExist:
             raise forms.ValidationError('Пользователь не найден.')
         if hasattr(user, 'profile') and user.profile.has_unpaid_fines:
             raise forms.ValidationError('У читателя есть неоплаченные штрафы. Выдача заблокирована.')
+        self.borrower = user
         return username
 
 
@@ -60,15 +63,49 @@ class ReturnLoanForm(forms.Form):
         inv = self.cleaned_data['inventory_number']
         if inv.startswith('STEPPE-LIB:'):
             inv = inv.replace('STEPPE-LIB:', '')
-        try:
-            BookInstance.objects.get(inventory_number=inv)
-        except BookInstance.DoesNotExist:
-            raise forms.ValidationError('Экземпляр с таким номером не найден.')
-        from .models import Loan
         active_loan = Loan.objects.filter(
             book_instance__inventory_number=inv,
             is_returned=False
-        ).first()
+        ).select_related('book_instance__book', 'borrower', 'fine').first()
         if not active_loan:
+            if not BookInstance.objects.filter(inventory_number=inv).exists():
+                raise forms.ValidationError('Экземпляр с таким номером не найден.')
             raise forms.ValidationError('Нет активной выдачи для этого экземпляра.')
+        self.loan = active_loan
         return inv
+
+
+class AuditSessionForm(forms.Form):
+    isbn = forms.CharField(
+        max_length=13,
+        required=False,
+        label='ISBN книги',
+        help_text='Оставьте пустым, чтобы проверить жанр или весь фонд',
+    )
+    genre = forms.ModelChoiceField(
+        queryset=Genre.objects.all(),
+        required=False,
+        label='Жанр',
+        empty_label='Все жанры',
+    )
+
+    def clean_isbn(self):
+        isbn = self.cleaned_data['isbn'].strip()
+        self.book = None
+        if isbn:
+            self.book = Book.objects.filter(isbn=isbn).first()
+            if self.book is None:
+                raise forms.ValidationError('Книга с таким ISBN не найдена.')
+        return isbn
+
+    def save(self, user):
+        return AuditSession.objects.create(
+            started_by=user, book=self.book, genre=None if self.book else self.cleaned_data['genre'],
+        )
+
+
+class AuditUploadForm(forms.Form):
+    file = forms.FileField(
+        label='Файл сканера',
+        help_text='Текстовый файл, по одному коду в строке',
+    )
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from loans import archive
+from steppelibrary.db import refresh_table_stats
+
+
+class Command(BaseCommand):
+    help = 'Перенести давно закрытые выдачи без долгов в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=365, help='Дней с момента возврата')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Выдач в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать')
+
+    def handle(self, *args, **options):
+        older_than = options['older_than']
+        if options['dry_run']:
+            count = archive.archivable(older_than).count()
+            self.stdout.write(f'К переносу: {count}')
+            return
+
+        started = time.perf_counter()
+        moved = 0
+        while True:
+            count = archive.archive_batch(older_than, options['batch_size'])
+            if not count:
+                break
+            moved += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  перенесено {moved}')
+        if moved:
+            # The admin estimates big tables' totals from these statistics
+            refresh_table_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. В архив перенесено: {moved} за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,148 @@
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from catalog.models import Book, BookInstance
+from loans import archive
+from loans.models import Loan, Fine
+
+
+READERS = 5000
+INSTANCES = 5000
+ACTIVE_LOANS = 2000
+
+
+def _seed(history, stdout):
+    now = timezone.now()
+    users = User.objects.bulk_create(User(username=f'reader{i}') for i in range(READERS))
+    UserProfile.objects.bulk_create(UserProfile(user=user) for user in users)
+    books = Book.objects.bulk_create(
+        Book(title=f'Книга {i}', isbn=f'{9780000000000 + i}') for i in range(INSTANCES // 2)
+    )
+    instances = BookInstance.objects.bulk_create(
+        BookInstance(book=books[i % len(books)], inventory_number=f'B-{i}', qr_code='bench.png')
+        for i in range(INSTANCES)
+    )
+    user_ids = [user.pk for user in users]
+    instance_ids = [instance.pk for instance in instances]
+
+    # Closed history spread over five years, ending more than a year ago
+    batch = []
+    for n in range(history):
+        issued = now - timedelta(days=random.uniform(400, 5 * 365))
+        batch.append(Loan(
+            borrower_id=random.choice(user_ids), book_instance_id=random.choice(instance_ids),
+            issue_date=issued, due_date=issued + timedelta(days=14),
+            return_date=issued + timedelta(days=random.randint(1, 20)), is_returned=True,
+        ))
+        if len(batch) == 20000:
+            Loan.objects.bulk_create(batch)
+            batch = []
+            stdout.write(f'  создано выдач: {n + 1}')
+    Loan.objects.bulk_create(batch)
+    # Paid fines on roughly one closed loan in twenty
+    fined = Loan.objects.filter(due_date__lt=timezone.now() - timedelta(days=400)).values_list('pk', flat=True)
+    Fine.objects.bulk_create(
+        (Fine(loan_id=pk, amount=400, is_paid=True, paid_date=now) for pk in fined if pk % 20 == 0),
+        batch_size=5000,
+    )
+
+    for n in range(ACTIVE_LOANS):
+        issued = now - timedelta(days=random.uniform(0, 30))
+        Loan.objects.create(
+            borrower_id=random.choice(user_ids), book_instance_id=instance_ids[n],
+            issue_date=issued, due_date=issued + timedelta(days=14),
+        )
+    return user_ids
+
+
+def _hot_queries(reader_id):
+    now = timezone.now()
+    return {
+        'кабинет: книги на руках': lambda: list(
+            Loan.objects.filter(borrower_id=reader_id, is_returned=False).select_related('book_instance__book')
+        ),
+        'кабинет: последние возвраты': lambda: list(
+            Loan.objects.filter(borrower_id=reader_id, is_returned=True)
+            .select_related('book_instance__book').order_by('-return_date')[:10]
+        ),
+        'панель: последние выдачи': lambda: list(
+            Loan.objects.select_related('borrower', 'book_instance__book').order_by('-issue_date')[:20]
+        ),
+        'панель: просроченные': lambda: list(
+            Loan.objects.filter(is_returned=False, due_date__lt=now)
+            .select_related('borrower', 'book_instance__book').order_by('due_date')[:20]
+        ),
+        'штрафы: новые просрочки': lambda: list(
+            Loan.objects.filter(is_returned=False, due_date__lt=now).exclude(fine__isnull=False)
+        ),
+        'штрафы: открытые штрафы': lambda: list(
+            Fine.objects.filter(is_paid=False, loan__is_returned=False).select_related('loan')
+        ),
+        'снимок: на руках': lambda: Loan.objects.filter(is_returned=False).count(),
+    }
+
+
+def _time(queries, repeat):
+    results = {}
+    for name, query in queries.items():
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            samples.append(time.perf_counter() - started)
+        results[name] = statistics.median(samples)
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Сравнить горячие запросы по выдачам до и после переноса истории в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history', type=int, default=1_000_000, help='Закрытых выдач в истории')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого запроса')
+
+    def handle(self, *args, **options):
+        db = connections['default']
+        original_name = db.settings_dict['NAME']
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                connections.close_all()
+                db.settings_dict['NAME'] = str(Path(tmp) / 'bench.sqlite3')
+                call_command('migrate', verbosity=0)
+                self._run(options)
+        finally:
+            connections.close_all()
+            db.settings_dict['NAME'] = original_name
+
+    def _run(self, options):
+        user_ids = _seed(options['history'], self.stdout)
+        queries = _hot_queries(random.choice(user_ids))
+        before = _time(queries, options['repeat'])
+
+        started = time.perf_counter()
+        moved = 0
+        while True:
+            count = archive.archive_batch(365, 5000)
+            if not count:
+                break
+            moved += count
+        archived_in = time.perf_counter() - started
+        after = _time(queries, options['repeat'])
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{options["history"]} закрытых выдач, {ACTIVE_LOANS} активных; '
+            f'в архив перенесено {moved} за {archived_in:.0f} с'
+        ))
+        for name in queries:
+            self.stdout.write(f'  {name:<28} {before[name] * 1000:9.1f} мс → {after[name] * 1000:7.1f} мс')
@@ -0,0 +1,178 @@
+import logging
+import multiprocessing
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.test import Client
+from django.urls import reverse
+
+from accounts.models import UserProfile
+from catalog.models import Book, BookInstance
+
+
+BOOKS = 200
+COPIES_PER_BOOK = 3
+BORROWERS = 100
+
+# Plain Django defaults: rollback journal, deferred transactions
+PLAIN_PRAGMAS = {'journal_mode': 'DELETE'}
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _seed():
+    call_command('migrate', verbosity=0)
+    books = Book.objects.bulk_create(
+        Book(title=f'Книга {i}', isbn=f'{9780000000000 + i}') for i in range(BOOKS)
+    )
+    BookInstance.objects.bulk_create(
+        BookInstance(book=book, inventory_number=f'B-{book.pk}-{c}', qr_code='bench.png')
+        for book in books for c in range(COPIES_PER_BOOK)
+    )
+    users = User.objects.bulk_create(
+        [User(username='bench-librarian')] + [User(username=f'reader{i}') for i in range(BORROWERS)]
+    )
+    UserProfile.objects.bulk_create(
+        UserProfile(user=user, role='librarian' if i == 0 else 'student') for i, user in enumerate(users)
+    )
+
+
+def _worker_setup():
+    connections.close_all()
+    # Lock errors are counted below; keep the traceback of each one off the console
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+
+def _desk(desk, desks, deadline, results):
+    _worker_setup()
+    client = Client()
+    client.force_login(User.objects.get(username='bench-librarian'))
+    inventory = list(BookInstance.objects.order_by('inventory_number').values_list('inventory_number', flat=True))
+    mine = inventory[desk::desks]
+    issue_url, return_url = reverse('loans:issue_book'), reverse('loans:return_book')
+    latencies, locked, failed = [], 0, 0
+    while time.perf_counter() < deadline:
+        inv = random.choice(mine)
+        for url, data in (
+            (issue_url, {'inventory_number': inv, 'borrower_username': f'reader{random.randrange(BORROWERS)}'}),
+            (return_url, {'inventory_number': inv}),
+        ):
+            started = time.perf_counter()
+            try:
+                response = client.post(url, data)
+            except OperationalError as exc:
+                if 'locked' not in str(exc):
+                    raise
+                locked += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 302:
+                failed += 1
+    results.put(('desk', latencies, locked, failed))
+
+
+def _reader(deadline, results):
+    _worker_setup()
+    client = Client()
+    book_ids = list(Book.objects.values_list('pk', flat=True))
+    latencies, locked = [], 0
+    while time.perf_counter() < deadline:
+        if random.random() < 0.5:
+            url = reverse('catalog:book_list') + f'?page={random.randint(1, BOOKS // 12)}'
+        else:
+            url = reverse('catalog:book_detail', args=[random.choice(book_ids)])
+        started = time.perf_counter()
+        try:
+            client.get(url)
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            locked += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put(('reader', latencies, locked, 0))
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест SQLite: N пунктов выдачи и M читателей в отдельных процессах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desks', type=int, default=4, help='Пунктов выдачи (процессов)')
+        parser.add_argument('--readers', type=int, default=8, help='Читателей (процессов)')
+        parser.add_argument('--seconds', type=float, default=10, help='Длительность каждого прогона')
+        parser.add_argument('--mode', choices=['plain', 'tuned', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        modes = ['plain', 'tuned'] if options['mode'] == 'both' else [options['mode']]
+        connection = connections['default']
+        original_name = connection.settings_dict['NAME']
+        original_pragmas = settings.SQLITE_PRAGMAS
+        original_immediate = settings.SQLITE_IMMEDIATE_TRANSACTIONS
+        try:
+            for mode in modes:
+                settings.SQLITE_PRAGMAS = original_pragmas if mode == 'tuned' else PLAIN_PRAGMAS
+                settings.SQLITE_IMMEDIATE_TRANSACTIONS = mode == 'tuned'
+                with tempfile.TemporaryDirectory() as tmp:
+                    connections.close_all()
+                    connection.settings_dict['NAME'] = str(Path(tmp) / 'bench.sqlite3')
+                    _seed()
+                    connections.close_all()
+                    self._run(mode, options)
+        finally:
+            connections.close_all()
+            connection.settings_dict['NAME'] = original_name
+            settings.SQLITE_PRAGMAS = original_pragmas
+            settings.SQLITE_IMMEDIATE_TRANSACTIONS = original_immediate
+
+    def _run(self, mode, options):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        deadline = time.perf_counter() + options['seconds']
+        processes = [
+            context.Process(target=_desk, args=(d, options['desks'], deadline, results))
+            for d in range(options['desks'])
+        ] + [
+            context.Process(target=_reader, args=(deadline, results))
+            for _ in range(options['readers'])
+        ]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        writes = [lat for kind, lats, _, _ in collected if kind == 'desk' for lat in lats]
+        reads = [lat for kind, lats, _, _ in collected if kind == 'reader' for lat in lats]
+        write_locked = sum(locked for kind, _, locked, _ in collected if kind == 'desk')
+        read_locked = sum(locked for kind, _, locked, _ in collected if kind == 'reader')
+        failed = sum(f for _, _, _, f in collected)
+        seconds = options['seconds']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{mode}: {options["desks"]} пунктов, {options["readers"]} читателей, {seconds:.0f} с'
+        ))
+        self.stdout.write(
+            f'  записи: {len(writes) / seconds:.1f} оп/с, '
+            f'p50 {statistics.median(writes or [0]) * 1000:.1f} мс, '
+            f'p99 {_percentile(writes, 0.99) * 1000:.1f} мс, '
+            f'"database is locked": {write_locked}, отклонено формой: {failed}'
+        )
+        self.stdout.write(
+            f'  чтения: {len(reads) / seconds:.1f} оп/с, '
+            f'p50 {statistics.median(reads or [0]) * 1000:.1f} мс, '
+            f'p99 {_percentile(reads, 0.99) * 1000:.1f} мс, '
+            f'"database is locked": {read_locked}'
+        )
@@ -3,6 +3,7 @@ from django.conf import settings
 from django.utils import timezone
 
 from loans.models import Loan, Fine
+from loans import stats
 
 
 class Command(BaseCommand):
@@ -19,7 +20,8 @@ class Command(BaseCommand):
             days = (timezone.now() - loan.due_date).days
             if days > 0:
                 amount = days * settings.FINE_PER_DAY_KZT
-                Fine.objects.create(loan=loan, amount=amount)
+                fine = Fine.objects.create(loan=loan, amount=amount)
+                stats.record_fine_issued(fine)
                 created_count += 1
                 self.stdout.write(
                     f'  Штраф {amount} KZT для {loan.borrower.username} '
@@ -27,7 +29,7 @@ class Command(BaseCommand):
                 )
 
         # Update existing fines
-        existing_fines = Fine.objects.filter(is_paid=False, loan__is_returned=False)
+        existing_fines = Fine.objects.filter(is_paid=False, loan__is_returned=False).select_related('loan')
         updated_count = 0
         for fine in existing_fines:
             loan = fine.loan
@@ -35,8 +37,10 @@ class Command(BaseCommand):
                 days = (timezone.now() - loan.due_date).days
                 new_amount = days * settings.FINE_PER_DAY_KZT
                 if new_amount != fine.amount:
+                    increase = new_amount - fine.amount
                     fine.amount = new_amount
-                    fine.save()
+                    fine.save(update_fields=['amount'])
+                    stats.record_fine_raised(fine, increase)
                     updated_count += 1
 
         self.stdout.write(self.style.SUCCESS(
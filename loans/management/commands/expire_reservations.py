@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from loans import services
+
+
+class Command(BaseCommand):
+    help = 'Снять брони, которые не забрали вовремя, и передать книгу следующему в очереди'
+
+    def handle(self, *args, **options):
+        expired = services.expire_reservations()
+        self.stdout.write(self.style.SUCCESS(f'Готово. Снято броней: {expired}'))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from loans.notifications import queue_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Поставить в очередь напоминания о скором сроке возврата'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.DUE_REMINDER_DAYS,
+            help=f'За сколько дней до срока напоминать (по умолчанию {settings.DUE_REMINDER_DAYS})',
+        )
+
+    def handle(self, *args, **options):
+        queued = queue_due_reminders(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Готово. Подготовлено напоминаний: {queued}'))
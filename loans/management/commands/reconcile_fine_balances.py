@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from accounts.models import UserProfile
+from loans.models import Fine
+from steppelibrary.db import immediate_atomic
+
+
+class Command(BaseCommand):
+    help = 'Сверить неоплаченные штрафы в профилях с таблицей штрафов и исправить расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        # Holding the write lock keeps fines from changing between the sum and the fix
+        with immediate_atomic():
+            drifted = self._drifted()
+            if drifted and not options['dry_run']:
+                UserProfile.objects.bulk_update(
+                    drifted, ['unpaid_fines_total', 'unpaid_fines_count'], batch_size=500
+                )
+
+        verb = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f'Готово. {verb} расхождений: {len(drifted)}'))
+
+    def _drifted(self):
+        actual = {
+            row['loan__borrower']: (row['total'], row['count'])
+            for row in Fine.objects.filter(is_paid=False).values('loan__borrower').annotate(
+                total=Sum('amount'), count=Count('pk')
+            )
+        }
+        drifted = []
+        profiles = UserProfile.objects.only('user_id', 'unpaid_fines_total', 'unpaid_fines_count')
+        for profile in profiles.iterator(chunk_size=2000):
+            total, count = actual.get(profile.user_id, (0, 0))
+            if (profile.unpaid_fines_total, profile.unpaid_fines_count) != (total, count):
+                self.stdout.write(
+                    f'  user_id={profile.user_id}: {profile.unpaid_fines_total} KZT / '
+                    f'{profile.unpaid_fines_count} → {total} KZT / {count}'
+                )
+                profile.unpaid_fines_total, profile.unpaid_fines_count = total, count
+                drifted.append(profile)
+        return drifted
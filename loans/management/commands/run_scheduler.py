@@ -0,0 +1,52 @@
+import os
+import signal
+import socket
+import threading
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from loans import scheduler
+from loans.models import ScheduledJob
+
+
+class Command(BaseCommand):
+    help = 'Запускать периодические задачи (штрафы, брони, напоминания, статистику) из одного процесса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Выполнить задачи, подошедшие по сроку, и выйти')
+        parser.add_argument('--list', action='store_true', help='Показать задачи и их следующий запуск')
+        parser.add_argument('--poll', type=float, default=30, help='Не реже чем раз в столько секунд проверять расписание')
+
+    def handle(self, *args, **options):
+        configured = scheduler.jobs()
+        scheduler.sync(configured)
+        if options['list']:
+            for job in ScheduledJob.objects.filter(name__in=[job.name for job in configured]):
+                self.stdout.write(
+                    f'{job.name:28} {job.schedule:16} следующий запуск {timezone.localtime(job.next_run_at):%d.%m.%Y %H:%M:%S}, '
+                    f'последний: {job.get_last_status_display()}'
+                )
+            return
+
+        owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        stop = threading.Event()
+        if not options['once']:
+            # The job in progress finishes; the loop stops before the next one
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: stop.set())
+            self.stdout.write(f'Планировщик {owner}: задач {len(configured)}')
+
+        while not stop.is_set():
+            for job in configured:
+                if stop.is_set():
+                    break
+                result = scheduler.run_if_due(job, owner)
+                if result is not None:
+                    status, duration = result
+                    style = self.style.SUCCESS if status == 'ok' else self.style.ERROR
+                    self.stdout.write(style(f'{timezone.localtime():%H:%M:%S} {job.name}: {status}, {duration:.2f} с'))
+            if options['once']:
+                break
+            stop.wait(scheduler.seconds_until_next(configured, options['poll']))
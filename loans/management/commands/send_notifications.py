@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from loans.notifications import dispatch
+
+
+class Command(BaseCommand):
+    help = 'Отправить накопившиеся уведомления пачками через одно соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Писем в пачке (по умолчанию 100)')
+        parser.add_argument('--max-batches', type=int, help='Остановиться после N пачек')
+
+    def handle(self, *args, **options):
+        metrics = dispatch(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        total = metrics['sent'] + metrics['retried'] + metrics['failed']
+        rate = total / metrics['seconds'] if metrics['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Отправлено: {metrics["sent"]}, отложено: {metrics["retried"]}, '
+            f'ошибок: {metrics["failed"]}, пачек: {metrics["batches"]}, '
+            f'{rate:.1f} писем/с за {metrics["seconds"]:.2f} с'
+        ))
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from loans import stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать дневную статистику выдач и штрафов и обновить снимок фонда'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help='Сколько последних дней пересчитать (по умолчанию 2)')
+        parser.add_argument('--include-archive', action='store_true',
+                            help='Учитывать архивные выдачи (нужно, если период старше архивации)')
+
+    def handle(self, *args, **options):
+        end = timezone.localdate()
+        start = end - timedelta(days=max(options['days'], 1) - 1)
+        days, genre_rows = stats.rebuild(start, end, include_archive=options['include_archive'])
+        snapshot = stats.take_snapshot(end)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Дней: {days}, строк по жанрам: {genre_rows}. '
+            f'На руках: {snapshot.on_loan}, просрочено: {snapshot.overdue}'
+        ))
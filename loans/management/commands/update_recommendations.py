@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from loans import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать блок «Читатели также брали» по новым выдачам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать по всей истории, а не только по новым выдачам')
+        parser.add_argument('--top-k', type=int, default=10, help='Соседей на книгу')
+        parser.add_argument('--metric', choices=recommendations.METRICS, default='cosine', help='Мера сходства')
+        parser.add_argument('--min-support', type=int, default=2, help='Минимум общих читателей у пары книг')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        run = recommendations.update(
+            metric=options['metric'], top_k=options['top_k'],
+            min_support=options['min_support'], full=options['full'],
+        )
+        kind = 'Полный пересчёт' if run.full else 'Дообновление'
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind}: новых пар читатель–книга {run.pairs_added}, обновлено книг {run.books_updated} '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
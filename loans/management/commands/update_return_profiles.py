@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from loans import waits
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать распределения сроков возврата для оценки ожидания в очереди'
+
+    def handle(self, *args, **options):
+        total, own = waits.rebuild_profiles()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Книг: {total}, из них со своей историей: {own}, '
+            f'остальные по всей библиотеке'
+        ))
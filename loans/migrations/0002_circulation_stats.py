@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+        ('loans', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Дата')),
+                ('loans_issued', models.PositiveIntegerField(default=0, verbose_name='Выдано')),
+                ('loans_returned', models.PositiveIntegerField(default=0, verbose_name='Возвращено')),
+                ('fines_issued', models.PositiveIntegerField(default=0, verbose_name='Начислено штрафов')),
+                ('fines_issued_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма начислений (KZT)')),
+                ('fines_paid', models.PositiveIntegerField(default=0, verbose_name='Оплачено штрафов')),
+                ('fines_paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма оплат (KZT)')),
+                ('overdue', models.PositiveIntegerField(default=0, verbose_name='Просрочено')),
+                ('on_loan', models.PositiveIntegerField(default=0, verbose_name='На руках')),
+                ('books_total', models.PositiveIntegerField(default=0, verbose_name='Наименований')),
+                ('instances_total', models.PositiveIntegerField(default=0, verbose_name='Экземпляров')),
+                ('fines_unpaid', models.PositiveIntegerField(default=0, verbose_name='Неоплаченных штрафов')),
+                ('snapshot_at', models.DateTimeField(blank=True, null=True, verbose_name='Снимок на')),
+            ],
+            options={
+                'verbose_name': 'Статистика за день',
+                'verbose_name_plural': 'Статистика по дням',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GenreCirculationDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('loans_issued', models.PositiveIntegerField(default=0, verbose_name='Выдано')),
+            ],
+            options={
+                'verbose_name': 'Статистика жанра за день',
+                'verbose_name_plural': 'Статистика жанров по дням',
+                'ordering': ['-date', 'genre'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['is_returned', 'due_date'], name='loan_open_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='genrecirculationday',
+            name='genre',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='circulation_days', to='catalog.genre', verbose_name='Жанр'),
+        ),
+        migrations.AddConstraint(
+            model_name='genrecirculationday',
+            constraint=models.UniqueConstraint(fields=('date', 'genre'), name='unique_genre_circulation_day'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_author_directory'),
+        ('loans', '0003_notification_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLoan',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('issue_date', models.DateTimeField(verbose_name='Дата выдачи')),
+                ('due_date', models.DateTimeField(verbose_name='Срок возврата')),
+                ('return_date', models.DateTimeField(verbose_name='Дата возврата')),
+                ('fine_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Штраф (KZT)')),
+                ('fine_created_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата начисления')),
+                ('fine_paid_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата оплаты')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Перенесена в архив')),
+                ('book_instance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to='catalog.bookinstance', verbose_name='Экземпляр')),
+                ('borrower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Архивная выдача',
+                'verbose_name_plural': 'Архив выдач',
+                'ordering': ['-return_date'],
+                'indexes': [models.Index(fields=['borrower', '-return_date'], name='archived_loan_history_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:53
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_author_directory'),
+        ('loans', '0004_loan_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_loan_id', models.BigIntegerField(default=0, verbose_name='Последняя учтённая выдача')),
+                ('metric', models.CharField(max_length=10, verbose_name='Мера сходства')),
+                ('top_k', models.PositiveSmallIntegerField(verbose_name='Соседей на книгу')),
+                ('min_support', models.PositiveSmallIntegerField(default=2, verbose_name='Минимум общих читателей')),
+                ('full', models.BooleanField(default=False, verbose_name='Полный пересчёт')),
+                ('pairs_added', models.PositiveIntegerField(default=0, verbose_name='Новых пар читатель–книга')),
+                ('books_updated', models.PositiveIntegerField(default=0, verbose_name='Обновлено книг')),
+                ('finished_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Завершён')),
+            ],
+            options={
+                'verbose_name': 'Пересчёт рекомендаций',
+                'verbose_name_plural': 'Пересчёты рекомендаций',
+                'ordering': ['-finished_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book')),
+            ],
+            options={
+                'verbose_name': 'Совместные выдачи',
+                'verbose_name_plural': 'Совместные выдачи',
+                'constraints': [models.UniqueConstraint(fields=('book', 'other'), name='unique_book_cooccurrence')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='catalog.book', verbose_name='Книга')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book', verbose_name='Похожая книга')),
+            ],
+            options={
+                'verbose_name': 'Похожая книга',
+                'verbose_name_plural': 'Похожие книги',
+                'ordering': ['book', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('book', 'rank'), name='unique_book_neighbor_rank')],
+            },
+        ),
+    ]
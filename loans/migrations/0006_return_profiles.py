@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_book_popularity'),
+        ('loans', '0005_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReturnProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('samples', models.PositiveIntegerField(default=0, verbose_name='Возвратов в истории')),
+                ('pooled', models.BooleanField(default=False, verbose_name='По всей библиотеке')),
+                ('delay_p50', models.FloatField(verbose_name='Задержка возврата, медиана')),
+                ('delay_p80', models.FloatField(verbose_name='Задержка возврата, 80-й перцентиль')),
+                ('duration_p50', models.FloatField(verbose_name='Срок чтения, медиана')),
+                ('duration_p80', models.FloatField(verbose_name='Срок чтения, 80-й перцентиль')),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Рассчитано')),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='return_profile', to='catalog.book', verbose_name='Книга')),
+            ],
+            options={
+                'verbose_name': 'Профиль возвратов',
+                'verbose_name_plural': 'Профили возвратов',
+            },
+        ),
+    ]
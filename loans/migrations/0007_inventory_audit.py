@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_book_popularity'),
+        ('loans', '0006_return_profiles'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('open', 'Идёт сканирование'), ('closed', 'Завершена')], default='open', max_length=10, verbose_name='Статус')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Начата')),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True, verbose_name='Сверена')),
+                ('closed_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('expected', models.PositiveIntegerField(default=0, verbose_name='Ожидалось на полках')),
+                ('seen', models.PositiveIntegerField(default=0, verbose_name='Отсканировано')),
+                ('missing', models.PositiveIntegerField(default=0, verbose_name='Не найдено')),
+                ('unexpected', models.PositiveIntegerField(default=0, verbose_name='Лишние')),
+                ('misstatus', models.PositiveIntegerField(default=0, verbose_name='С неверным статусом')),
+                ('marked_lost', models.PositiveIntegerField(default=0, verbose_name='Списано как утерянные')),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book', verbose_name='Книга')),
+                ('genre', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.genre', verbose_name='Жанр')),
+                ('started_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Начал')),
+            ],
+            options={
+                'verbose_name': 'Инвентаризация',
+                'verbose_name_plural': 'Инвентаризации',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuditScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inventory_number', models.CharField(max_length=50, verbose_name='Инвентарный номер')),
+                ('scanned_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Отсканирован')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scans', to='loans.auditsession', verbose_name='Инвентаризация')),
+            ],
+            options={
+                'verbose_name': 'Скан инвентаризации',
+                'verbose_name_plural': 'Сканы инвентаризации',
+                'constraints': [models.UniqueConstraint(fields=('session', 'inventory_number'), name='unique_audit_scan')],
+            },
+        ),
+    ]
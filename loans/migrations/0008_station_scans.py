@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0007_inventory_audit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StationScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.UUIDField(unique=True, verbose_name='Идентификатор скана')),
+                ('action', models.CharField(choices=[('issue', 'Выдача'), ('return', 'Возврат')], max_length=10, verbose_name='Операция')),
+                ('inventory_number', models.CharField(max_length=50, verbose_name='Инвентарный номер')),
+                ('borrower_username', models.CharField(blank=True, max_length=150, verbose_name='Читатель')),
+                ('scanned_at', models.DateTimeField(verbose_name='Отсканирован')),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Получен сервером')),
+                ('result', models.CharField(choices=[('ok', 'Проведён'), ('rejected', 'Отклонён')], max_length=10, verbose_name='Результат')),
+                ('message', models.CharField(blank=True, max_length=300, verbose_name='Сообщение')),
+                ('station_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Библиотекарь')),
+            ],
+            options={
+                'verbose_name': 'Скан станции',
+                'verbose_name_plural': 'Сканы станций',
+                'ordering': ['-synced_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0008_station_scans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Задача')),
+                ('schedule', models.CharField(max_length=100, verbose_name='Расписание')),
+                ('next_run_at', models.DateTimeField(verbose_name='Следующий запуск')),
+                ('lease_owner', models.CharField(blank=True, max_length=100, verbose_name='Выполняет')),
+                ('lease_until', models.DateTimeField(blank=True, null=True, verbose_name='Занята до')),
+                ('last_started_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний запуск')),
+                ('last_duration', models.FloatField(blank=True, null=True, verbose_name='Длительность, с')),
+                ('last_status', models.CharField(choices=[('never', 'Не запускалась'), ('running', 'Выполняется'), ('ok', 'Успешно'), ('failed', 'Ошибка')], default='never', max_length=10, verbose_name='Результат')),
+                ('last_output', models.TextField(blank=True, verbose_name='Вывод')),
+                ('run_count', models.PositiveIntegerField(default=0, verbose_name='Запусков')),
+                ('failure_count', models.PositiveIntegerField(default=0, verbose_name='Ошибок')),
+            ],
+            options={
+                'verbose_name': 'Фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0009_scheduled_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='circulationday',
+            name='books_total',
+            field=models.IntegerField(default=0, verbose_name='Наименований'),
+        ),
+        migrations.AlterField(
+            model_name='circulationday',
+            name='fines_unpaid',
+            field=models.IntegerField(default=0, verbose_name='Неоплаченных штрафов'),
+        ),
+        migrations.AlterField(
+            model_name='circulationday',
+            name='instances_total',
+            field=models.IntegerField(default=0, verbose_name='Экземпляров'),
+        ),
+        migrations.AlterField(
+            model_name='circulationday',
+            name='on_loan',
+            field=models.IntegerField(default=0, verbose_name='На руках'),
+        ),
+    ]
@@ -1,11 +1,15 @@
 from datetime import timedelta
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
 
-from catalog.models import Book, BookInstance
+from accounts.models import UserProfile
+from catalog.models import Book, BookInstance, Genre
 
 
 class Loan(models.Model):
@@ -20,6 +24,9 @@ class Loan(models.Model):
         verbose_name = 'Выдача'
         verbose_name_plural = 'Выдачи'
         ordering = ['-issue_date']
+        indexes = [
+            models.Index(fields=['is_returned', 'due_date'], name='loan_open_due_idx'),
+        ]
 
     def __str__(self):
         return f'{self.borrower.get_full_name()} — {self.book_instance}'
@@ -66,6 +73,82 @@ class Fine(models.Model):
         status = 'оплачен' if self.is_paid else 'не оплачен'
         return f'Штраф {self.amount} KZT — {status}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        fine = super().from_db(db, field_names, values)
+        if 'amount' in field_names and 'is_paid' in field_names:
+            fine._loaded_unpaid = fine._unpaid()
+        return fine
+
+    def _unpaid(self):
+        return (0, 0) if self.is_paid else (self.amount, 1)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            old = (0, 0)
+        elif '_loaded_unpaid' in self.__dict__:
+            old = self._loaded_unpaid
+        else:
+            amount, is_paid = Fine.objects.values_list('amount', 'is_paid').get(pk=self.pk)
+            old = (0, 0) if is_paid else (amount, 1)
+        new = self._unpaid()
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            _adjust_balance(self.loan_id, new[0] - old[0], new[1] - old[1])
+        self._loaded_unpaid = new
+
+    def mark_paid(self, when):
+        """Pay the fine unless someone already has; returns whether this call paid it."""
+        with transaction.atomic(savepoint=False):
+            # The WHERE on is_paid makes a second desk's payment a no-op instead of a second decrement
+            if not Fine.objects.filter(pk=self.pk, is_paid=False).update(is_paid=True, paid_date=when):
+                return False
+            _adjust_balance(self.loan_id, -self.amount, -1)
+        self.is_paid = True
+        self.paid_date = when
+        self._loaded_unpaid = (0, 0)
+        return True
+
+
+def _adjust_balance(loan_id, total, count):
+    if total or count:
+        UserProfile.objects.filter(user__loans=loan_id).update(
+            unpaid_fines_total=F('unpaid_fines_total') + total,
+            unpaid_fines_count=F('unpaid_fines_count') + count,
+        )
+
+
+@receiver(post_delete, sender=Fine)
+def release_fine_balance(sender, instance, **kwargs):
+    total, count = instance._unpaid()
+    _adjust_balance(instance.loan_id, -total, -count)
+
+
+class ArchivedLoan(models.Model):
+    """A returned, settled loan moved out of the live table by archive_loans."""
+    # Keeps the id of the Loan it was moved from
+    id = models.BigIntegerField(primary_key=True)
+    borrower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_loans', verbose_name='Читатель')
+    book_instance = models.ForeignKey(BookInstance, on_delete=models.CASCADE, related_name='archived_loans', verbose_name='Экземпляр')
+    issue_date = models.DateTimeField(verbose_name='Дата выдачи')
+    due_date = models.DateTimeField(verbose_name='Срок возврата')
+    return_date = models.DateTimeField(verbose_name='Дата возврата')
+    fine_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='Штраф (KZT)')
+    fine_created_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата начисления')
+    fine_paid_date = models.DateTimeField(null=True, blank=True, verbose_name='Дата оплаты')
+    archived_at = models.DateTimeField(default=timezone.now, verbose_name='Перенесена в архив')
+
+    class Meta:
+        verbose_name = 'Архивная выдача'
+        verbose_name_plural = 'Архив выдач'
+        ordering = ['-return_date']
+        indexes = [
+            models.Index(fields=['borrower', '-return_date'], name='archived_loan_history_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.borrower.get_full_name()} — {self.book_instance}'
+
 
 class Reservation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reservations', verbose_name='Читатель')
@@ -104,3 +187,258 @@ class Reservation(models.Model):
             return False
         expiry = self.notified_at + timedelta(hours=settings.RESERVATION_EXPIRY_HOURS)
         return timezone.now() > expiry
+
+
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('hold_ready', 'Книга ждёт читателя'),
+        ('due_reminder', 'Напоминание о сроке возврата'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications', verbose_name='Читатель')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Тип')
+    idempotency_key = models.CharField(max_length=100, unique=True, verbose_name='Ключ идемпотентности')
+    email = models.EmailField(verbose_name='Email')
+    subject = models.CharField(max_length=200, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Следующая попытка')
+    locked_by = models.CharField(max_length=32, blank=True, verbose_name='Обработчик')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} → {self.email} ({self.get_status_display()})'
+
+
+class CirculationDay(models.Model):
+    date = models.DateField(unique=True, verbose_name='Дата')
+    loans_issued = models.PositiveIntegerField(default=0, verbose_name='Выдано')
+    loans_returned = models.PositiveIntegerField(default=0, verbose_name='Возвращено')
+    fines_issued = models.PositiveIntegerField(default=0, verbose_name='Начислено штрафов')
+    fines_issued_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Сумма начислений (KZT)')
+    fines_paid = models.PositiveIntegerField(default=0, verbose_name='Оплачено штрафов')
+    fines_paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='Сумма оплат (KZT)')
+
+    # The whole collection as of the row's last write, moved by loans.stats.bump
+    # and recounted by update_circulation_stats. Signed: a delta landing on a
+    # row that bulk writes left behind must not fail the loan that carries it.
+    overdue = models.PositiveIntegerField(default=0, verbose_name='Просрочено')
+    on_loan = models.IntegerField(default=0, verbose_name='На руках')
+    books_total = models.IntegerField(default=0, verbose_name='Наименований')
+    instances_total = models.IntegerField(default=0, verbose_name='Экземпляров')
+    fines_unpaid = models.IntegerField(default=0, verbose_name='Неоплаченных штрафов')
+    snapshot_at = models.DateTimeField(null=True, blank=True, verbose_name='Снимок на')
+
+    class Meta:
+        verbose_name = 'Статистика за день'
+        verbose_name_plural = 'Статистика по дням'
+        ordering = ['-date']
+
+    def __str__(self):
+        return f'{self.date:%d.%m.%Y}: выдано {self.loans_issued}, возвращено {self.loans_returned}'
+
+
+class GenreCirculationDay(models.Model):
+    date = models.DateField(verbose_name='Дата')
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='circulation_days', verbose_name='Жанр')
+    loans_issued = models.PositiveIntegerField(default=0, verbose_name='Выдано')
+
+    class Meta:
+        verbose_name = 'Статистика жанра за день'
+        verbose_name_plural = 'Статистика жанров по дням'
+        ordering = ['-date', 'genre']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'genre'], name='unique_genre_circulation_day'),
+        ]
+
+    def __str__(self):
+        return f'{self.date:%d.%m.%Y} — {self.genre}: {self.loans_issued}'
+
+
+class BookCooccurrence(models.Model):
+    """How many readers borrowed both books; the diagonal (book == other) is the book's reader count."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Совместные выдачи'
+        verbose_name_plural = 'Совместные выдачи'
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'other'], name='unique_book_cooccurrence'),
+        ]
+
+
+class BookNeighbor(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbors', verbose_name='Книга')
+    neighbor = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+', verbose_name='Похожая книга')
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожая книга'
+        verbose_name_plural = 'Похожие книги'
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_book_neighbor_rank'),
+        ]
+
+
+class RecommendationRun(models.Model):
+    last_loan_id = models.BigIntegerField(default=0, verbose_name='Последняя учтённая выдача')
+    metric = models.CharField(max_length=10, verbose_name='Мера сходства')
+    top_k = models.PositiveSmallIntegerField(verbose_name='Соседей на книгу')
+    min_support = models.PositiveSmallIntegerField(default=2, verbose_name='Минимум общих читателей')
+    full = models.BooleanField(default=False, verbose_name='Полный пересчёт')
+    pairs_added = models.PositiveIntegerField(default=0, verbose_name='Новых пар читатель–книга')
+    books_updated = models.PositiveIntegerField(default=0, verbose_name='Обновлено книг')
+    finished_at = models.DateTimeField(default=timezone.now, verbose_name='Завершён')
+
+    class Meta:
+        verbose_name = 'Пересчёт рекомендаций'
+        verbose_name_plural = 'Пересчёты рекомендаций'
+        ordering = ['-finished_at']
+
+
+class ReturnProfile(models.Model):
+    """Precomputed return timing of a book's loans, in days; books with little history get the library-wide figures."""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name='return_profile', verbose_name='Книга')
+    samples = models.PositiveIntegerField(default=0, verbose_name='Возвратов в истории')
+    pooled = models.BooleanField(default=False, verbose_name='По всей библиотеке')
+    delay_p50 = models.FloatField(verbose_name='Задержка возврата, медиана')
+    delay_p80 = models.FloatField(verbose_name='Задержка возврата, 80-й перцентиль')
+    duration_p50 = models.FloatField(verbose_name='Срок чтения, медиана')
+    duration_p80 = models.FloatField(verbose_name='Срок чтения, 80-й перцентиль')
+    computed_at = models.DateTimeField(default=timezone.now, verbose_name='Рассчитано')
+
+    class Meta:
+        verbose_name = 'Профиль возвратов'
+        verbose_name_plural = 'Профили возвратов'
+
+    def __str__(self):
+        return f'{self.book}: {self.delay_p50:+.1f} / {self.duration_p50:.1f} дн.'
+
+
+class AuditSession(models.Model):
+    """A stocktaking pass: scanned codes are compared with the copies that should be on the shelves."""
+    STATUS_CHOICES = [
+        ('open', 'Идёт сканирование'),
+        ('closed', 'Завершена'),
+    ]
+
+    started_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name='Начал')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name='Книга')
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name='Жанр')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open', verbose_name='Статус')
+    started_at = models.DateTimeField(default=timezone.now, verbose_name='Начата')
+    reconciled_at = models.DateTimeField(null=True, blank=True, verbose_name='Сверена')
+    closed_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершена')
+    expected = models.PositiveIntegerField(default=0, verbose_name='Ожидалось на полках')
+    seen = models.PositiveIntegerField(default=0, verbose_name='Отсканировано')
+    missing = models.PositiveIntegerField(default=0, verbose_name='Не найдено')
+    unexpected = models.PositiveIntegerField(default=0, verbose_name='Лишние')
+    misstatus = models.PositiveIntegerField(default=0, verbose_name='С неверным статусом')
+    marked_lost = models.PositiveIntegerField(default=0, verbose_name='Списано как утерянные')
+
+    class Meta:
+        verbose_name = 'Инвентаризация'
+        verbose_name_plural = 'Инвентаризации'
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f'Инвентаризация {self.started_at:%d.%m.%Y} — {self.scope_display}'
+
+    @property
+    def scope_display(self):
+        if self.book_id:
+            return f'книга «{self.book}»'
+        if self.genre_id:
+            return f'жанр «{self.genre}»'
+        return 'весь фонд'
+
+
+class AuditScan(models.Model):
+    session = models.ForeignKey(AuditSession, on_delete=models.CASCADE, related_name='scans', verbose_name='Инвентаризация')
+    inventory_number = models.CharField(max_length=50, verbose_name='Инвентарный номер')
+    scanned_at = models.DateTimeField(default=timezone.now, verbose_name='Отсканирован')
+
+    class Meta:
+        verbose_name = 'Скан инвентаризации'
+        verbose_name_plural = 'Сканы инвентаризации'
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'inventory_number'], name='unique_audit_scan'),
+        ]
+
+
+class StationScan(models.Model):
+    """A scan synced from an offline scanner station; the client id makes a resent scan a no-op."""
+    ACTION_CHOICES = [
+        ('issue', 'Выдача'),
+        ('return', 'Возврат'),
+    ]
+    RESULT_CHOICES = [
+        ('ok', 'Проведён'),
+        ('rejected', 'Отклонён'),
+    ]
+
+    client_id = models.UUIDField(unique=True, verbose_name='Идентификатор скана')
+    station_user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name='Библиотекарь')
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name='Операция')
+    inventory_number = models.CharField(max_length=50, verbose_name='Инвентарный номер')
+    borrower_username = models.CharField(max_length=150, blank=True, verbose_name='Читатель')
+    scanned_at = models.DateTimeField(verbose_name='Отсканирован')
+    synced_at = models.DateTimeField(default=timezone.now, verbose_name='Получен сервером')
+    result = models.CharField(max_length=10, choices=RESULT_CHOICES, verbose_name='Результат')
+    message = models.CharField(max_length=300, blank=True, verbose_name='Сообщение')
+
+    class Meta:
+        verbose_name = 'Скан станции'
+        verbose_name_plural = 'Сканы станций'
+        ordering = ['-synced_at']
+
+
+class ScheduledJob(models.Model):
+    """Schedule and last result of a run_scheduler job; the lease lets one scheduler run it at a time."""
+    STATUS_CHOICES = [
+        ('never', 'Не запускалась'),
+        ('running', 'Выполняется'),
+        ('ok', 'Успешно'),
+        ('failed', 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True, verbose_name='Задача')
+    schedule = models.CharField(max_length=100, verbose_name='Расписание')
+    next_run_at = models.DateTimeField(verbose_name='Следующий запуск')
+    lease_owner = models.CharField(max_length=100, blank=True, verbose_name='Выполняет')
+    lease_until = models.DateTimeField(null=True, blank=True, verbose_name='Занята до')
+    last_started_at = models.DateTimeField(null=True, blank=True, verbose_name='Последний запуск')
+    last_duration = models.FloatField(null=True, blank=True, verbose_name='Длительность, с')
+    last_status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='never', verbose_name='Результат')
+    last_output = models.TextField(blank=True, verbose_name='Вывод')
+    run_count = models.PositiveIntegerField(default=0, verbose_name='Запусков')
+    failure_count = models.PositiveIntegerField(default=0, verbose_name='Ошибок')
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['name']
+
+    def __str__(self):
+        return f'{self.name} ({self.schedule})'
@@ -0,0 +1,128 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Loan, Notification
+
+
+def _notification(user, kind, key, subject, template, context):
+    return Notification(
+        user=user,
+        kind=kind,
+        idempotency_key=key,
+        email=user.email,
+        subject=subject,
+        body=render_to_string(template, {'user': user, **context}),
+    )
+
+
+def _enqueue(notifications):
+    # The unique idempotency key turns a repeated enqueue into a no-op
+    notifications = [n for n in notifications if n.email]
+    if notifications:
+        Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+    return len(notifications)
+
+
+def queue_hold_ready(reservation, book):
+    expires_at = reservation.notified_at + timedelta(hours=settings.RESERVATION_EXPIRY_HOURS)
+    return _enqueue([_notification(
+        reservation.user, 'hold_ready', f'hold-ready:{reservation.pk}',
+        f'Книга «{book.title}» ждёт вас', 'loans/email/hold_ready.txt',
+        {'book': book, 'reservation': reservation, 'expires_at': expires_at},
+    )])
+
+
+def queue_due_reminders(days):
+    now = timezone.now()
+    loans = Loan.objects.filter(
+        is_returned=False, due_date__gte=now, due_date__lt=now + timedelta(days=days)
+    ).select_related('borrower', 'book_instance__book')
+    return _enqueue([
+        _notification(
+            loan.borrower, 'due_reminder', f'due-reminder:{loan.pk}:{loan.due_date:%Y%m%d}',
+            f'Срок возврата «{loan.book_instance.book.title}» — {timezone.localtime(loan.due_date):%d.%m.%Y}',
+            'loans/email/due_reminder.txt',
+            {'loan': loan, 'book': loan.book_instance.book, 'fine_per_day': settings.FINE_PER_DAY_KZT},
+        )
+        for loan in loans
+    ])
+
+
+def retry_delay(attempts):
+    base = settings.NOTIFICATION_RETRY_BASE_SECONDS
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 24 * 3600))
+
+
+def _claim(batch_size, lease_seconds):
+    # A claimed row is leased: if the dispatcher dies, it becomes due again
+    now = timezone.now()
+    due = Notification.objects.filter(status__in=['pending', 'sending'], next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    due.filter(pk__in=ids).update(
+        status='sending', locked_by=token, next_attempt_at=now + timedelta(seconds=lease_seconds)
+    )
+    return list(Notification.objects.filter(locked_by=token, status='sending'))
+
+
+def dispatch(batch_size=100, max_batches=None, connection=None, lease_seconds=600):
+    max_attempts = settings.NOTIFICATION_MAX_ATTEMPTS
+    metrics = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+    connection = connection or get_connection()
+    connection.open()
+    try:
+        while max_batches is None or metrics['batches'] < max_batches:
+            batch = _claim(batch_size, lease_seconds)
+            if not batch:
+                break
+            metrics['batches'] += 1
+            done = []
+            try:
+                for notification in batch:
+                    message = EmailMessage(
+                        notification.subject, notification.body,
+                        settings.DEFAULT_FROM_EMAIL, [notification.email],
+                        connection=connection,
+                        headers={'X-Idempotency-Key': notification.idempotency_key},
+                    )
+                    notification.attempts += 1
+                    notification.locked_by = ''
+                    try:
+                        connection.send_messages([message])
+                    except Exception as exc:
+                        notification.last_error = f'{type(exc).__name__}: {exc}'
+                        if notification.attempts >= max_attempts:
+                            notification.status = 'failed'
+                            metrics['failed'] += 1
+                        else:
+                            notification.status = 'pending'
+                            notification.next_attempt_at = timezone.now() + retry_delay(notification.attempts)
+                            metrics['retried'] += 1
+                        done.append(notification)
+                        # The SMTP session may be broken; reopen it for the rest of the batch
+                        connection.close()
+                        connection.open()
+                    else:
+                        notification.status = 'sent'
+                        notification.sent_at = timezone.now()
+                        notification.last_error = ''
+                        metrics['sent'] += 1
+                        done.append(notification)
+            finally:
+                # Even if the reopen fails: the rows not tried yet wait out their lease
+                Notification.objects.bulk_update(
+                    done, ['status', 'attempts', 'locked_by', 'next_attempt_at', 'last_error', 'sent_at']
+                )
+    finally:
+        connection.close()
+        metrics['seconds'] = time.perf_counter() - started
+    return metrics
@@ -0,0 +1,107 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, FilteredRelation, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from catalog.models import BookInstance
+from catalog.signals import instance_status_changed
+from steppelibrary.metrics import CACHE_LOOKUPS
+from .models import Reservation
+
+
+MAX_ENTRIES = 4096
+
+# inventory number -> (expires at, payload), and book id -> its cached
+# numbers. Per process: a change seen here clears entries at once, other
+# workers fall back on the TTL.
+_cache = {}
+_by_book = {}
+_HIT, _MISS = CACHE_LOOKUPS.labels('scan_preview', 'hit'), CACHE_LOOKUPS.labels('scan_preview', 'miss')
+
+
+def _fetch(inventory_number):
+    queue = Reservation.objects.filter(book_id=OuterRef('book_id'), is_active=True)
+    first = queue.order_by('created_at')
+    rows = BookInstance.objects.filter(inventory_number=inventory_number).annotate(
+        open_loan=FilteredRelation('loans', condition=Q(loans__is_returned=False)),
+        next_username=Subquery(first.values('user__username')[:1]),
+        next_name=Subquery(first.annotate(
+            name=Concat('user__first_name', Value(' '), 'user__last_name')
+        ).values('name')[:1]),
+        next_notified=Subquery(first.values('notified')[:1]),
+        queue=Subquery(queue.order_by().values('book_id').annotate(count=Count('pk')).values('count')),
+    ).values_list(
+        'inventory_number', 'status', 'book_id', 'book__title',
+        'open_loan__issue_date', 'open_loan__due_date', 'open_loan__borrower__username',
+        'open_loan__borrower__first_name', 'open_loan__borrower__last_name',
+        'next_username', 'next_name', 'next_notified', 'queue',
+    )
+    row = rows.first()
+    if row is None:
+        return None
+    (number, status, book_id, title, issued, due, username, first_name, last_name,
+     next_username, next_name, next_notified, queue) = row
+    return {
+        'inventory_number': number,
+        'status': status,
+        'status_display': dict(BookInstance.STATUS_CHOICES).get(status, status),
+        'book': {'id': book_id, 'title': title},
+        'loan': {
+            'issue_date': issued,
+            'due_date': due,
+            'borrower': {'username': username, 'name': f'{first_name} {last_name}'.strip()},
+        } if due is not None else None,
+        'next_reservation': {
+            'username': next_username, 'name': next_name.strip(), 'notified': next_notified,
+        } if next_username else None,
+        'queue': queue or 0,
+        'can_issue': status == 'available',
+        'can_return': due is not None,
+    }
+
+
+def scan_preview(inventory_number):
+    """What the desk needs right after a scan; None for an unknown code."""
+    now = time.monotonic()
+    entry = _cache.get(inventory_number)
+    if entry is not None and entry[0] > now:
+        _HIT.inc()
+        payload = entry[1]
+    else:
+        _MISS.inc()
+        payload = _fetch(inventory_number)
+        if payload is None:
+            return None
+        if len(_cache) >= MAX_ENTRIES:
+            _cache.clear()
+            _by_book.clear()
+        _cache[inventory_number] = (now + settings.SCAN_PREVIEW_CACHE_SECONDS, payload)
+        _by_book.setdefault(payload['book']['id'], set()).add(inventory_number)
+    # Overdue as of the answer, not of the cache fill
+    loan = payload['loan']
+    return {**payload, 'overdue': loan is not None and loan['due_date'] < timezone.now()}
+
+
+def invalidate_book(book_id):
+    for inventory_number in tuple(_by_book.pop(book_id, ())):
+        _cache.pop(inventory_number, None)
+
+
+@receiver(instance_status_changed)
+def forget_changed_instance(sender, book_id, **kwargs):
+    # Other copies of the book change too: their queue and next reader
+    # depend on it. Again after commit, so a request between the write and
+    # the commit cannot leave the old row cached.
+    invalidate_book(book_id)
+    transaction.on_commit(lambda: invalidate_book(book_id))
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def forget_queue(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_book(instance.book_id))
@@ -0,0 +1,237 @@
+import heapq
+import math
+from array import array
+from collections import defaultdict
+from itertools import groupby, islice
+from operator import itemgetter
+
+from django.db import connection, transaction
+from django.db.models import F, Max
+
+from catalog.models import Book
+from .models import ArchivedLoan, BookCooccurrence, BookNeighbor, Loan, RecommendationRun
+
+
+METRICS = ('cosine', 'jaccard')
+CHUNK = 500
+# Co-reads queued before a merge into the matrix, 8 bytes each
+PAIR_BUFFER = 1 << 20
+
+
+def _reader_books(loans):
+    return loans.values_list('borrower_id', 'book_instance__book_id').distinct().order_by()
+
+
+def _all_pairs(high_water):
+    # Live and archived history, one row per (reader, book), grouped by reader
+    return _reader_books(Loan.objects.filter(pk__lte=high_water)).union(
+        _reader_books(ArchivedLoan.objects.filter(pk__lte=high_water))
+    ).order_by('borrower_id')
+
+
+def _pairs_by_reader(queryset, readers=None):
+    result = defaultdict(set) if readers is None else readers
+    for borrower_id, book_id in queryset.iterator(chunk_size=5000):
+        result[borrower_id].add(book_id)
+    return result
+
+
+def _entries(matrix):
+    indptr, indices, data = matrix
+    for i in range(len(indptr) - 1):
+        for k in range(indptr[i], indptr[i + 1]):
+            yield i << 32 | indices[k], data[k]
+
+
+def _merge(matrix, codes):
+    """Add co-reads, one pair code (i << 32 | j) each, to a CSR matrix; returns the new matrix."""
+    # Both streams are sorted by code, so one pass writes the rows in order
+    new = ((code, sum(1 for _ in group)) for code, group in groupby(sorted(codes)))
+    indptr, indices, data = array('Q', [0]), array('I'), array('I')
+    for code, group in groupby(heapq.merge(_entries(matrix), new), key=itemgetter(0)):
+        i = code >> 32
+        while len(indptr) <= i:
+            indptr.append(len(indices))
+        indices.append(code & 0xFFFFFFFF)
+        data.append(sum(n for _, n in group))
+    indptr.append(len(indices))
+    return indptr, indices, data
+
+
+def _count_full(high_water):
+    """Count the item-item co-occurrence matrix over the whole reader x book incidence.
+
+    Returns the matrix as (book_id, other_id, count) rows, generated from
+    arrays, and the number of (reader, book) pairs counted.
+    """
+    # Books map to dense indices. The matrix is CSR: indptr[i]:indptr[i + 1]
+    # slices row i's co-read partners out of indices, with their counts in
+    # data. Co-reads queue up as pair codes and are merged in sorted batches.
+    index, books = {}, array('q')
+    readers = array('I')
+    matrix = (array('Q', [0]), array('I'), array('I'))
+    pending = array('Q')
+
+    def flush(shelf):
+        nonlocal matrix, pending
+        ids = []
+        for book_id in shelf:
+            if book_id not in index:
+                index[book_id] = len(books)
+                books.append(book_id)
+                readers.append(0)
+            ids.append(index[book_id])
+        for i in ids:
+            readers[i] += 1
+            pending.extend(i << 32 | j for j in ids if j != i)
+        if len(pending) >= PAIR_BUFFER:
+            matrix, pending = _merge(matrix, pending), array('Q')
+
+    current, shelf = None, set()
+    for borrower_id, book_id in _all_pairs(high_water).iterator(chunk_size=5000):
+        if borrower_id != current:
+            flush(shelf)
+            current, shelf = borrower_id, set()
+        shelf.add(book_id)
+    flush(shelf)
+    matrix = _merge(matrix, pending)
+
+    def rows():
+        indptr, indices, data = matrix
+        for i, book_id in enumerate(books):
+            yield book_id, book_id, readers[i]
+            if i < len(indptr) - 1:
+                for k in range(indptr[i], indptr[i + 1]):
+                    yield book_id, books[indices[k]], data[k]
+
+    return rows(), sum(readers)
+
+
+def _count_since(last_loan_id, high_water):
+    """Co-occurrence increments contributed by (reader, book) pairs first seen after last_loan_id."""
+    window = {'pk__gt': last_loan_id, 'pk__lte': high_water}
+    new = _pairs_by_reader(_reader_books(Loan.objects.filter(**window)))
+    # archive_loans may already have moved loans the previous run never saw
+    _pairs_by_reader(_reader_books(ArchivedLoan.objects.filter(**window)), new)
+
+    increments = defaultdict(int)
+    pairs_added = 0
+    reader_ids = list(new)
+    for start in range(0, len(reader_ids), CHUNK):
+        chunk = reader_ids[start:start + CHUNK]
+        seen = _pairs_by_reader(_reader_books(Loan.objects.filter(borrower_id__in=chunk, pk__lte=last_loan_id)))
+        _pairs_by_reader(_reader_books(ArchivedLoan.objects.filter(borrower_id__in=chunk, pk__lte=last_loan_id)), seen)
+        for borrower_id in chunk:
+            shelf = seen.get(borrower_id, set())
+            for book_id in sorted(new[borrower_id] - shelf):
+                pairs_added += 1
+                increments[(book_id, book_id)] += 1
+                for other_id in shelf:
+                    increments[(book_id, other_id)] += 1
+                    increments[(other_id, book_id)] += 1
+                shelf.add(book_id)
+    return increments, pairs_added
+
+
+def _add_counts(rows):
+    """Upsert (book_id, other_id, count) rows, adding to the stored counts."""
+    # Raw executemany: the matrix runs to millions of cells, too many to build model objects for
+    qn = connection.ops.quote_name
+    table = BookCooccurrence._meta.db_table
+    sql = (
+        f'INSERT INTO {qn(table)} ({qn("book_id")}, {qn("other_id")}, {qn("count")}) VALUES (%s, %s, %s) '
+        f'ON CONFLICT ({qn("book_id")}, {qn("other_id")}) DO UPDATE SET '
+        f'{qn("count")} = {qn(table)}.{qn("count")} + excluded.{qn("count")}'
+    )
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while batch := list(islice(rows, 5000)):
+            cursor.executemany(sql, batch)
+
+
+def _score(metric, both, a, b):
+    if metric == 'jaccard':
+        return both / (a + b - both)
+    return both / math.sqrt(a * b)
+
+
+def _rank(book_ids, metric, top_k, min_support):
+    """Rewrite the top-K neighbor rows of the given books from the stored counts."""
+    readers = dict(
+        BookCooccurrence.objects.filter(book_id=F('other_id')).values_list('book_id', 'count')
+    )
+    book_ids = sorted(book_ids)
+    for start in range(0, len(book_ids), CHUNK):
+        chunk = book_ids[start:start + CHUNK]
+        candidates = defaultdict(list)
+        pairs = BookCooccurrence.objects.filter(book_id__in=chunk, count__gte=min_support).exclude(
+            other_id=F('book_id')
+        ).values_list('book_id', 'other_id', 'count')
+        for book_id, other_id, both in pairs.iterator(chunk_size=5000):
+            score = _score(metric, both, readers[book_id], readers[other_id])
+            candidates[book_id].append((score, both, other_id))
+        neighbors = []
+        for book_id in chunk:
+            best = sorted(candidates[book_id], reverse=True)[:top_k]
+            neighbors.extend(
+                BookNeighbor(book_id=book_id, neighbor_id=other_id, rank=rank, score=score)
+                for rank, (score, _, other_id) in enumerate(best, start=1)
+            )
+        with transaction.atomic():
+            BookNeighbor.objects.filter(book_id__in=chunk).delete()
+            BookNeighbor.objects.bulk_create(neighbors, batch_size=2000)
+
+
+def update(metric='cosine', top_k=10, min_support=2, full=False):
+    last_run = RecommendationRun.objects.first()
+    if last_run is None or (last_run.metric, last_run.top_k, last_run.min_support) != (metric, top_k, min_support):
+        full = True
+    high_water = max(
+        Loan.objects.aggregate(m=Max('pk'))['m'] or 0,
+        ArchivedLoan.objects.aggregate(m=Max('pk'))['m'] or 0,
+    )
+
+    if full:
+        rows, pairs_added = _count_full(high_water)
+        with transaction.atomic():
+            BookCooccurrence.objects.all().delete()
+            _add_counts(rows)
+        affected = Book.objects.values_list('pk', flat=True)
+    else:
+        increments, pairs_added = _count_since(last_run.last_loan_id, high_water)
+        _add_counts((book_id, other_id, n) for (book_id, other_id), n in increments.items())
+        # A new reader of a book changes its own scores and those of every book it is co-read with
+        affected = {book_id for book_id, _ in increments}
+        # A bigger reader count only lowers a book's scores, so elsewhere it can
+        # just slip within or out of lists it is already in
+        readers_changed = [a for a, b in increments if a == b]
+        for start in range(0, len(readers_changed), CHUNK):
+            affected.update(BookNeighbor.objects.filter(
+                neighbor_id__in=readers_changed[start:start + CHUNK]
+            ).values_list('book_id', flat=True))
+
+    affected = set(affected)
+    _rank(affected, metric, top_k, min_support)
+    return RecommendationRun.objects.create(
+        last_loan_id=high_water, metric=metric, top_k=top_k, min_support=min_support, full=full,
+        pairs_added=pairs_added, books_updated=len(affected),
+    )
+
+
+def related_books(book, limit=6):
+    """Neighbors from the precomputed table, or same author/genre picks for a cold-start book."""
+    neighbors = BookNeighbor.objects.filter(book=book).select_related('neighbor').prefetch_related('neighbor__authors')
+    picks = [n.neighbor for n in neighbors[:limit]]
+    if picks:
+        return picks
+    books = Book.objects.prefetch_related('authors').exclude(pk=book.pk).order_by('-date_added')
+    author_ids = [author.pk for author in book.authors.all()]
+    picks = list(books.filter(
+        pk__in=Book.authors.through.objects.filter(author_id__in=author_ids).values('book_id')
+    )[:limit])
+    genre_ids = [genre.pk for genre in book.genres.all()]
+    if len(picks) < limit and genre_ids:
+        picks += books.filter(
+            pk__in=Book.genres.through.objects.filter(genre_id__in=genre_ids).values('book_id')
+        ).exclude(pk__in=[p.pk for p in picks])[:limit - len(picks)]
+    return picks
@@ -0,0 +1,186 @@
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ScheduledJob
+
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_LIMIT = 4000
+# minute, hour, day of month, month, day of week (0 or 7 is Sunday)
+CRON_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _cron_field(text, low, high):
+    values = set()
+    for part in text.split(','):
+        body, slash, step = part.partition('/')
+        step = int(step) if slash else 1
+        if body == '*':
+            start, end = low, high
+        elif '-' in body:
+            start, end = (int(v) for v in body.split('-', 1))
+        else:
+            start = int(body)
+            # "5/15" means from 5 to the end of the range in steps of 15
+            end = high if slash else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(part)
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+    """A five-field cron expression, evaluated in the project's local time."""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(expression)
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_RANGES)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day, self.any_weekday = fields[2] == '*', fields[4] == '*'
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        # As in cron: with both day fields restricted, either one matching is enough
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        local = timezone.localtime(moment).replace(tzinfo=None, second=0, microsecond=0)
+        t = local + timedelta(minutes=1)
+        while t.year <= local.year + 5:
+            if t.month not in self.months:
+                t = datetime(t.year + t.month // 12, t.month % 12 + 1, 1)
+            elif not self._day_matches(t):
+                t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return timezone.make_aware(t)
+        raise ValueError(f'{self.expression} never fires')
+
+
+@dataclass
+class Job:
+    name: str
+    command: str
+    args: tuple
+    every: int | None
+    cron: Cron | None
+    lease_seconds: int
+    jitter: int
+
+    @property
+    def schedule(self):
+        return self.cron.expression if self.cron else f'каждые {self.every} с'
+
+    def next_run(self, after):
+        due = self.cron.next_after(after) if self.cron else after + timedelta(seconds=self.every)
+        return due + timedelta(seconds=random.uniform(0, self.jitter))
+
+
+def jobs():
+    """The jobs configured in SCHEDULER_JOBS."""
+    result = []
+    for name, options in settings.SCHEDULER_JOBS.items():
+        if ('every' in options) == ('cron' in options):
+            raise ImproperlyConfigured(f'SCHEDULER_JOBS[{name!r}] needs exactly one of "every" and "cron".')
+        try:
+            cron = Cron(options['cron']) if 'cron' in options else None
+        except ValueError as exc:
+            raise ImproperlyConfigured(f'SCHEDULER_JOBS[{name!r}]: bad cron expression {exc}.')
+        result.append(Job(
+            name=name,
+            command=options.get('command', name),
+            args=tuple(options.get('args', ())),
+            every=options.get('every'),
+            cron=cron,
+            lease_seconds=options.get('lease', settings.SCHEDULER_LEASE_SECONDS),
+            jitter=options.get('jitter', settings.SCHEDULER_JITTER_SECONDS),
+        ))
+    return result
+
+
+def sync(configured, now=None):
+    """Create rows for new jobs and reschedule jobs whose schedule changed."""
+    now = now or timezone.now()
+    rows = {row.name: row for row in ScheduledJob.objects.filter(name__in=[job.name for job in configured])}
+    ScheduledJob.objects.bulk_create([
+        ScheduledJob(name=job.name, schedule=job.schedule, next_run_at=job.next_run(now))
+        for job in configured if job.name not in rows
+    ], ignore_conflicts=True)
+    for job in configured:
+        row = rows.get(job.name)
+        if row is not None and row.schedule != job.schedule:
+            ScheduledJob.objects.filter(pk=row.pk).update(schedule=job.schedule, next_run_at=job.next_run(now))
+
+
+def _claim(job, owner, now):
+    # Compare-and-set on the lease: of several schedulers only one wins a due job,
+    # and a lease left by a dead scheduler runs out
+    return ScheduledJob.objects.filter(
+        Q(lease_until__isnull=True) | Q(lease_until__lt=now), name=job.name, next_run_at__lte=now,
+    ).update(
+        lease_owner=owner, lease_until=now + timedelta(seconds=job.lease_seconds),
+        last_status='running', last_started_at=now,
+    ) == 1
+
+
+def run(job, owner):
+    out = StringIO()
+    started = time.perf_counter()
+    close_old_connections()
+    try:
+        call_command(job.command, *job.args, stdout=out, stderr=out)
+        status = 'ok'
+    except Exception as exc:
+        logger.exception('Scheduled job %s failed', job.name)
+        out.write(f'{type(exc).__name__}: {exc}')
+        status = 'failed'
+    duration = time.perf_counter() - started
+    close_old_connections()
+    # A missed run is not caught up: the next one is counted from now
+    ScheduledJob.objects.filter(name=job.name, lease_owner=owner).update(
+        lease_owner='', lease_until=None, last_status=status, last_duration=duration,
+        last_output=out.getvalue()[-OUTPUT_LIMIT:], next_run_at=job.next_run(timezone.now()),
+        run_count=F('run_count') + 1, failure_count=F('failure_count') + int(status == 'failed'),
+    )
+    return status, duration
+
+
+def run_if_due(job, owner):
+    """Run the job if it is due and this scheduler wins it; (status, seconds) or None."""
+    if not _claim(job, owner, timezone.now()):
+        return None
+    return run(job, owner)
+
+
+def seconds_until_next(configured, limit):
+    now = timezone.now()
+    # A job another scheduler is running is not waited for; its next run shows up on a later poll
+    upcoming = ScheduledJob.objects.filter(
+        Q(lease_until__isnull=True) | Q(lease_until__lt=now), name__in=[job.name for job in configured],
+    ).order_by('next_run_at').first()
+    if upcoming is None:
+        return limit
+    return max(1.0, min(limit, (upcoming.next_run_at - now).total_seconds()))
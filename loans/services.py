@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from catalog import popularity
+from catalog.models import BookInstance
+from catalog.signals import instance_status_changed
+from steppelibrary import metrics
+from steppelibrary.db import immediate_atomic
+from .models import Loan, Fine, Reservation
+from . import stats
+from .notifications import queue_hold_ready
+
+
+class CirculationConflict(Exception):
+    """The copy or loan changed between validation and the write, e.g. another desk got there first."""
+
+
+def _conflict(instance):
+    return CirculationConflict(f'Статус экземпляра {instance.inventory_number} уже изменён.')
+
+
+def _set_status(instance, expected, new):
+    # Compare-and-set: the WHERE on the old status detects a concurrent change without row locks
+    if not BookInstance.objects.filter(pk=instance.pk, status=expected).update(status=new):
+        raise _conflict(instance)
+    _status_changed(instance, expected, new)
+
+
+def _release(instance):
+    # The same compare-and-set for a returned copy, choosing between 'reserved'
+    # and 'available' in the statement itself so the queue is only read when it has someone
+    qn = connection.ops.quote_name
+    sql = (
+        f'UPDATE {qn(BookInstance._meta.db_table)} SET {qn("status")} = CASE WHEN EXISTS ('
+        f'SELECT 1 FROM {qn(Reservation._meta.db_table)} WHERE {qn("book_id")} = %s '
+        f'AND {qn("is_active")} AND NOT {qn("notified")}'
+        f") THEN 'reserved' ELSE 'available' END "
+        f'WHERE {qn("id")} = %s AND {qn("status")} = %s RETURNING {qn("status")}'
+    )
+    with connection.cursor() as cursor:
+        pk = BookInstance._meta.pk.get_db_prep_value(instance.pk, connection)
+        cursor.execute(sql, [instance.book_id, pk, instance.status])
+        row = cursor.fetchone()
+    if row is None:
+        raise _conflict(instance)
+    _status_changed(instance, instance.status, row[0])
+    return row[0]
+
+
+def _status_changed(instance, old, new):
+    instance.status = instance._loaded_status = new
+    instance_status_changed.send(
+        sender=BookInstance,
+        instance_id=instance.pk,
+        book_id=instance.book_id,
+        inventory_number=instance.inventory_number,
+        old=old,
+        new=new,
+        counted=True,
+    )
+
+
+def issue_loan(instance, borrower, when=None):
+    # `when` backdates a loan recorded offline at a scanner station
+    issued = when or timezone.now()
+    with immediate_atomic():
+        _set_status(instance, 'available', 'on_loan')
+        loan = Loan.objects.create(
+            borrower=borrower, book_instance=instance, issue_date=issued,
+            due_date=issued + timedelta(days=settings.LOAN_PERIOD_DAYS),
+        )
+        stats.record_issue(loan, instance.book_id)
+        # A ranking signal: scored after the commit, outside the write lock
+        transaction.on_commit(lambda: popularity.record(instance.book_id, popularity.LOAN_WEIGHT, issued))
+        Reservation.objects.filter(
+            user=borrower, book_id=instance.book_id, is_active=True
+        ).update(is_active=False)
+    return loan
+
+
+def return_loan(loan, when=None):
+    """Close an open loan; the loan should come with book_instance__book and fine selected.
+
+    Returns the fine (new or already accrued) and the reservation now holding the copy.
+    """
+    instance = loan.book_instance
+    now = when or timezone.now()
+    with immediate_atomic():
+        if not Loan.objects.filter(pk=loan.pk, is_returned=False).update(is_returned=True, return_date=now):
+            raise CirculationConflict(f'Экземпляр {instance.inventory_number} уже возвращён.')
+        loan.is_returned = True
+        loan.return_date = now
+
+        fine = getattr(loan, 'fine', None)
+        new_fine = None
+        if fine is None and loan.due_date < now:
+            days = (now - loan.due_date).days
+            fine = new_fine = Fine.objects.create(loan=loan, amount=days * settings.FINE_PER_DAY_KZT)
+        stats.record_return(loan, new_fine)
+
+        next_reservation = None
+        if _release(instance) == 'reserved':
+            next_reservation = Reservation.objects.filter(
+                book_id=instance.book_id, is_active=True, notified=False
+            ).select_related('user').order_by('created_at').first()
+            next_reservation.notified = True
+            next_reservation.notified_at = now
+            next_reservation.save(update_fields=['notified', 'notified_at'])
+            queue_hold_ready(next_reservation, instance.book)
+    return fine, next_reservation
+
+
+def pay_fine(fine, when=None):
+    with immediate_atomic():
+        if not fine.mark_paid(when or timezone.now()):
+            raise CirculationConflict(f'Штраф {fine.amount} KZT уже оплачен.')
+        stats.record_fine_paid(fine)
+
+
+def expire_reservations(now=None):
+    """Close holds not collected within RESERVATION_EXPIRY_HOURS and pass each copy down the queue.
+
+    Returns the number of reservations expired.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=settings.RESERVATION_EXPIRY_HOURS)
+    stale = Reservation.objects.filter(is_active=True, notified=True, notified_at__lt=cutoff).select_related('book')
+    expired = 0
+    for reservation in stale:
+        try:
+            with immediate_atomic():
+                # Issued or cancelled since the query: nothing to expire
+                if not Reservation.objects.filter(pk=reservation.pk, is_active=True).update(is_active=False):
+                    continue
+                transaction.on_commit(metrics.RESERVATIONS_EXPIRED.inc)
+                next_reservation = Reservation.objects.filter(
+                    book_id=reservation.book_id, is_active=True, notified=False
+                ).select_related('user').order_by('created_at').first()
+                if next_reservation is not None:
+                    next_reservation.notified = True
+                    next_reservation.notified_at = now
+                    next_reservation.save(update_fields=['notified', 'notified_at'])
+                    queue_hold_ready(next_reservation, reservation.book)
+                else:
+                    held = BookInstance.objects.filter(book_id=reservation.book_id, status='reserved').first()
+                    if held is not None:
+                        _set_status(held, 'reserved', 'available')
+        except CirculationConflict:
+            # The held copy changed under us; the next run sees the new state
+            continue
+        expired += 1
+    return expired
@@ -0,0 +1,116 @@
+import asyncio
+import re
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import connections
+from django.http import HttpRequest, parse_cookie
+
+from accounts.models import UserProfile
+from .events import hub, book_channel, format_event, STAFF_CHANNEL
+
+
+# Streams are served straight from the ASGI entry point. Going through
+# Django's handler would pin one executor thread per open connection for its
+# whole lifetime, so thousands of idle streams would mean thousands of threads.
+
+KEEPALIVE_SECONDS = 20
+
+BOOK_PATH = re.compile(r'^/events/book/(\d+)/$')
+STAFF_PATH = '/staff/events/'
+
+HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def resolve(path):
+    # Returns (channel, staff_only) or None when the path is not a stream
+    match = BOOK_PATH.match(path)
+    if match:
+        return book_channel(int(match.group(1))), False
+    if path == STAFF_PATH:
+        return STAFF_CHANNEL, True
+    return None
+
+
+def _session_key(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            return parse_cookie(value.decode('latin-1')).get(settings.SESSION_COOKIE_NAME)
+    return None
+
+
+def _is_librarian(session_key):
+    try:
+        request = HttpRequest()
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        user = get_user(request)
+        if not user.is_authenticated:
+            return False
+        return UserProfile.objects.filter(user_id=user.pk, role='librarian').exists()
+    finally:
+        connections.close_all()
+
+
+async def _respond(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': body.encode('utf-8')})
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def application(scope, receive, send):
+    target = resolve(scope['path'])
+    if target is None or scope['method'] != 'GET':
+        await _respond(send, 404, 'Not Found')
+        return
+    channel, staff_only = target
+
+    if staff_only:
+        session_key = _session_key(scope)
+        if not session_key or not await sync_to_async(_is_librarian, thread_sensitive=False)(session_key):
+            await _respond(send, 403, 'Доступ только для библиотекарей.')
+            return
+
+    subscription = hub.subscribe(channel)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    pending = None
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {pending, disconnected}, timeout=KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected in done:
+                break
+            if pending not in done:
+                chunk = ': ping\n\n'
+            else:
+                event, pending = pending.result(), None
+                if event is None:
+                    await send({'type': 'http.response.body', 'body': b'event: reset\ndata: {}\n\n'})
+                    return
+                chunk = format_event(event)
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    except OSError:
+        # The server failed to write to a client that went away
+        pass
+    finally:
+        subscription.close()
+        disconnected.cancel()
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,102 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from steppelibrary.db import immediate_atomic
+from .forms import IssueLoanForm, ReturnLoanForm
+from .models import StationScan
+from . import services
+
+
+class BatchError(Exception):
+    pass
+
+
+def _scan_time(value, now):
+    when = parse_datetime(value) if isinstance(value, str) else None
+    if when is None:
+        return now
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    # A station clock can be off; keep the time between the offline limit and now
+    return min(max(when, now - timedelta(hours=settings.STATION_MAX_OFFLINE_HOURS)), now)
+
+
+def _parse(raw, now):
+    if not isinstance(raw, dict):
+        raise BatchError('Каждый скан должен быть объектом.')
+    try:
+        client_id = uuid.UUID(str(raw.get('id')))
+    except ValueError:
+        raise BatchError('У скана нет корректного id.')
+    action = raw.get('action')
+    if action not in ('issue', 'return'):
+        raise BatchError(f'Неизвестная операция: {action}.')
+    return StationScan(
+        client_id=client_id,
+        action=action,
+        inventory_number=str(raw.get('inventory_number', '')).strip()[:50],
+        borrower_username=str(raw.get('borrower') or '').strip()[:150],
+        scanned_at=_scan_time(raw.get('scanned_at'), now),
+    )
+
+
+def _errors(form):
+    return ' '.join(error for errors in form.errors.values() for error in errors)
+
+
+def _apply(scan):
+    when = scan.scanned_at
+    if scan.action == 'issue':
+        form = IssueLoanForm({'inventory_number': scan.inventory_number, 'borrower_username': scan.borrower_username})
+        if not form.is_valid():
+            return 'rejected', _errors(form)
+        loan = services.issue_loan(form.book_instance, form.borrower, when=when)
+        return 'ok', f'«{form.book_instance.book.title}» выдана {form.borrower.get_full_name()} до {timezone.localtime(loan.due_date):%d.%m.%Y}'
+    form = ReturnLoanForm({'inventory_number': scan.inventory_number})
+    if not form.is_valid():
+        return 'rejected', _errors(form)
+    fine, next_reservation = services.return_loan(form.loan, when=when)
+    message = f'«{form.loan.book_instance.book.title}» возвращена'
+    if fine is not None and not fine.is_paid:
+        message += f', штраф {fine.amount} KZT'
+    if next_reservation:
+        message += f', следующий в очереди: {next_reservation.user.get_full_name()}'
+    return 'ok', message
+
+
+def _result(scan):
+    return {'id': str(scan.client_id), 'result': scan.result, 'message': scan.message}
+
+
+def apply_batch(user, raw_scans):
+    """Apply queued station scans in scan order, in one transaction; returns one result per scan.
+
+    A scan whose id was already applied is answered from the stored result, so a
+    station may resend a batch whose response it never received.
+    """
+    now = timezone.now()
+    scans = sorted((_parse(raw, now) for raw in raw_scans), key=lambda scan: scan.scanned_at)
+    results = {}
+    with immediate_atomic():
+        done = StationScan.objects.in_bulk([scan.client_id for scan in scans], field_name='client_id')
+        for scan in scans:
+            if scan.client_id in done:
+                results[scan.client_id] = _result(done[scan.client_id])
+                continue
+            try:
+                # A savepoint per scan: a failed scan leaves the rest of the batch alone
+                with transaction.atomic():
+                    scan.result, scan.message = _apply(scan)
+            except services.CirculationConflict as exc:
+                scan.result, scan.message = 'rejected', str(exc)
+            scan.station_user = user
+            scan.message = scan.message[:300]
+            scan.save()
+            done[scan.client_id] = scan
+            results[scan.client_id] = _result(scan)
+    return [results[uuid.UUID(str(raw['id']))] for raw in raw_scans]
@@ -0,0 +1,284 @@
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from catalog.models import Book, BookInstance
+from catalog.signals import instance_status_changed
+from steppelibrary import metrics
+from .models import ArchivedLoan, CirculationDay, GenreCirculationDay, Loan, Fine
+
+
+COUNTER_FIELDS = [
+    'loans_issued', 'loans_returned',
+    'fines_issued', 'fines_issued_amount',
+    'fines_paid', 'fines_paid_amount',
+]
+
+# Collection-wide gauges: a new day's row starts from the last row's values and
+# every write moves today's row, so the latest row is always current
+TOTAL_FIELDS = ['on_loan', 'books_total', 'instances_total', 'fines_unpaid']
+
+# The staff panel's overdue badge counts at most this many index entries
+OVERDUE_COUNT_LIMIT = 1000
+
+
+def _increment_clause(table, columns):
+    qn = connection.ops.quote_name
+    return ', '.join(f'{qn(c)} = {qn(table)}.{qn(c)} + excluded.{qn(c)}' for c in columns)
+
+
+def bump(day=None, **deltas):
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    unknown = set(deltas) - set(COUNTER_FIELDS) - set(TOTAL_FIELDS)
+    if unknown:
+        raise ValueError(f'Неизвестные счётчики: {", ".join(sorted(unknown))}')
+
+    today = timezone.localdate()
+    counters = {field: value for field, value in deltas.items() if field in COUNTER_FIELDS}
+    totals = {field: value for field, value in deltas.items() if field in TOTAL_FIELDS}
+    if day is None or day == today or not totals:
+        _upsert(day or today, counters, totals)
+    else:
+        # A backdated event: its counters go to its day, the gauges move now
+        _upsert(day, counters, {})
+        _upsert(today, {}, totals)
+
+
+def _upsert(day, counters, totals):
+    qn = connection.ops.quote_name
+    table = CirculationDay._meta.db_table
+    columns = ['date'] + COUNTER_FIELDS + TOTAL_FIELDS + ['overdue']
+    carried = [
+        f'COALESCE((SELECT {qn(c)} FROM {qn(table)} WHERE {qn("date")} < %s '
+        f'ORDER BY {qn("date")} DESC LIMIT 1), 0) + %s'
+        for c in TOTAL_FIELDS
+    ]
+    updates = [_increment_clause(table, list(counters))] if counters else []
+    updates += [f'{qn(c)} = {qn(table)}.{qn(c)} + %s' for c in totals]
+    sql = (
+        f'INSERT INTO {qn(table)} ({", ".join(qn(c) for c in columns)}) '
+        f'SELECT {", ".join(["%s"] * (1 + len(COUNTER_FIELDS)) + carried)}, 0 WHERE 1 = 1 '
+        f'ON CONFLICT ({qn("date")}) DO UPDATE SET {", ".join(updates)}'
+    )
+    params = [day] + [counters.get(c, 0) for c in COUNTER_FIELDS]
+    for c in TOTAL_FIELDS:
+        params += [day, totals.get(c, 0)]
+    params += list(totals.values())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def bump_genres(book_id, day=None, loans_issued=1):
+    # One INSERT ... SELECT upsert covers every genre of the book
+    qn = connection.ops.quote_name
+    table = GenreCirculationDay._meta.db_table
+    through = Book.genres.through._meta.db_table
+    sql = (
+        f'INSERT INTO {qn(table)} ({qn("date")}, {qn("genre_id")}, {qn("loans_issued")}) '
+        f'SELECT %s, {qn("genre_id")}, %s FROM {qn(through)} WHERE {qn("book_id")} = %s '
+        f'ON CONFLICT ({qn("date")}, {qn("genre_id")}) DO UPDATE SET '
+        f'{_increment_clause(table, ["loans_issued"])}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [day or timezone.localdate(), loans_issued, book_id])
+
+
+# Prometheus counters move on commit: an increment cannot be rolled back with the rows
+
+def record_issue(loan, book_id):
+    bump(timezone.localdate(loan.issue_date), loans_issued=1, on_loan=1)
+    bump_genres(book_id, timezone.localdate(loan.issue_date))
+    transaction.on_commit(metrics.LOANS_ISSUED.inc)
+
+
+def record_return(loan, fine=None):
+    day = timezone.localdate(loan.return_date)
+    if fine is not None:
+        bump(day, loans_returned=1, on_loan=-1,
+             fines_issued=1, fines_issued_amount=fine.amount, fines_unpaid=1)
+        transaction.on_commit(metrics.FINES_ISSUED.inc)
+    else:
+        bump(day, loans_returned=1, on_loan=-1)
+    transaction.on_commit(metrics.LOANS_RETURNED.inc)
+
+
+def record_fine_issued(fine):
+    bump(fines_issued=1, fines_issued_amount=fine.amount, fines_unpaid=1)
+    transaction.on_commit(metrics.FINES_ISSUED.inc)
+
+
+def record_fine_raised(fine, increase):
+    # rebuild sums a fine's current amount on the day it was created
+    bump(timezone.localdate(fine.created_at), fines_issued_amount=increase)
+
+
+def record_fine_paid(fine):
+    bump(timezone.localdate(fine.paid_date), fines_paid=1, fines_paid_amount=fine.amount, fines_unpaid=-1)
+    transaction.on_commit(metrics.FINES_PAID.inc)
+
+
+# Catalog edits outside circulation: copies added, removed or changed by hand
+
+@receiver(instance_status_changed)
+def count_status_change(sender, old, new, counted=False, **kwargs):
+    if counted:
+        # loans.services moved on_loan in the same upsert as the day's counters
+        return
+    bump(
+        instances_total=1 if old is None else 0,
+        on_loan=(new == 'on_loan') - (old == 'on_loan'),
+    )
+
+
+@receiver(post_delete, sender=BookInstance)
+def count_deleted_instance(sender, instance, **kwargs):
+    bump(instances_total=-1, on_loan=-1 if instance.status == 'on_loan' else 0)
+
+
+@receiver(post_save, sender=Book)
+def count_added_book(sender, instance, created, **kwargs):
+    if created:
+        bump(books_total=1)
+
+
+@receiver(post_delete, sender=Book)
+def count_deleted_book(sender, instance, **kwargs):
+    bump(books_total=-1)
+
+
+def recount():
+    """The gauges counted from the tables; take_snapshot writes them to repair drift from bulk writes."""
+    instances = BookInstance.objects.aggregate(
+        total=Count('pk'),
+        on_loan=Count('pk', filter=Q(status='on_loan')),
+    )
+    return {
+        'on_loan': instances['on_loan'],
+        'books_total': Book.objects.count(),
+        'instances_total': instances['total'],
+        'fines_unpaid': Fine.objects.filter(is_paid=False).count(),
+    }
+
+
+def overdue_count(now=None, limit=None):
+    # A range of loan_open_due_idx; the limit stops the count early
+    overdue = Loan.objects.filter(is_returned=False, due_date__lt=now or timezone.now())
+    return (overdue if limit is None else overdue[:limit]).count()
+
+
+def collection_counts(latest=None):
+    """Gauges for the staff panel: the latest day row, plus the overdue count, which no event moves."""
+    if latest is None:
+        latest = CirculationDay.objects.order_by('-date').first() or CirculationDay()
+    counts = {field: getattr(latest, field) for field in TOTAL_FIELDS}
+    overdue = overdue_count(limit=OVERDUE_COUNT_LIMIT + 1)
+    counts['overdue'] = min(overdue, OVERDUE_COUNT_LIMIT)
+    counts['overdue_more'] = overdue > OVERDUE_COUNT_LIMIT
+    return counts
+
+
+def take_snapshot(day=None):
+    now = timezone.now()
+    values = {**recount(), 'overdue': overdue_count(now), 'snapshot_at': now}
+    row, _ = CirculationDay.objects.update_or_create(date=day or timezone.localdate(), defaults=values)
+    return row
+
+
+def trend(days=90):
+    start = timezone.localdate() - timedelta(days=days - 1)
+    return CirculationDay.objects.filter(date__gte=start).order_by('date')
+
+
+def genre_trend(days=90):
+    start = timezone.localdate() - timedelta(days=days - 1)
+    return (
+        GenreCirculationDay.objects.filter(date__gte=start)
+        .values('genre_id', 'genre__name')
+        .annotate(loans=Sum('loans_issued'))
+        .order_by('-loans')
+    )
+
+
+def rebuild(start, end, include_archive=False):
+    # Archived loans are only read when the range reaches back past archive_loans --older-than
+    tz = timezone.get_current_timezone()
+    lower = timezone.make_aware(datetime.combine(start, time.min), tz)
+    upper = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+
+    rows = {}
+
+    def row(day):
+        if day not in rows:
+            rows[day] = CirculationDay(date=day)
+        return rows[day]
+
+    def grouped(queryset, field, **aggregates):
+        return (
+            queryset.filter(**{f'{field}__gte': lower, f'{field}__lt': upper})
+            .annotate(day=TruncDate(field, tzinfo=tz))
+            .values('day')
+            .annotate(**aggregates)
+        )
+
+    def add_loans(loans, returned):
+        for item in grouped(loans, 'issue_date', n=Count('pk')):
+            row(item['day']).loans_issued += item['n']
+        for item in grouped(returned, 'return_date', n=Count('pk')):
+            row(item['day']).loans_returned += item['n']
+
+    def add_fines(issued, issued_at, paid, paid_at, amount):
+        for item in grouped(issued, issued_at, n=Count('pk'), total=Sum(amount)):
+            row(item['day']).fines_issued += item['n']
+            row(item['day']).fines_issued_amount += item['total'] or 0
+        for item in grouped(paid, paid_at, n=Count('pk'), total=Sum(amount)):
+            row(item['day']).fines_paid += item['n']
+            row(item['day']).fines_paid_amount += item['total'] or 0
+
+    add_loans(Loan.objects.all(), Loan.objects.filter(is_returned=True))
+    add_fines(Fine.objects.all(), 'created_at', Fine.objects.filter(is_paid=True), 'paid_date', 'amount')
+    if include_archive:
+        add_loans(ArchivedLoan.objects.all(), ArchivedLoan.objects.all())
+        fined = ArchivedLoan.objects.filter(fine_amount__isnull=False)
+        add_fines(fined, 'fine_created_at', fined.filter(fine_paid_date__isnull=False), 'fine_paid_date', 'fine_amount')
+
+    # Days that had activity before but none now must be zeroed, not skipped
+    for day in CirculationDay.objects.filter(date__range=(start, end)).values_list('date', flat=True):
+        row(day)
+
+    CirculationDay.objects.bulk_create(
+        rows.values(),
+        update_conflicts=True,
+        unique_fields=['date'],
+        update_fields=COUNTER_FIELDS,
+    )
+
+    genre_loans = [Loan.objects.all()] + ([ArchivedLoan.objects.all()] if include_archive else [])
+    genre_totals = {}
+    for loans in genre_loans:
+        genre_counts = (
+            loans.filter(
+                issue_date__gte=lower, issue_date__lt=upper,
+                book_instance__book__genres__isnull=False,
+            )
+            .annotate(day=TruncDate('issue_date', tzinfo=tz), genre=F('book_instance__book__genres'))
+            .values('day', 'genre')
+            .annotate(n=Count('pk'))
+        )
+        for item in genre_counts:
+            key = (item['day'], item['genre'])
+            genre_totals[key] = genre_totals.get(key, 0) + item['n']
+    genre_rows = [
+        GenreCirculationDay(date=day, genre_id=genre, loans_issued=n)
+        for (day, genre), n in genre_totals.items()
+    ]
+    with transaction.atomic():
+        GenreCirculationDay.objects.filter(date__range=(start, end)).delete()
+        GenreCirculationDay.objects.bulk_create(genre_rows)
+    return len(rows), len(genre_rows)
@@ -1,3 +1,655 @@
-from django.test import TestCase
+import json
+import uuid
+from datetime import datetime, timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from catalog.models import Author, Book, BookInstance
+from .forms import IssueLoanForm, ReturnLoanForm
+from .models import (
+    ArchivedLoan, AuditSession, BookCooccurrence, BookNeighbor, CirculationDay, Loan, Fine, Notification, Reservation,
+    ReturnProfile, ScheduledJob, StationScan,
+)
+from . import archive, audit, notifications, preview, recommendations, scheduler, services, stats, waits
+
+
+def data_queries(context):
+    # Savepoints come from TestCase wrapping every test in a transaction
+    return [q['sql'] for q in context.captured_queries
+            if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'BEGIN'))]
+
+
+class CirculationServiceTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Абай жолы', isbn='9786010000001')
+        self.instance = BookInstance.objects.create(book=self.book, inventory_number='INV-1', qr_code='qr.png')
+        self.reader = User.objects.create_user('reader', email='reader@example.com')
+        self.other = User.objects.create_user('other', email='other@example.com')
+
+    def issue_form(self, username='reader'):
+        form = IssueLoanForm({'inventory_number': 'STEPPE-LIB:INV-1', 'borrower_username': username})
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def return_form(self):
+        form = ReturnLoanForm({'inventory_number': 'INV-1'})
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def test_issue_query_budget(self):
+        form = self.issue_form()
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as context:
+                loan = services.issue_loan(form.book_instance, form.borrower)
+        self.assertLessEqual(len(data_queries(context)), 5, data_queries(context))
+        self.book.refresh_from_db()
+        self.assertGreater(self.book.popularity, 0)
+        self.instance.refresh_from_db()
+        self.assertEqual(self.instance.status, 'on_loan')
+        self.assertEqual(loan.borrower, self.reader)
+
+    def test_return_query_budget(self):
+        loan = services.issue_loan(self.issue_form().book_instance, self.reader)
+        Loan.objects.filter(pk=loan.pk).update(due_date=timezone.now() - timedelta(days=3))
+        form = self.return_form()
+        with CaptureQueriesContext(connection) as context:
+            fine, next_reservation = services.return_loan(form.loan)
+        self.assertLessEqual(len(data_queries(context)), 5, data_queries(context))
+        self.assertEqual(fine.amount, 3 * settings.FINE_PER_DAY_KZT)
+        self.assertIsNone(next_reservation)
+        self.instance.refresh_from_db()
+        self.assertEqual(self.instance.status, 'available')
+
+    def test_return_keeps_accrued_fine(self):
+        loan = services.issue_loan(self.issue_form().book_instance, self.reader)
+        Loan.objects.filter(pk=loan.pk).update(due_date=timezone.now() - timedelta(days=3))
+        accrued = Fine.objects.create(loan=loan, amount=200)
+        fine, _ = services.return_loan(self.return_form().loan)
+        self.assertEqual(fine.pk, accrued.pk)
+        self.assertEqual(Fine.objects.count(), 1)
+
+    def test_second_desk_cannot_issue_same_copy(self):
+        first, second = self.issue_form(), self.issue_form('other')
+        services.issue_loan(first.book_instance, first.borrower)
+        with self.assertRaises(services.CirculationConflict):
+            services.issue_loan(second.book_instance, second.borrower)
+        self.assertEqual(Loan.objects.count(), 1)
+
+    def test_second_desk_cannot_return_twice(self):
+        services.issue_loan(self.issue_form().book_instance, self.reader)
+        first, second = self.return_form(), self.return_form()
+        services.return_loan(first.loan)
+        with self.assertRaises(services.CirculationConflict):
+            services.return_loan(second.loan)
+        self.instance.refresh_from_db()
+        self.assertEqual(self.instance.status, 'available')
+
+    def test_return_holds_copy_for_next_reservation(self):
+        services.issue_loan(self.issue_form().book_instance, self.reader)
+        reservation = Reservation.objects.create(user=self.other, book=self.book)
+        _, next_reservation = services.return_loan(self.return_form().loan)
+        self.assertEqual(next_reservation, reservation)
+        reservation.refresh_from_db()
+        self.assertTrue(reservation.notified)
+        self.instance.refresh_from_db()
+        self.assertEqual(self.instance.status, 'reserved')
+
+
+class StaffPanelTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Абай жолы', isbn='9786010000003')
+        self.reader = User.objects.create_user('reader')
+        librarian = User.objects.create_user('librarian')
+        UserProfile.objects.filter(user=librarian).update(role='librarian')
+        self.client.force_login(librarian)
+
+    def issue(self, n, overdue=False):
+        instance = BookInstance.objects.create(book=self.book, inventory_number=f'INV-S{n}', qr_code='qr.png')
+        loan = services.issue_loan(instance, self.reader)
+        if overdue:
+            Loan.objects.filter(pk=loan.pk).update(due_date=timezone.now() - timedelta(days=n + 1))
+
+    def counts(self):
+        counts = self.client.get('/staff/').context['counts']
+        return {field: counts[field] for field in stats.TOTAL_FIELDS}
+
+    def test_gauges_follow_circulation_and_catalog_edits(self):
+        # A snapshot from earlier today must not hide what happened since
+        stats.take_snapshot()
+        self.issue(0)
+        self.issue(1, overdue=True)
+        loan = Loan.objects.select_related('book_instance__book').get(book_instance__inventory_number='INV-S1')
+        fine, _ = services.return_loan(loan)
+        self.assertEqual(self.counts(), stats.recount())
+        services.pay_fine(fine)
+        BookInstance.objects.create(book=self.book, inventory_number='INV-LOST', status='lost', qr_code='qr.png')
+        instance = BookInstance.objects.get(inventory_number='INV-S1')
+        instance.status = 'on_loan'
+        instance.save()
+        Book.objects.create(title='Қара сөздер', isbn='9786010000005')
+        self.assertEqual(self.counts(), stats.recount())
+        self.assertEqual(self.counts(), {'on_loan': 2, 'books_total': 2, 'instances_total': 3, 'fines_unpaid': 0})
+        self.book.delete()
+        self.assertEqual(self.counts(), {'on_loan': 0, 'books_total': 1, 'instances_total': 0, 'fines_unpaid': 0})
+
+    def test_panel_reads_the_latest_row_instead_of_counting(self):
+        for n in range(3):
+            self.issue(n)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/staff/')
+        sql = ' '.join(data_queries(context))
+        self.assertNotIn('FROM "catalog_book"', sql)
+        self.assertNotIn('FROM "catalog_bookinstance"', sql)
+        self.assertNotIn('FROM "loans_fine"', sql)
+
+    def test_a_new_day_starts_from_the_last_row(self):
+        CirculationDay.objects.all().delete()
+        CirculationDay.objects.create(
+            date=timezone.localdate() - timedelta(days=3), on_loan=7, books_total=5, instances_total=9, fines_unpaid=2,
+        )
+        self.issue(0)
+        today = CirculationDay.objects.get(date=timezone.localdate())
+        self.assertEqual((today.loans_issued, today.on_loan, today.instances_total, today.books_total), (1, 8, 10, 5))
+
+    def test_overdue_badge_counts_past_the_listed_loans(self):
+        for n in range(25):
+            self.issue(n, overdue=True)
+        response = self.client.get('/staff/')
+        self.assertEqual(response.context['counts']['overdue'], 25)
+        self.assertEqual(len(response.context['overdue_loans']), 20)
+        self.assertContains(response, 'Показаны самые давние 20 из 25')
+
+        with mock.patch.object(stats, 'OVERDUE_COUNT_LIMIT', 22):
+            response = self.client.get('/staff/')
+        self.assertContains(response, 'Показаны самые давние 20 из 22+')
+
+    def test_raised_fines_match_a_rebuild(self):
+        self.issue(3, overdue=True)
+        call_command('calculate_fines', stdout=StringIO())
+        # Calculated a day earlier, the fine has grown since
+        Fine.objects.update(amount=F('amount') - settings.FINE_PER_DAY_KZT)
+        CirculationDay.objects.update(fines_issued_amount=F('fines_issued_amount') - settings.FINE_PER_DAY_KZT)
+        call_command('calculate_fines', stdout=StringIO())
+        counted = CirculationDay.objects.get().fines_issued_amount
+        stats.rebuild(timezone.localdate(), timezone.localdate())
+        self.assertEqual(CirculationDay.objects.get().fines_issued_amount, counted)
+        self.assertEqual(counted, 4 * settings.FINE_PER_DAY_KZT)
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        raise SMTPException('421 try again later')
+
+
+class DroppingEmailBackend(locmem.EmailBackend):
+    # Rejects the second message, then cannot reconnect
+    def open(self):
+        if getattr(self, 'opened', False):
+            raise SMTPException('connection refused')
+        self.opened = True
+
+    def send_messages(self, messages):
+        if len(mail.outbox) == 1:
+            raise SMTPException('421 try again later')
+        return super().send_messages(messages)
+
+
+class NotificationTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Абай жолы', isbn='9786010000004')
+        self.instance = BookInstance.objects.create(book=self.book, inventory_number='INV-N', qr_code='qr.png')
+        self.reader = User.objects.create_user('reader', email='reader@example.com')
+        self.waiting = User.objects.create_user('waiting', email='waiting@example.com')
+
+    def hold_ready(self):
+        services.issue_loan(self.instance, self.reader)
+        Reservation.objects.create(user=self.waiting, book=self.book)
+        loan = Loan.objects.select_related('book_instance__book').get()
+        _, reservation = services.return_loan(loan)
+        return reservation
+
+    def test_hold_ready_is_sent_once(self):
+        reservation = self.hold_ready()
+        # A second enqueue of the same event is a no-op
+        notifications.queue_hold_ready(reservation, self.book)
+        self.assertEqual(Notification.objects.count(), 1)
+
+        self.assertEqual(notifications.dispatch()['sent'], 1)
+        self.assertEqual(notifications.dispatch()['sent'], 0)
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['waiting@example.com'])
+        self.assertIn('Абай жолы', message.subject)
+        self.assertEqual(message.extra_headers['X-Idempotency-Key'], f'hold-ready:{reservation.pk}')
+        notification = Notification.objects.get()
+        self.assertEqual((notification.status, notification.attempts, notification.locked_by), ('sent', 1, ''))
+
+    def test_due_reminders_are_queued_once_per_due_date(self):
+        loan = services.issue_loan(self.instance, self.reader)
+        Loan.objects.filter(pk=loan.pk).update(due_date=timezone.now() + timedelta(days=1))
+        self.assertEqual(notifications.queue_due_reminders(2), 1)
+        notifications.queue_due_reminders(2)
+        self.assertEqual(Notification.objects.filter(kind='due_reminder').count(), 1)
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=3, NOTIFICATION_RETRY_BASE_SECONDS=60)
+    def test_failed_sends_back_off_then_give_up(self):
+        self.hold_ready()
+        for attempt, delay in [(1, 60), (2, 120)]:
+            before = timezone.now()
+            self.assertEqual(notifications.dispatch(connection=FailingEmailBackend())['retried'], 1)
+            notification = Notification.objects.get()
+            self.assertEqual((notification.status, notification.attempts), ('pending', attempt))
+            self.assertIn('SMTPException', notification.last_error)
+            self.assertAlmostEqual((notification.next_attempt_at - before).total_seconds(), delay, delta=5)
+            # Not due yet: nothing is claimed
+            self.assertEqual(notifications.dispatch(connection=FailingEmailBackend())['batches'], 0)
+            Notification.objects.update(next_attempt_at=timezone.now())
+
+        self.assertEqual(notifications.dispatch(connection=FailingEmailBackend())['failed'], 1)
+        self.assertEqual(Notification.objects.get().status, 'failed')
+        self.assertEqual(notifications.dispatch()['batches'], 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_failed_reconnect_keeps_the_outcomes_of_the_batch(self):
+        for n in range(3):
+            Notification.objects.create(
+                user=self.waiting, kind='hold_ready', idempotency_key=f'key-{n}', email='waiting@example.com',
+                subject=f'Письмо {n}', body='...',
+            )
+        with self.assertRaises(SMTPException):
+            notifications.dispatch(connection=DroppingEmailBackend())
+        states = Notification.objects.values_list('status', 'attempts')
+        # Sent once, due for a retry, and untouched until its lease runs out
+        self.assertCountEqual(states, [('sent', 1), ('pending', 1), ('sending', 0)])
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_lease_of_a_dead_dispatcher_expires(self):
+        self.hold_ready()
+        # A dispatcher claimed the row and died before sending
+        Notification.objects.update(
+            status='sending', locked_by='dead', next_attempt_at=timezone.now() + timedelta(minutes=5),
+        )
+        self.assertEqual(notifications.dispatch()['batches'], 0)
+        Notification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(notifications.dispatch()['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class FineBalanceTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(title='Көшпенділер', isbn='9786010000002')
+        self.reader = User.objects.create_user('reader')
+        self.loans = [
+            Loan.objects.create(
+                borrower=self.reader,
+                book_instance=BookInstance.objects.create(book=book, inventory_number=f'INV-{n}', qr_code='qr.png'),
+            )
+            for n in range(2)
+        ]
+
+    def balance(self):
+        profile = UserProfile.objects.get(user=self.reader)
+        return profile.unpaid_fines_total, profile.unpaid_fines_count
+
+    def test_balance_follows_fines(self):
+        first = Fine.objects.create(loan=self.loans[0], amount=400)
+        second = Fine.objects.create(loan=self.loans[1], amount=200)
+        self.assertEqual(self.balance(), (600, 2))
+
+        first = Fine.objects.get(pk=first.pk)
+        first.amount = 600
+        first.save(update_fields=['amount'])
+        self.assertEqual(self.balance(), (800, 2))
+
+        second.is_paid = True
+        second.save()
+        self.assertEqual(self.balance(), (600, 1))
+        self.assertTrue(UserProfile.objects.get(user=self.reader).has_unpaid_fines)
+
+        first.delete()
+        self.assertEqual(self.balance(), (0, 0))
+
+    def test_second_payment_of_a_fine_changes_nothing(self):
+        fine = Fine.objects.create(loan=self.loans[0], amount=400)
+        # Both desks loaded the fine while it was still unpaid
+        first, second = Fine.objects.get(pk=fine.pk), Fine.objects.get(pk=fine.pk)
+        services.pay_fine(first)
+        with self.assertRaises(services.CirculationConflict):
+            services.pay_fine(second)
+        self.assertEqual(self.balance(), (0, 0))
+        self.assertEqual(CirculationDay.objects.get().fines_paid, 1)
+
+    def test_reconcile_repairs_drift(self):
+        Fine.objects.create(loan=self.loans[0], amount=400)
+        UserProfile.objects.filter(user=self.reader).update(unpaid_fines_total=0, unpaid_fines_count=0)
+        call_command('reconcile_fine_balances', stdout=StringIO())
+        self.assertEqual(self.balance(), (400, 1))
+
+
+class LoanArchiveTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(title='Қара сөздер', isbn='9786010000003')
+        self.instance = BookInstance.objects.create(book=book, inventory_number='INV-A', qr_code='qr.png')
+        self.reader = User.objects.create_user('reader')
+
+    def closed_loan(self, days_ago, fine=None, paid=False):
+        returned = timezone.now() - timedelta(days=days_ago)
+        loan = Loan.objects.create(
+            borrower=self.reader, book_instance=self.instance, issue_date=returned - timedelta(days=10),
+            due_date=returned - timedelta(days=5), return_date=returned, is_returned=True,
+        )
+        if fine is not None:
+            Fine.objects.create(loan=loan, amount=fine, is_paid=paid, paid_date=returned if paid else None)
+        return loan
+
+    def test_moves_only_old_settled_loans(self):
+        settled = self.closed_loan(400)
+        paid = self.closed_loan(400, fine=1000, paid=True)
+        unpaid = self.closed_loan(400, fine=1000)
+        recent = self.closed_loan(10)
+
+        self.assertEqual(archive.archive_batch(365), 2)
+        self.assertEqual(archive.archive_batch(365), 0)
+        self.assertEqual(set(Loan.objects.values_list('pk', flat=True)), {unpaid.pk, recent.pk})
+        self.assertEqual(ArchivedLoan.objects.get(pk=paid.pk).fine_amount, 1000)
+        self.assertIsNone(ArchivedLoan.objects.get(pk=settled.pk).fine_amount)
+        self.assertEqual(UserProfile.objects.get(user=self.reader).unpaid_fines_total, 1000)
+
+    def test_history_unions_archive_on_request(self):
+        old = self.closed_loan(400)
+        recent = self.closed_loan(10)
+        archive.archive_batch(365)
+        self.assertEqual([row['id'] for row in archive.history(self.reader)], [recent.pk])
+        rows = list(archive.history(self.reader, include_archive=True))
+        self.assertEqual([(row['id'], row['archived']) for row in rows], [(recent.pk, False), (old.pk, True)])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(title=f'Книга {i}', isbn=f'978601000010{i}') for i in range(4)]
+        self.instances = [
+            BookInstance.objects.create(book=book, inventory_number=f'INV-R{i}', qr_code='qr.png')
+            for i, book in enumerate(self.books)
+        ]
+        self.readers = [User.objects.create_user(f'reader{i}') for i in range(4)]
+
+    def borrow(self, reader, *indexes):
+        now = timezone.now()
+        for i in indexes:
+            Loan.objects.create(
+                borrower=reader, book_instance=self.instances[i], issue_date=now,
+                due_date=now + timedelta(days=14), return_date=now, is_returned=True,
+            )
+
+    def state(self):
+        counts = set(BookCooccurrence.objects.values_list('book_id', 'other_id', 'count'))
+        neighbors = list(BookNeighbor.objects.values_list('book_id', 'neighbor_id', 'rank'))
+        return counts, neighbors
+
+    def test_incremental_update_matches_full_rebuild(self):
+        self.borrow(self.readers[0], 0, 1, 2)
+        self.borrow(self.readers[1], 0, 1)
+        recommendations.update()
+        self.borrow(self.readers[1], 2, 0)
+        self.borrow(self.readers[2], 0, 2, 3)
+        archive.archive_batch(0)
+        self.borrow(self.readers[3], 2, 3)
+
+        run = recommendations.update()
+        self.assertFalse(run.full)
+        self.assertEqual(run.pairs_added, 6)
+        incremental = self.state()
+        self.assertTrue(recommendations.update(full=True).full)
+        self.assertEqual(self.state(), incremental)
+
+    def test_full_rebuild_merges_its_pair_batches(self):
+        self.borrow(self.readers[0], 0, 1, 2)
+        self.borrow(self.readers[1], 0, 1)
+        self.borrow(self.readers[2], 3, 1)
+        recommendations.update(full=True)
+        counts, _ = self.state()
+        self.assertIn((self.books[0].pk, self.books[1].pk, 2), counts)
+        self.assertIn((self.books[1].pk, self.books[1].pk, 3), counts)
+        # One merge per reader shelf instead of one at the end
+        with mock.patch.object(recommendations, 'PAIR_BUFFER', 1):
+            recommendations.update(full=True)
+        self.assertEqual(self.state()[0], counts)
+
+    def test_related_books_ranks_neighbors_and_falls_back_to_author(self):
+        self.borrow(self.readers[0], 0, 1, 2)
+        self.borrow(self.readers[1], 0, 1)
+        recommendations.update()
+        # Book 2 shares a single reader with book 0, below the support threshold
+        self.assertEqual(recommendations.related_books(self.books[0]), [self.books[1]])
+
+        author = Author.objects.create(first_name='Абай', last_name='Кунанбаев')
+        self.books[2].authors.add(author)
+        self.books[3].authors.add(author)
+        self.assertEqual(recommendations.related_books(self.books[3]), [self.books[2]])
+
+
+class WaitEstimateTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Путь Абая', isbn='9786010000301')
+        self.instance = BookInstance.objects.create(book=self.book, inventory_number='INV-W', qr_code='qr.png')
+        self.reader = User.objects.create_user('reader')
+
+    def returned(self, late_days, kept_days):
+        returned = timezone.now() - timedelta(days=30)
+        Loan.objects.create(
+            borrower=self.reader, book_instance=self.instance, issue_date=returned - timedelta(days=kept_days),
+            due_date=returned - timedelta(days=late_days), return_date=returned, is_returned=True,
+        )
+
+    def test_profiles_use_own_history_or_library_pool(self):
+        other = Book.objects.create(title='Қан мен тер', isbn='9786010000302')
+        for late in range(6):
+            self.returned(late, 14 + late)
+        waits.rebuild_profiles()
+        own = ReturnProfile.objects.get(book=self.book)
+        self.assertFalse(own.pooled)
+        self.assertEqual((own.samples, own.delay_p50, own.duration_p50), (6, 2.5, 16.5))
+        pooled = ReturnProfile.objects.get(book=other)
+        self.assertTrue(pooled.pooled)
+        self.assertEqual(pooled.delay_p50, own.delay_p50)
+
+    def test_queue_takes_turns_on_returned_copies(self):
+        due = timezone.now() + timedelta(days=5)
+        Loan.objects.create(borrower=self.reader, book_instance=self.instance, due_date=due)
+        BookInstance.objects.filter(pk=self.instance.pk).update(status='on_loan')
+        ReturnProfile.objects.create(
+            book=self.book, delay_p50=2, delay_p80=4, duration_p50=10, duration_p80=12,
+        )
+        with self.assertNumQueries(3):
+            first, second = waits.estimate([(self.book.pk, 1), (self.book.pk, 2)])
+        self.assertEqual(first, (timezone.localdate(due + timedelta(days=2)), timezone.localdate(due + timedelta(days=4))))
+        self.assertEqual(second.expected, timezone.localdate(due + timedelta(days=12)))
+        self.assertEqual(second.latest, timezone.localdate(due + timedelta(days=16)))
+
+    def test_dashboard_positions_do_not_query_per_reservation(self):
+        other = User.objects.create_user('other')
+        books = [Book.objects.create(title=f'Книга {n}', isbn=f'97860100004{n:02d}') for n in range(4)]
+
+        def reserve(book, behind_someone):
+            if behind_someone:
+                Reservation.objects.create(user=other, book=book)
+            Reservation.objects.create(user=self.reader, book=book)
+
+        def dashboard():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/dashboard/')
+            return len(context.captured_queries), response
+
+        self.client.force_login(self.reader)
+        reserve(books[0], behind_someone=False)
+        few, _ = dashboard()
+        for n, book in enumerate(books[1:], 1):
+            reserve(book, behind_someone=n % 2)
+        many, response = dashboard()
+        self.assertEqual(many, few)
+        positions = {res.book_id: res.position for res in response.context['active_reservations']}
+        self.assertEqual(positions, {books[0].pk: 1, books[1].pk: 2, books[2].pk: 1, books[3].pk: 2})
+
+
+class InventoryAuditTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Абай жолы', isbn='9786010000401')
+        other = Book.objects.create(title='Көшпенділер', isbn='9786010000402')
+        for number, status in [('A', 'available'), ('B', 'available'), ('C', 'on_loan'), ('D', 'lost')]:
+            BookInstance.objects.create(book=self.book, inventory_number=number, status=status, qr_code='qr.png')
+        BookInstance.objects.create(book=other, inventory_number='E', qr_code='qr.png')
+        self.session = AuditSession.objects.create(book=self.book)
+
+    def test_reconcile_and_write_off_missing(self):
+        seen = audit.record_scans(self.session, ['STEPPE-LIB:A', 'A', ' C\n', 'E', 'X', ''])
+        self.assertEqual(seen, 4)
+        audit.reconcile(self.session)
+        self.assertEqual(
+            (self.session.expected, self.session.missing, self.session.misstatus, self.session.unexpected),
+            (2, 1, 1, 2),
+        )
+        self.assertEqual([copy.inventory_number for copy in audit.report(self.session)['missing']], ['B'])
+
+        self.assertEqual(audit.mark_missing_lost(self.session), 1)
+        self.assertEqual(BookInstance.objects.get(inventory_number='B').status, 'lost')
+        self.assertEqual(BookInstance.objects.get(inventory_number='A').status, 'available')
+        self.assertEqual(self.session.status, 'closed')
+
+
+class StationSyncTests(TestCase):
+    def setUp(self):
+        book = Book.objects.create(title='Абай жолы', isbn='9786010000501')
+        BookInstance.objects.create(book=book, inventory_number='INV-S1', qr_code='qr.png')
+        BookInstance.objects.create(book=book, inventory_number='INV-S2', qr_code='qr.png')
+        self.reader = User.objects.create_user('reader')
+        self.librarian = User.objects.create_user('librarian')
+        UserProfile.objects.filter(user=self.librarian).update(role='librarian')
+        self.client.force_login(self.librarian)
+
+    def sync(self, scans):
+        response = self.client.post('/staff/station/sync/', json.dumps({'scans': scans}), content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(r['result'], r['message']) for r in response.json()['results']]
+
+    def test_batch_applies_in_scan_order_and_replays_idempotently(self):
+        issued_at = timezone.now() - timedelta(hours=5)
+        scans = [
+            {'id': str(uuid.uuid4()), 'action': 'return', 'inventory_number': 'INV-S1',
+             'scanned_at': (issued_at + timedelta(hours=1)).isoformat()},
+            {'id': str(uuid.uuid4()), 'action': 'issue', 'inventory_number': 'STEPPE-LIB:INV-S1',
+             'borrower': 'reader', 'scanned_at': issued_at.isoformat()},
+            {'id': str(uuid.uuid4()), 'action': 'issue', 'inventory_number': 'INV-S2',
+             'borrower': 'nobody', 'scanned_at': issued_at.isoformat()},
+        ]
+        first = self.sync(scans)
+        self.assertEqual([result for result, _ in first], ['ok', 'ok', 'rejected'])
+        loan = Loan.objects.get(book_instance__inventory_number='INV-S1')
+        self.assertTrue(loan.is_returned)
+        self.assertAlmostEqual(loan.issue_date, issued_at, delta=timedelta(seconds=1))
+
+        # The station never saw the answer and sends the same batch again
+        self.assertEqual(self.sync(scans), first)
+        self.assertEqual(Loan.objects.count(), 1)
+        self.assertEqual(StationScan.objects.count(), 3)
+
+
+class ScanPreviewTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Абай жолы', isbn='9786010000601')
+        self.instance = BookInstance.objects.create(book=self.book, inventory_number='INV-P', qr_code='qr.png')
+        self.reader = User.objects.create_user('reader', first_name='Алия', last_name='Серик')
+        preview._cache.clear()
+        preview._by_book.clear()
+
+    def test_one_query_then_cached_until_status_changes(self):
+        with self.assertNumQueries(1):
+            data = preview.scan_preview('INV-P')
+        self.assertTrue(data['can_issue'])
+        self.assertIsNone(data['loan'])
+        with self.assertNumQueries(0):
+            preview.scan_preview('INV-P')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.issue_loan(self.instance, self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            Reservation.objects.create(user=User.objects.create_user('other'), book=self.book)
+        data = preview.scan_preview('INV-P')
+        self.assertEqual(data['status'], 'on_loan')
+        self.assertEqual(data['loan']['borrower'], {'username': 'reader', 'name': 'Алия Серик'})
+        self.assertEqual((data['next_reservation']['username'], data['queue']), ('other', 1))
+        self.assertTrue(data['can_return'])
+        self.assertFalse(data['overdue'])
+
+
+class SchedulerTests(TestCase):
+    def test_cron_next_run(self):
+        friday_evening = timezone.make_aware(datetime(2026, 10, 16, 17, 50))
+        self.assertEqual(
+            scheduler.Cron('*/15 9-17 * * 1-5').next_after(friday_evening),
+            timezone.make_aware(datetime(2026, 10, 19, 9, 0)),
+        )
+        # Both day fields restricted: the 1st of the month or any Sunday
+        self.assertEqual(
+            scheduler.Cron('0 3 1 * 0').next_after(friday_evening),
+            timezone.make_aware(datetime(2026, 10, 18, 3, 0)),
+        )
+        with self.assertRaises(ValueError):
+            scheduler.Cron('0 25 * * *')
+
+    @override_settings(SCHEDULER_JOBS={
+        'expire_reservations': {'every': 60, 'jitter': 0},
+        'broken': {'command': 'expire_reservations', 'args': ['--no-such-option'], 'every': 60, 'jitter': 0},
+    })
+    def test_due_job_runs_once_under_the_lease(self):
+        jobs = {job.name: job for job in scheduler.jobs()}
+        scheduler.sync(list(jobs.values()), now=timezone.now() - timedelta(minutes=2))
+
+        ScheduledJob.objects.filter(name='expire_reservations').update(
+            lease_owner='other', lease_until=timezone.now() + timedelta(minutes=5),
+        )
+        self.assertIsNone(scheduler.run_if_due(jobs['expire_reservations'], 'me'))
+
+        ScheduledJob.objects.update(lease_owner='', lease_until=None)
+        status, _ = scheduler.run_if_due(jobs['expire_reservations'], 'me')
+        self.assertEqual(status, 'ok')
+        self.assertIsNone(scheduler.run_if_due(jobs['expire_reservations'], 'me'))
+        job = ScheduledJob.objects.get(name='expire_reservations')
+        self.assertEqual((job.last_status, job.run_count, job.lease_owner), ('ok', 1, ''))
+        self.assertIn('Снято броней: 0', job.last_output)
+        self.assertGreater(job.next_run_at, timezone.now() + timedelta(seconds=50))
+
+        with self.assertLogs('loans.scheduler', 'ERROR'):
+            self.assertEqual(scheduler.run_if_due(jobs['broken'], 'me')[0], 'failed')
+        self.assertEqual(ScheduledJob.objects.get(name='broken').failure_count, 1)
+
+    def test_expired_hold_passes_to_the_next_reader(self):
+        book = Book.objects.create(title='Көшпенділер', isbn='9786010000801')
+        instance = BookInstance.objects.create(book=book, inventory_number='INV-H', qr_code='qr.png', status='reserved')
+        first, second = (User.objects.create_user(name, email=f'{name}@example.com') for name in ('first', 'second'))
+        stale = timezone.now() - timedelta(hours=settings.RESERVATION_EXPIRY_HOURS + 1)
+        held = Reservation.objects.create(user=first, book=book, notified=True, notified_at=stale)
+        waiting = Reservation.objects.create(user=second, book=book)
+
+        self.assertEqual(services.expire_reservations(), 1)
+        held.refresh_from_db()
+        waiting.refresh_from_db()
+        self.assertFalse(held.is_active)
+        self.assertTrue(waiting.notified)
+
+        Reservation.objects.filter(pk=waiting.pk).update(notified_at=stale)
+        self.assertEqual(services.expire_reservations(), 1)
+        instance.refresh_from_db()
+        self.assertEqual(instance.status, 'available')
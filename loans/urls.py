@@ -5,8 +5,10 @@ app_name = 'loans'
 
 urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('history/', views.loan_history, name='loan_history'),
     path('reserve/<int:book_id>/', views.reserve_book, name='reserve_book'),
     path('cancel-reservation/<int:reservation_id>/', views.cancel_reservation, name='cancel_reservation'),
+    path('events/book/<int:book_id>/', views.book_events, name='book_events'),
 
     # Staff
     path('staff/', views.staff_panel, name='staff_panel'),
@@ -17,4 +19,16 @@ urlpatterns = [
     path('staff/add-author/', views.add_author, name='add_author'),
     path('staff/add-instance/<int:book_id>/', views.add_instance, name='add_instance'),
     path('staff/qr/<uuid:instance_id>/', views.view_qr, name='view_qr'),
+    path('staff/scan-preview/<str:inventory_number>/', views.scan_preview, name='scan_preview'),
+    path('staff/station/', views.station, name='station'),
+    path('staff/station/sw.js', views.station_worker, name='station_worker'),
+    path('staff/station/manifest.webmanifest', views.station_manifest, name='station_manifest'),
+    path('staff/station/sync/', views.station_sync, name='station_sync'),
+    path('staff/audit/', views.audit_list, name='audit_list'),
+    path('staff/audit/<int:session_id>/', views.audit_session, name='audit_session'),
+    path('staff/audit/<int:session_id>/scan/', views.audit_scan, name='audit_scan'),
+    path('staff/audit/<int:session_id>/export/<str:kind>/', views.audit_export, name='audit_export'),
+    path('staff/profiles/', views.profiles, name='profiles'),
+    path('staff/profiles/<str:name>/<str:kind>/', views.profile_download, name='profile_download'),
+    path('staff/events/', views.staff_events, name='staff_events'),
 ]
@@ -1,13 +1,25 @@
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
+from django.conf import settings
 from django.contrib import messages
 from django.utils import timezone
-from django.conf import settings
-
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.core.paginator import Paginator
+
+from catalog import popularity
 from catalog.models import Book, BookInstance
-from .models import Loan, Fine, Reservation
-from .forms import IssueLoanForm, ReturnLoanForm
+from steppelibrary import metrics, profiling
+from steppelibrary.db import immediate_atomic
+from .models import AuditSession, Loan, Fine, Reservation, ScheduledJob
+from .forms import AuditSessionForm, AuditUploadForm, IssueLoanForm, ReturnLoanForm
+from . import archive, audit, preview, services, stats, waits
+from . import station as station_service
 
 
 def librarian_required(view_func):
@@ -35,11 +47,18 @@ def dashboard(request):
         loan__borrower=request.user, is_paid=False
     ).select_related('loan__book_instance__book')
 
-    active_reservations = Reservation.objects.filter(
+    # Reservation.queue_position, computed in the same query for every row
+    ahead = Reservation.objects.filter(
+        book=OuterRef('book'), is_active=True, created_at__lt=OuterRef('created_at')
+    ).order_by().values('book').annotate(n=Count('pk')).values('n')
+    active_reservations = list(Reservation.objects.filter(
         user=request.user, is_active=True
-    ).select_related('book')
+    ).select_related('book').annotate(position=Coalesce(Subquery(ahead), 0) + 1))
+    waiting = [res for res in active_reservations if not res.notified]
+    for res, wait in zip(waiting, waits.estimate([(res.book_id, res.position) for res in waiting])):
+        res.wait = wait
 
-    total_fines = sum(f.amount for f in unpaid_fines)
+    total_fines = request.user.profile.unpaid_fines_total if hasattr(request.user, 'profile') else 0
 
     return render(request, 'loans/dashboard.html', {
         'active_loans': active_loans,
@@ -50,6 +69,16 @@ def dashboard(request):
     })
 
 
+@login_required
+def loan_history(request):
+    include_archive = request.GET.get('archive') == '1'
+    paginator = Paginator(archive.history(request.user, include_archive), 25)
+    return render(request, 'loans/history.html', {
+        'loans': paginator.get_page(request.GET.get('page')),
+        'include_archive': include_archive,
+    })
+
+
 @login_required
 def reserve_book(request, book_id):
     book = get_object_or_404(Book, pk=book_id)
@@ -67,7 +96,13 @@ def reserve_book(request, book_id):
         messages.info(request, 'Книга есть в наличии, бронирование не требуется.')
         return redirect('catalog:book_detail', pk=book_id)
 
-    reservation = Reservation.objects.create(user=request.user, book=book)
+    with immediate_atomic():
+        reservation = Reservation.objects.create(user=request.user, book=book)
+        # Scored after the commit, outside the write lock, as issue_loan does
+        transaction.on_commit(
+            lambda: popularity.record(book.pk, popularity.RESERVATION_WEIGHT, reservation.created_at)
+        )
+        transaction.on_commit(metrics.RESERVATIONS_CREATED.inc)
     messages.success(request, f'Вы встали в очередь. Ваша позиция: {reservation.queue_position}')
     return redirect('catalog:book_detail', pk=book_id)
 
@@ -76,7 +111,8 @@ def reserve_book(request, book_id):
 def cancel_reservation(request, reservation_id):
     reservation = get_object_or_404(Reservation, pk=reservation_id, user=request.user, is_active=True)
     reservation.is_active = False
-    reservation.save()
+    with immediate_atomic():
+        reservation.save()
     messages.success(request, 'Бронирование отменено.')
     return redirect('loans:dashboard')
 
@@ -91,23 +127,18 @@ def staff_panel(request):
 
     overdue_loans = Loan.objects.filter(
         is_returned=False, due_date__lt=timezone.now()
-    ).select_related('borrower', 'book_instance__book')
+    ).select_related('borrower', 'book_instance__book').order_by('due_date')[:20]
 
-    unpaid_fines = Fine.objects.filter(is_paid=False).select_related(
-        'loan__borrower', 'loan__book_instance__book'
-    )
-
-    total_books = Book.objects.count()
-    total_instances = BookInstance.objects.count()
-    on_loan = BookInstance.objects.filter(status='on_loan').count()
+    days = list(stats.trend(days=7))
+    today = days[-1] if days and days[-1].date == timezone.localdate() else None
 
     return render(request, 'loans/staff_panel.html', {
         'recent_loans': recent_loans,
         'overdue_loans': overdue_loans,
-        'unpaid_fines': unpaid_fines,
-        'total_books': total_books,
-        'total_instances': total_instances,
-        'on_loan': on_loan,
+        'counts': stats.collection_counts(days[-1] if days else None),
+        'today': today,
+        'week': days,
+        'jobs': ScheduledJob.objects.all(),
     })
 
 
@@ -116,22 +147,12 @@ def issue_book(request):
     if request.method == 'POST':
         form = IssueLoanForm(request.POST)
         if form.is_valid():
-            inv = form.cleaned_data['inventory_number']
-            username = form.cleaned_data['borrower_username']
-            instance = BookInstance.objects.get(inventory_number=inv)
-            borrower = User.objects.get(username=username)
-
-            loan = Loan.objects.create(
-                borrower=borrower,
-                book_instance=instance,
-            )
-            instance.status = 'on_loan'
-            instance.save()
-
-            # Cancel reservation if exists
-            Reservation.objects.filter(
-                user=borrower, book=instance.book, is_active=True
-            ).update(is_active=False)
+            instance, borrower = form.book_instance, form.borrower
+            try:
+                loan = services.issue_loan(instance, borrower)
+            except services.CirculationConflict as exc:
+                form.add_error(None, str(exc))
+                return render(request, 'loans/issue_book.html', {'form': form})
 
             messages.success(
                 request,
@@ -149,50 +170,27 @@ def return_book(request):
     if request.method == 'POST':
         form = ReturnLoanForm(request.POST)
         if form.is_valid():
-            inv = form.cleaned_data['inventory_number']
-            instance = BookInstance.objects.get(inventory_number=inv)
-            loan = Loan.objects.filter(
-                book_instance=instance, is_returned=False
-            ).first()
-
-            loan.is_returned = True
-            loan.return_date = timezone.now()
-            loan.save()
-
-            # Check overdue and create fine
-            if loan.due_date < timezone.now():
-                days = (timezone.now() - loan.due_date).days
-                amount = days * settings.FINE_PER_DAY_KZT
-                Fine.objects.get_or_create(
-                    loan=loan,
-                    defaults={'amount': amount}
-                )
+            loan = form.loan
+            try:
+                fine, next_reservation = services.return_loan(loan)
+            except services.CirculationConflict as exc:
+                form.add_error(None, str(exc))
+                return render(request, 'loans/return_book.html', {'form': form})
+
+            if fine is not None and not fine.is_paid:
+                days = (loan.return_date - loan.due_date).days
                 messages.warning(
                     request,
                     f'Книга возвращена с опозданием на {days} дней. '
-                    f'Штраф: {amount} KZT.'
+                    f'Штраф: {fine.amount} KZT.'
                 )
             else:
-                messages.success(request, f'Книга "{instance.book.title}" успешно возвращена.')
-
-            # Check reservation queue
-            next_reservation = Reservation.objects.filter(
-                book=instance.book, is_active=True, notified=False
-            ).order_by('created_at').first()
-
+                messages.success(request, f'Книга "{loan.book_instance.book.title}" успешно возвращена.')
             if next_reservation:
-                next_reservation.notified = True
-                next_reservation.notified_at = timezone.now()
-                next_reservation.save()
-                instance.status = 'reserved'
                 messages.info(
                     request,
                     f'Следующий в очереди: {next_reservation.user.get_full_name()}'
                 )
-            else:
-                instance.status = 'available'
-
-            instance.save()
             return redirect('loans:staff_panel')
     else:
         form = ReturnLoanForm()
@@ -203,11 +201,13 @@ def return_book(request):
 def manage_fines(request):
     if request.method == 'POST':
         fine_id = request.POST.get('fine_id')
-        fine = get_object_or_404(Fine, pk=fine_id)
-        fine.is_paid = True
-        fine.paid_date = timezone.now()
-        fine.save()
-        messages.success(request, f'Штраф {fine.amount} KZT списан.')
+        fine = get_object_or_404(Fine, pk=fine_id, is_paid=False)
+        try:
+            services.pay_fine(fine)
+        except services.CirculationConflict as exc:
+            messages.warning(request, str(exc))
+        else:
+            messages.success(request, f'Штраф {fine.amount} KZT списан.')
         return redirect('loans:manage_fines')
 
     fines = Fine.objects.filter(is_paid=False).select_related(
@@ -222,7 +222,8 @@ def add_book(request):
     if request.method == 'POST':
         form = BookForm(request.POST, request.FILES)
         if form.is_valid():
-            book = form.save()
+            with immediate_atomic():
+                book = form.save()
             messages.success(request, f'Книга "{book.title}" добавлена.')
             return redirect('catalog:book_detail', pk=book.pk)
     else:
@@ -242,7 +243,8 @@ def add_instance(request, book_id):
         if form.is_valid():
             instance = form.save(commit=False)
             instance.book = book
-            instance.save()
+            with immediate_atomic():
+                instance.save()
             messages.success(request, f'Экземпляр {instance.inventory_number} добавлен.')
             return redirect('catalog:book_detail', pk=book.pk)
     else:
@@ -265,7 +267,8 @@ def add_author(request):
     if request.method == 'POST':
         form = AuthorForm(request.POST)
         if form.is_valid():
-            author = form.save()
+            with immediate_atomic():
+                author = form.save()
             messages.success(request, f'Автор "{author}" добавлен.')
             return redirect('loans:staff_panel')
     else:
@@ -274,3 +277,166 @@ def add_author(request):
         'form': form,
         'title': 'Добавить автора',
     })
+
+
+def _json_error(message, status):
+    return JsonResponse({'error': message}, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def scan_preview(request, inventory_number):
+    # Called by the QR widget right after a scan, so answered without redirects
+    user = request.user
+    if not user.is_authenticated or not hasattr(user, 'profile') or not user.profile.is_librarian:
+        return _json_error('Доступ только для библиотекарей.', 403)
+    payload = preview.scan_preview(inventory_number.strip().removeprefix('STEPPE-LIB:'))
+    if payload is None:
+        return _json_error('Экземпляр с таким номером не найден.', 404)
+    return JsonResponse(payload, json_dumps_params={'ensure_ascii': False})
+
+
+# ===== Scanner station =====
+# An offline-first page for the issue/return desk: scans queue in the
+# browser and reach station_sync in batches (see static/js/station.js).
+
+@librarian_required
+def station(request):
+    return render(request, 'loans/station.html', {'batch_size': settings.STATION_SYNC_BATCH})
+
+
+@librarian_required
+def station_worker(request):
+    # Served from the station path so the worker's scope covers the page
+    response = render(request, 'loans/station_sw.js', content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@librarian_required
+def station_manifest(request):
+    return render(request, 'loans/station.webmanifest', content_type='application/manifest+json')
+
+
+@librarian_required
+@require_POST
+def station_sync(request):
+    try:
+        scans = json.loads(request.body)['scans']
+    except (ValueError, KeyError, TypeError):
+        scans = None
+    if not isinstance(scans, list) or len(scans) > settings.STATION_SYNC_BATCH:
+        return _json_error(f'Ожидается {{"scans": [...]}}, не больше {settings.STATION_SYNC_BATCH} сканов.', 400)
+    try:
+        results = station_service.apply_batch(request.user, scans)
+    except station_service.BatchError as exc:
+        return _json_error(str(exc), 400)
+    return JsonResponse({'results': results}, json_dumps_params={'ensure_ascii': False})
+
+
+# ===== Inventory audit =====
+
+@librarian_required
+def audit_list(request):
+    if request.method == 'POST':
+        form = AuditSessionForm(request.POST)
+        if form.is_valid():
+            session = form.save(request.user)
+            return redirect('loans:audit_session', session_id=session.pk)
+    else:
+        form = AuditSessionForm()
+    return render(request, 'loans/audit_list.html', {
+        'form': form,
+        'sessions': AuditSession.objects.select_related('book', 'genre', 'started_by')[:20],
+    })
+
+
+@librarian_required
+def audit_session(request, session_id):
+    session = get_object_or_404(AuditSession.objects.select_related('book', 'genre'), pk=session_id)
+    upload_form = AuditUploadForm()
+    if request.method == 'POST' and session.status == 'open':
+        action = request.POST.get('action')
+        if action == 'upload':
+            upload_form = AuditUploadForm(request.POST, request.FILES)
+            if upload_form.is_valid():
+                lines = (line.decode('utf-8', 'ignore') for line in upload_form.cleaned_data['file'])
+                seen = audit.record_scans(session, lines)
+                messages.success(request, f'Файл загружен. Отсканировано экземпляров: {seen}')
+                return redirect('loans:audit_session', session_id=session.pk)
+        elif action == 'reconcile':
+            audit.reconcile(session)
+            return redirect('loans:audit_session', session_id=session.pk)
+        elif action == 'mark_lost':
+            marked = audit.mark_missing_lost(session)
+            messages.success(request, f'Инвентаризация завершена. Списано как утерянные: {marked}')
+            return redirect('loans:audit_session', session_id=session.pk)
+        elif action == 'close':
+            session.status = 'closed'
+            session.closed_at = timezone.now()
+            session.save(update_fields=['status', 'closed_at'])
+            return redirect('loans:audit_session', session_id=session.pk)
+    return render(request, 'loans/audit_session.html', {
+        'session': session,
+        'upload_form': upload_form,
+        'report': audit.report(session) if session.reconciled_at else None,
+    })
+
+
+@librarian_required
+@require_POST
+def audit_scan(request, session_id):
+    # Scanner stations post batches of codes as {"codes": [...]}
+    session = get_object_or_404(AuditSession, pk=session_id)
+    if session.status != 'open':
+        return _json_error('Инвентаризация завершена.', 409)
+    try:
+        codes = json.loads(request.body)['codes']
+    except (ValueError, KeyError, TypeError):
+        codes = None
+    if not isinstance(codes, list):
+        return _json_error('Ожидается {"codes": [...]}.', 400)
+    return JsonResponse({'seen': audit.record_scans(session, (str(code) for code in codes))})
+
+
+@librarian_required
+def audit_export(request, session_id, kind):
+    session = get_object_or_404(AuditSession, pk=session_id)
+    if kind not in audit.EXPORTS:
+        return HttpResponse(status=404)
+    response = StreamingHttpResponse(audit.export_rows(session, kind), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="audit-{session.pk}-{kind}.csv"'
+    return response
+
+
+# ===== Request profiles =====
+
+@librarian_required
+def profiles(request):
+    return render(request, 'loans/profiles.html', {
+        'profiles': profiling.recent(),
+        'token': profiling.make_token(request.user),
+        'query_param': profiling.QUERY_PARAM,
+        'token_minutes': settings.PROFILE_TOKEN_SECONDS // 60,
+        'sample_rate': settings.PROFILE_SAMPLE_RATE,
+    })
+
+
+@librarian_required
+def profile_download(request, name, kind):
+    path = profiling.file_path(name, kind)
+    if path is None or kind == 'meta':
+        return HttpResponse(status=404)
+    try:
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'profile-{name}{profiling.FILES[kind]}')
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+
+
+# ===== Live events =====
+# Under ASGI these paths are answered by loans.sse before Django sees them.
+
+def book_events(request, book_id):
+    return HttpResponse('Поток событий доступен только при запуске через ASGI.', status=501)
+
+
+def staff_events(request):
+    return HttpResponse('Поток событий доступен только при запуске через ASGI.', status=501)
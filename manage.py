@@ -15,6 +15,10 @@ def main():
             "available on your PYTHONPATH environment variable? Did you "
             "forget to activate a virtual environment?"
         ) from exc
+    from steppelibrary.multiprocess import IN_MEMORY_COMMANDS, share_metrics
+    if sys.argv[1:2] and sys.argv[1] not in IN_MEMORY_COMMANDS:
+        # Cron jobs count too: their samples outlive the process for /metrics to read
+        share_metrics()
     execute_from_command_line(sys.argv)
 
 
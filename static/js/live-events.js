@@ -0,0 +1,59 @@
+(function initLiveEventsModule() {
+    var STATUS_LABELS = {
+        available: 'Доступен',
+        reserved: 'Забронирован',
+        on_loan: 'Выдан',
+        lost: 'Утерян'
+    };
+
+    var STATUS_BADGES = {
+        available: 'bg-success',
+        reserved: 'bg-warning text-dark',
+        on_loan: 'bg-primary',
+        lost: 'bg-danger'
+    };
+
+    window.SteppeLiveEvents = {
+        statusLabel: function statusLabel(status) {
+            if (!status) {
+                return 'новый';
+            }
+            return STATUS_LABELS[status] || status;
+        },
+
+        statusBadgeClass: function statusBadgeClass(status) {
+            return STATUS_BADGES[status] || 'bg-secondary';
+        },
+
+        subscribe: function subscribe(url, handlers) {
+            if (!window.EventSource || !url) {
+                return null;
+            }
+            var source = new window.EventSource(url);
+
+            Object.keys(handlers || {}).forEach(function (type) {
+                source.addEventListener(type, function (event) {
+                    var data;
+                    try {
+                        data = JSON.parse(event.data);
+                    } catch (err) {
+                        return;
+                    }
+                    handlers[type](data);
+                });
+            });
+
+            // The server dropped events for this client: the page is stale.
+            source.addEventListener('reset', function () {
+                source.close();
+                window.location.reload();
+            });
+
+            window.addEventListener('pagehide', function () {
+                source.close();
+            });
+
+            return source;
+        }
+    };
+})();
@@ -14,6 +14,55 @@
         return String(value || '').trim();
     }
 
+    function formatDate(value) {
+        var date = new Date(value);
+        return ('0' + date.getDate()).slice(-2) + '.' + ('0' + (date.getMonth() + 1)).slice(-2) + '.' + date.getFullYear();
+    }
+
+    function renderPreview(previewEl, data) {
+        var lines = [];
+        lines.push(['qr-preview-title', data.book.title + ' [' + data.inventory_number + ']']);
+        lines.push(['', 'Статус: ' + data.status_display]);
+        if (data.loan) {
+            lines.push(['', 'На руках у ' + (data.loan.borrower.name || data.loan.borrower.username) +
+                ' (' + data.loan.borrower.username + '), срок до ' + formatDate(data.loan.due_date) +
+                (data.overdue ? ' — просрочена' : '')]);
+        }
+        if (data.next_reservation) {
+            lines.push(['', 'Следующий в очереди: ' + (data.next_reservation.name || data.next_reservation.username) +
+                (data.queue > 1 ? ' (всего в очереди: ' + data.queue + ')' : '')]);
+        }
+        lines.push([data.can_issue || data.can_return ? 'text-success' : 'text-danger',
+            data.can_issue ? 'Можно выдать' : data.can_return ? 'Можно принять возврат' : 'Ни выдать, ни принять нельзя']);
+
+        previewEl.innerHTML = '';
+        lines.forEach(function (line) {
+            var el = document.createElement('div');
+            el.className = line[0];
+            el.textContent = line[1];
+            previewEl.appendChild(el);
+        });
+        previewEl.classList.remove('d-none');
+    }
+
+    function loadPreview(previewEl, urlTemplate, code) {
+        if (!previewEl || !urlTemplate) {
+            return;
+        }
+        var url = urlTemplate.replace('__code__', encodeURIComponent(code.replace(/^STEPPE-LIB:/, '')));
+        fetch(url, { credentials: 'same-origin', headers: { Accept: 'application/json' } }).then(function (response) {
+            return response.json().then(function (data) {
+                if (!response.ok) {
+                    throw new Error(data.error || response.status);
+                }
+                renderPreview(previewEl, data);
+            });
+        }).catch(function (err) {
+            previewEl.textContent = err && err.message ? err.message : 'Не удалось получить данные экземпляра.';
+            previewEl.classList.remove('d-none');
+        });
+    }
+
     window.SteppeQrScanner = {
         init: function init(options) {
             var cfg = options || {};
@@ -23,6 +72,7 @@
             var stopBtn = document.getElementById(cfg.stopButtonId);
             var imageInput = document.getElementById(cfg.imageInputId);
             var statusEl = document.getElementById(cfg.statusId);
+            var previewEl = cfg.previewId ? document.getElementById(cfg.previewId) : null;
 
             if (!inputEl || !readerEl || !startBtn || !stopBtn || !imageInput || !statusEl) {
                 return;
@@ -71,6 +121,7 @@
                 inputEl.dispatchEvent(new Event('change', { bubbles: true }));
                 inputEl.focus();
                 setStatus(statusEl, 'QR найден: ' + code, 'ok');
+                loadPreview(previewEl, cfg.previewUrl, code);
             }
 
             function stopScanner() {
@@ -0,0 +1,269 @@
+(function initStationModule() {
+    var DB_NAME = 'steppe-station';
+    var STORE = 'scans';
+    var KEEP_DONE = 100;
+    var SYNC_INTERVAL_MS = 3000;
+
+    var STATE_LABELS = {
+        pending: ['В очереди', 'bg-secondary'],
+        ok: ['Проведён', 'bg-success'],
+        rejected: ['Отклонён', 'bg-danger']
+    };
+
+    function openDb() {
+        return new Promise(function (resolve, reject) {
+            var request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = function () {
+                var store = request.result.createObjectStore(STORE, { keyPath: 'id' });
+                store.createIndex('scanned_at', 'scanned_at');
+            };
+            request.onsuccess = function () {
+                resolve(request.result);
+            };
+            request.onerror = function () {
+                reject(request.error);
+            };
+        });
+    }
+
+    function withStore(db, mode, work) {
+        return new Promise(function (resolve, reject) {
+            var tx = db.transaction(STORE, mode);
+            var result = work(tx.objectStore(STORE));
+            tx.oncomplete = function () {
+                resolve(result && 'result' in result ? result.result : result);
+            };
+            tx.onerror = function () {
+                reject(tx.error);
+            };
+        });
+    }
+
+    function allScans(db) {
+        // Oldest first, so a batch replays in the order the desk scanned
+        return withStore(db, 'readonly', function (store) {
+            return store.index('scanned_at').getAll();
+        });
+    }
+
+    function newId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        var bytes = crypto.getRandomValues(new Uint8Array(16));
+        bytes[6] = (bytes[6] & 0x0f) | 0x40;
+        bytes[8] = (bytes[8] & 0x3f) | 0x80;
+        var hex = Array.prototype.map.call(bytes, function (b) {
+            return ('0' + b.toString(16)).slice(-2);
+        }).join('');
+        return hex.slice(0, 8) + '-' + hex.slice(8, 12) + '-' + hex.slice(12, 16) + '-' + hex.slice(16, 20) + '-' + hex.slice(20);
+    }
+
+    function normalizeCode(value) {
+        return String(value || '').trim().replace(/^STEPPE-LIB:/, '');
+    }
+
+    window.SteppeStation = {
+        init: function init(cfg) {
+            var codeInput = document.getElementById('station-code');
+            var borrowerInput = document.getElementById('station-borrower');
+            var borrowerRow = document.getElementById('station-borrower-row');
+            var logEl = document.getElementById('station-log');
+            var pendingEl = document.getElementById('station-pending');
+            var networkEl = document.getElementById('station-network');
+            var modeInputs = document.querySelectorAll('input[name="station-mode"]');
+            var syncing = false;
+            var dbReady = openDb();
+
+            if ('serviceWorker' in navigator) {
+                navigator.serviceWorker.register(cfg.workerUrl, { scope: cfg.scope }).catch(function () {
+                    // Still usable online without the worker
+                });
+            }
+
+            function mode() {
+                var checked = document.querySelector('input[name="station-mode"]:checked');
+                return checked ? checked.value : 'issue';
+            }
+
+            function setNetwork(text, kind) {
+                networkEl.textContent = text;
+                networkEl.className = 'badge ' + kind;
+            }
+
+            function render(scans) {
+                var pending = 0;
+                logEl.innerHTML = '';
+                scans.slice().reverse().forEach(function (scan) {
+                    if (scan.state === 'pending') {
+                        pending += 1;
+                    }
+                    var label = STATE_LABELS[scan.state];
+                    var item = document.createElement('li');
+                    item.className = 'py-1 border-bottom';
+                    var badge = document.createElement('span');
+                    badge.className = 'badge me-2 ' + label[1];
+                    badge.textContent = label[0];
+                    var text = document.createElement('span');
+                    text.textContent = (scan.action === 'issue' ? 'Выдача ' : 'Возврат ') + scan.inventory_number +
+                        (scan.borrower ? ' → ' + scan.borrower : '');
+                    item.appendChild(badge);
+                    item.appendChild(text);
+                    if (scan.message) {
+                        var note = document.createElement('div');
+                        note.className = 'small text-muted';
+                        note.textContent = scan.message;
+                        item.appendChild(note);
+                    }
+                    logEl.appendChild(item);
+                });
+                if (!scans.length) {
+                    logEl.innerHTML = '<li class="text-muted">Сканов пока нет.</li>';
+                }
+                pendingEl.textContent = pending ? 'не отправлено: ' + pending : '';
+            }
+
+            function refresh() {
+                return dbReady.then(allScans).then(render);
+            }
+
+            function prune(db, scans) {
+                var done = scans.filter(function (scan) {
+                    return scan.state !== 'pending';
+                });
+                var extra = done.slice(0, Math.max(0, done.length - KEEP_DONE));
+                if (!extra.length) {
+                    return Promise.resolve();
+                }
+                return withStore(db, 'readwrite', function (store) {
+                    extra.forEach(function (scan) {
+                        store.delete(scan.id);
+                    });
+                });
+            }
+
+            function sync() {
+                if (syncing || !navigator.onLine) {
+                    if (!navigator.onLine) {
+                        setNetwork('Нет сети', 'bg-warning text-dark');
+                    }
+                    return;
+                }
+                syncing = true;
+                dbReady.then(function (db) {
+                    return allScans(db).then(function (scans) {
+                        var batch = scans.filter(function (scan) {
+                            return scan.state === 'pending';
+                        }).slice(0, cfg.batchSize);
+                        if (!batch.length) {
+                            setNetwork('На связи', 'bg-success');
+                            return prune(db, scans);
+                        }
+                        return fetch(cfg.syncUrl, {
+                            method: 'POST',
+                            credentials: 'same-origin',
+                            redirect: 'manual',
+                            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': cfg.csrfToken },
+                            body: JSON.stringify({
+                                scans: batch.map(function (scan) {
+                                    return {
+                                        id: scan.id,
+                                        action: scan.action,
+                                        inventory_number: scan.inventory_number,
+                                        borrower: scan.borrower,
+                                        scanned_at: scan.scanned_at
+                                    };
+                                })
+                            })
+                        }).then(function (response) {
+                            if (response.type === 'opaqueredirect' || response.status === 403) {
+                                // Scans stay queued until the librarian signs in again
+                                setNetwork('Войдите снова', 'bg-danger');
+                                return null;
+                            }
+                            if (!response.ok) {
+                                throw new Error(response.status);
+                            }
+                            return response.json();
+                        }).then(function (data) {
+                            if (!data) {
+                                return;
+                            }
+                            setNetwork('На связи', 'bg-success');
+                            var byId = {};
+                            batch.forEach(function (scan) {
+                                byId[scan.id] = scan;
+                            });
+                            return withStore(db, 'readwrite', function (store) {
+                                data.results.forEach(function (result) {
+                                    var scan = byId[result.id];
+                                    if (scan) {
+                                        scan.state = result.result;
+                                        scan.message = result.message;
+                                        store.put(scan);
+                                    }
+                                });
+                            });
+                        });
+                    });
+                }).catch(function () {
+                    setNetwork('Нет связи с сервером', 'bg-warning text-dark');
+                }).finally(function () {
+                    syncing = false;
+                    refresh();
+                });
+            }
+
+            function enqueue(raw) {
+                var code = normalizeCode(raw);
+                if (!code) {
+                    return;
+                }
+                var scan = {
+                    id: newId(),
+                    action: mode(),
+                    inventory_number: code,
+                    borrower: mode() === 'issue' ? borrowerInput.value.trim() : '',
+                    scanned_at: new Date().toISOString(),
+                    state: 'pending',
+                    message: ''
+                };
+                // The desk only waits for the local write; the server sees it on the next sync
+                dbReady.then(function (db) {
+                    return withStore(db, 'readwrite', function (store) {
+                        store.put(scan);
+                    });
+                }).then(refresh).then(sync);
+            }
+
+            codeInput.addEventListener('keydown', function (event) {
+                if (event.key !== 'Enter') {
+                    return;
+                }
+                event.preventDefault();
+                enqueue(codeInput.value);
+                codeInput.value = '';
+            });
+            // The camera scanner fills the field and fires change
+            codeInput.addEventListener('change', function () {
+                if (codeInput.value) {
+                    enqueue(codeInput.value);
+                    codeInput.value = '';
+                }
+            });
+            Array.prototype.forEach.call(modeInputs, function (input) {
+                input.addEventListener('change', function () {
+                    borrowerRow.classList.toggle('d-none', mode() !== 'issue');
+                    codeInput.focus();
+                });
+            });
+
+            window.addEventListener('online', sync);
+            window.addEventListener('offline', function () {
+                setNetwork('Нет сети', 'bg-warning text-dark');
+            });
+            setInterval(sync, SYNC_INTERVAL_MS);
+            refresh().then(sync);
+        }
+    };
+})();
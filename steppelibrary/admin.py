@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.paginator import EmptyPage, Paginator
+from django.utils.functional import cached_property
+
+from .db import estimated_count
+
+
+class EstimatedCountPaginator(Paginator):
+    """Counts an unfiltered changelist of a big table from planner statistics instead of COUNT(*)."""
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where and not queryset.query.distinct:
+            estimate = estimated_count(queryset.model, using=queryset.db)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_FROM:
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if not self.estimated:
+                raise
+        # Statistics older than the last rows under-count the table: count it
+        # for real before calling a page past the estimate empty
+        self.estimated = False
+        self.__dict__['count'] = Paginator.count.func(self)
+        self.__dict__.pop('num_pages', None)
+        return super().validate_number(number)
+
+
+class LargeTableAdminMixin:
+    paginator = EstimatedCountPaginator
+    # Otherwise a filtered changelist also counts the whole table for "N из M"
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if may_have_duplicates:
+            # A match through a many-valued relation: filter by primary key
+            # instead of DISTINCT over every selected column
+            results = queryset.filter(pk__in=results.values('pk'))
+        return results, False
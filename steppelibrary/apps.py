@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class SteppeLibraryConfig(AppConfig):
+    name = 'steppelibrary'
+
+    def ready(self):
+        from . import db  # noqa: F401  (registers the connection setup hook)
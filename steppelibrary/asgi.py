@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.utils.module_loading import import_string
+
+from steppelibrary.multiprocess import share_metrics
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'steppelibrary.settings')
+share_metrics()
+django.setup(set_prefix=False)
 
-application = get_asgi_application()
+# Kiosk and event-stream routes, see steppelibrary.routing; loaded by path
+# once the app registry and the metrics store are set up
+application = import_string('steppelibrary.routing.application')
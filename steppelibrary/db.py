@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@contextmanager
+def immediate_atomic(using=None):
+    # A deferred transaction takes the write lock only at its first write.
+    # If another desk committed in between, SQLite cannot wait for the lock
+    # and fails with "database is locked". BEGIN IMMEDIATE takes the write
+    # lock up front, so busy_timeout applies and the two desks queue.
+    connection = transaction.get_connection(using)
+    immediate = getattr(settings, 'SQLITE_IMMEDIATE_TRANSACTIONS', True)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block or not immediate:
+        with transaction.atomic(using=using):
+            yield
+        return
+    # Reconnecting resets transaction_mode from OPTIONS, so connect first
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
+
+
+def estimated_count(model, using='default'):
+    """Row count of the model's table from planner statistics, or None when there are none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Written by ANALYZE: the first number of each stat is the table's row count
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    count = int(str(row[0]).split()[0])
+    return count if count >= 0 else None
+
+
+def refresh_table_stats(using='default'):
+    """Refresh the statistics estimated_count reads after bulk changes to table sizes."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        # A sampled ANALYZE: row counts come out approximate, but it stays fast on big tables
+        cursor.execute('PRAGMA analysis_limit = 1000')
+        cursor.execute('ANALYZE')
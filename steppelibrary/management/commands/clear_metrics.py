@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from steppelibrary import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Удалить накопленные файлы метрик Prometheus всех процессов. '
+        'Запускать, когда веб-процессы и планировщик остановлены, например перед их запуском'
+    )
+
+    def handle(self, *args, **options):
+        removed = metrics.clear()
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов метрик: {removed}'))
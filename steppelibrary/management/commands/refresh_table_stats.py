@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from steppelibrary.db import refresh_table_stats
+
+
+class Command(BaseCommand):
+    help = 'Обновить статистику таблиц SQLite, по которой админка оценивает число строк в больших списках'
+
+    def handle(self, *args, **options):
+        refresh_table_stats()
+        self.stdout.write(self.style.SUCCESS('Статистика таблиц обновлена.'))
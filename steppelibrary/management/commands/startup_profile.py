@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from steppelibrary import startup
+
+
+class Command(BaseCommand):
+    help = 'Показать, сколько стоит холодный старт: импорты модулей (как -X importtime) и готовность приложений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help='Сколько самых дорогих импортов показать')
+
+    def handle(self, *args, **options):
+        result = startup.measure()
+        self.stdout.write(
+            f'django.setup(): {result.setup_ms:.0f} мс, URLconf: {result.urls_ms:.0f} мс '
+            f'(бюджет {settings.STARTUP_BUDGET_MS} мс без -X importtime), модулей импортировано: {len(result.imports)}'
+        )
+        self.stdout.write('\nПо пакетам (собственное время импорта):')
+        for package, self_us in startup.by_package(result.imports)[:options['limit']]:
+            self.stdout.write(f'  {self_us / 1000:8.1f} мс  {package}')
+
+        self.stdout.write('\nСамые дорогие импорты верхнего уровня (с вложенными):')
+        top = sorted((cost for cost in result.imports if cost.depth == 0), key=lambda cost: cost.cumulative_us, reverse=True)
+        for cost in top[:options['limit']]:
+            self.stdout.write(f'  {cost.cumulative_us / 1000:8.1f} мс  {cost.name}')
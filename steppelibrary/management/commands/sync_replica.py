@@ -0,0 +1,27 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Скопировать основную базу SQLite в локальные реплики для чтения'
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Копирование нужно только локальным репликам SQLite.')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены: задайте STEPPELIBRARY_SQLITE_REPLICA=1.')
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            started = time.perf_counter()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                # The online backup API copies a consistent snapshot while the primary keeps taking writes
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'{alias}: скопировано за {time.perf_counter() - started:.2f} с'))
@@ -0,0 +1,149 @@
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+# prometheus_client picks its value store on import. Web workers and
+# management commands set PROMETHEUS_MULTIPROC_DIR first
+# (steppelibrary.multiprocess): each keeps its samples in its own mmap file
+# there and /metrics sums them. Other processes, tests among them, count in memory.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest  # noqa: E402
+from prometheus_client.multiprocess import MultiProcessCollector  # noqa: E402
+
+
+UNMATCHED = '<unmatched>'
+
+REQUEST_SECONDS = Histogram(
+    'steppe_http_request_duration_seconds', 'Time to build a response, by URL name.',
+    ['view', 'method'], buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter('steppe_http_requests', 'Responses by URL name, method and status.', ['view', 'method', 'status'])
+REQUEST_QUERIES = Histogram(
+    'steppe_db_queries_per_request', 'Database queries made by one request, by URL name.',
+    ['view'], buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+CACHE_LOOKUPS = Counter('steppe_cache_lookups', 'Lookups in the in-process caches, by cache and result.', ['cache', 'result'])
+
+LOANS_ISSUED = Counter('steppe_loans_issued', 'Loans issued.')
+LOANS_RETURNED = Counter('steppe_loans_returned', 'Loans returned.')
+FINES_ISSUED = Counter('steppe_fines_issued', 'Fines created.')
+FINES_PAID = Counter('steppe_fines_paid', 'Fines paid.')
+RESERVATIONS_CREATED = Counter('steppe_reservations_created', 'Reservations placed.')
+RESERVATIONS_EXPIRED = Counter('steppe_reservations_expired', 'Notified reservations that expired uncollected.')
+
+
+# A one-item list per request: sync_to_async threads run in a copy of the
+# request's context, so async views' queries land in the same holder
+_queries = ContextVar('steppe_request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    queries = _queries.get()
+    if queries is not None:
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_query_counter(sender, connection, **kwargs):
+    # Once per connection rather than an execute_wrapper() per request
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class MetricsMiddleware:
+    """Records latency, status and query count of every request under its URL name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._series = {}
+        # Async in an async chain, so ASGI requests need no thread hop for it
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def series(self, view, method, status):
+        # labels() validates and locks on every call; the set of routes is small
+        key = (view, method, status)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = (
+                REQUEST_SECONDS.labels(view, method), REQUESTS.labels(view, method, status), REQUEST_QUERIES.labels(view),
+            )
+        return series
+
+    def record(self, request, response, duration, queries):
+        match = request.resolver_match
+        # URL names, not paths: one series per route whatever the ids in it
+        view = match.view_name if match is not None else UNMATCHED
+        seconds, responses, query_counts = self.series(view, request.method, response.status_code)
+        seconds.observe(duration)
+        responses.inc()
+        query_counts.observe(queries)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        queries = [0]
+        token = _queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        queries = [0]
+        token = _queries.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+
+def registry():
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    return registry
+
+
+def metrics_view(request):
+    """All processes' metrics in the Prometheus text format."""
+    # Closed unless a token is configured: the numbers describe the library's traffic
+    if not settings.METRICS_TOKEN:
+        return HttpResponse(status=404)
+    if request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponse(status=403)
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def clear():
+    """Delete every process's samples, so all metrics start from zero; returns the number of files removed."""
+    directory = MULTIPROC_DIR or settings.METRICS_DIR
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for filename in os.listdir(directory):
+        if filename.endswith('.db'):
+            os.remove(os.path.join(directory, filename))
+            removed += 1
+    return removed
@@ -0,0 +1,22 @@
+import os
+import sys
+
+from django.conf import settings
+
+
+# Management commands that keep their samples in memory: the test runner
+# checks its own counts, and clear_metrics deletes the files
+IN_MEMORY_COMMANDS = {'test', 'clear_metrics'}
+
+
+def share_metrics():
+    """Keep this process's Prometheus samples in METRICS_DIR, where /metrics sums every process's.
+
+    For web workers and management commands, so a counter moved by a cron job
+    survives its process. Must run before anything imports prometheus_client,
+    that is before django.setup().
+    """
+    if 'prometheus_client' in sys.modules:
+        # Too late, the process counts in memory (a test or command importing asgi.py)
+        return
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', str(settings.METRICS_DIR))
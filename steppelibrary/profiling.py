@@ -0,0 +1,238 @@
+import cProfile
+import json
+import logging
+import marshal
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import signing
+
+from accounts.models import UserProfile
+
+
+logger = logging.getLogger(__name__)
+
+QUERY_PARAM = '_profile'
+HEADER = 'HTTP_X_STEPPE_PROFILE'
+RESPONSE_HEADER = 'X-Steppe-Profile'
+SALT = 'steppelibrary.profiling'
+NAME = re.compile(r'^\d{19}-\d+$')
+FILES = {'meta': '.json', 'pstats': '.prof', 'collapsed': '.collapsed'}
+# Call paths under this share of the request are left out of the flame graph
+MIN_PATH_SHARE = 0.0005
+TOP_FUNCTIONS = 5
+
+
+def make_token(user):
+    """A token that profiles the requests carrying it, for PROFILE_TOKEN_SECONDS."""
+    return signing.dumps(user.pk, salt=SALT)
+
+
+def _token_user(token):
+    try:
+        user_id = signing.loads(token, salt=SALT, max_age=settings.PROFILE_TOKEN_SECONDS)
+    except signing.BadSignature:
+        return None
+    # Checked on every request, as librarian_required does: a link stops
+    # working once its librarian is demoted or deactivated
+    if not UserProfile.objects.filter(user_id=user_id, user__is_active=True, role='librarian').exists():
+        return None
+    return user_id
+
+
+def _short_names():
+    prefixes = sorted({os.path.join(entry, '') for entry in sys.path if entry}, key=len, reverse=True)
+
+    def short(filename):
+        for prefix in prefixes:
+            if filename.startswith(prefix):
+                return filename[len(prefix):]
+        return filename
+    return short
+
+
+def _label(func, short):
+    filename, line, name = func
+    if filename == '~':
+        return name.replace(';', ',')
+    return f'{name} ({short(filename)}:{line})'.replace(';', ',')
+
+
+def collapsed(stats):
+    """Folded stacks for flamegraph.pl / speedscope, in microseconds.
+
+    cProfile keeps caller-callee edges rather than whole stacks, so a function's
+    time is split between the paths to it in proportion to what each caller spent in it.
+    """
+    rows = stats.stats
+    callees = defaultdict(list)
+    for func, (_, _, _, _, callers) in rows.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+    short = _short_names()
+    roots = [func for func, row in rows.items() if not row[4]]
+    cutoff = MIN_PATH_SHARE * sum(rows[func][3] for func in roots)
+    folded = Counter()
+    on_stack = set()
+
+    def walk(func, stack, share):
+        on_stack.add(func)
+        stack = f'{stack};{_label(func, short)}' if stack else _label(func, short)
+        folded[stack] += rows[func][2] * share
+        for callee, edge_time in callees[func]:
+            total = rows[callee][3]
+            if callee in on_stack or not total:
+                continue
+            # Recursive calls count their time once per level in the edge
+            edge_time = min(edge_time, total)
+            if edge_time * share < cutoff:
+                # Too thin to see: counted in the caller, so the totals still add up
+                folded[stack] += edge_time * share
+                continue
+            walk(callee, stack, share * edge_time / total)
+        on_stack.discard(func)
+
+    for func in roots:
+        walk(func, '', 1.0)
+    lines = ((stack, round(seconds * 1e6)) for stack, seconds in folded.items())
+    return ''.join(f'{stack} {us}\n' for stack, us in lines if us)
+
+
+def _write(directory, filename, data):
+    # Written under a temporary name and renamed, so a listing never sees half a file
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, os.path.join(directory, filename))
+
+
+def _trim(directory, keep):
+    names = sorted({filename.split('.')[0] for filename in os.listdir(directory) if not filename.startswith('.')})
+    for name in names[:-keep]:
+        for extension in FILES.values():
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+
+def save(profiler, meta):
+    """Store a finished profile in PROFILE_DIR, keeping the newest PROFILE_KEEP; returns its name."""
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f'{time.time_ns()}-{os.getpid()}'
+    stats = pstats.Stats(profiler)
+    top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+    short = _short_names()
+    meta = {
+        **meta, 'name': name, 'created': time.time(),
+        'top': [[_label(func, short), round(row[2] * 1000, 2)] for func, row in top],
+    }
+    # .prof is what pstats.Stats.dump_stats writes (pstats, snakeviz); the metadata
+    # goes last, so a profile is listed only once all its files are there
+    _write(directory, name + FILES['pstats'], marshal.dumps(stats.stats))
+    _write(directory, name + FILES['collapsed'], collapsed(stats).encode())
+    _write(directory, name + FILES['meta'], json.dumps(meta, ensure_ascii=False).encode())
+    _trim(directory, settings.PROFILE_KEEP)
+    return name
+
+
+def recent():
+    """Metadata of the stored profiles, newest first."""
+    directory = settings.PROFILE_DIR
+    try:
+        filenames = sorted(os.listdir(directory), reverse=True)
+    except FileNotFoundError:
+        return []
+    result = []
+    for filename in filenames:
+        if not filename.endswith(FILES['meta']) or filename.startswith('.'):
+            continue
+        try:
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            # Trimmed by another process in the meantime
+            continue
+        meta['created'] = datetime.fromtimestamp(meta['created'], tz=timezone.utc)
+        result.append(meta)
+    return result
+
+
+def _shown_path(request):
+    # The token stays out of the listing: it would profile anyone's requests
+    query = request.GET.copy()
+    query.pop(QUERY_PARAM, None)
+    return f'{request.path}?{query.urlencode()}' if query else request.path
+
+
+def file_path(name, kind):
+    """Path of one stored file of a profile, or None for names that are not ours."""
+    if not NAME.match(name) or kind not in FILES:
+        return None
+    return os.path.join(settings.PROFILE_DIR, name + FILES[kind])
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry a staff token, plus a PROFILE_SAMPLE_RATE share of all traffic.
+
+    The token comes from the staff profiles page, as ?_profile=... or an
+    X-Steppe-Profile header. Any other request goes straight through.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE
+
+    def __call__(self, request):
+        token = request.META.get(HEADER)
+        if token is None and QUERY_PARAM in request.META.get('QUERY_STRING', ''):
+            token = request.GET.get(QUERY_PARAM)
+        if token is not None:
+            user_id = _token_user(token)
+            if user_id is not None:
+                return self.profile(request, 'token', user_id)
+        elif self.sample_rate and random.random() < self.sample_rate:
+            return self.profile(request, 'sample', None)
+        return self.get_response(request)
+
+    def handle(self, request):
+        # The root of every stack in the flame graph: the middleware below recurse
+        # through Django's exception wrapper, so none of their frames would do
+        return self.get_response(request)
+
+    def profile(self, request, trigger, user_id):
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one cProfile at a time per process
+            return self.get_response(request)
+        try:
+            response = self.handle(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - started
+        try:
+            name = save(profiler, {
+                'method': request.method,
+                'path': _shown_path(request),
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 1),
+                'trigger': trigger,
+                'user_id': user_id,
+            })
+        except OSError:
+            logger.exception('Could not store the profile of %s', request.path)
+            return response
+        response[RESPONSE_HEADER] = name
+        return response
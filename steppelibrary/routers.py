@@ -0,0 +1,89 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'steppe_primary'
+
+
+class _RequestRouting:
+    def __init__(self, replica):
+        # None: this request reads from the primary only
+        self.replica = replica
+        self.wrote = False
+
+
+# Set by ReplicaRoutingMiddleware for the duration of a request; outside one
+# (commands, shell, tasks) every query goes to the primary
+_routing = ContextVar('steppe_request_routing', default=None)
+
+
+def _replicated(model):
+    opts = model._meta
+    reads = {entry.lower() for entry in settings.REPLICA_READS}
+    return opts.app_label in reads or opts.label_lower in reads
+
+
+class PrimaryReplicaRouter:
+    """Writes go to the primary; reads of REPLICA_READS models may go to a replica.
+
+    A request reads from a replica only when ReplicaRoutingMiddleware allowed it,
+    and only until its first write, so it always sees what it wrote itself.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.replica is None or not _replicated(model):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+            routing.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema with the data they copy
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """Lets anonymous safe requests read from a replica, except for a while after the client wrote.
+
+    Signed-in users, librarians above all, always read from the primary: their
+    pages act on what they show. After a request that writes, the response sets
+    a short-lived cookie; until it expires that browser reads from the primary too.
+    Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replica = None
+        if (settings.DATABASE_REPLICAS and request.method in SAFE_METHODS
+                and PIN_COOKIE not in request.COOKIES and not request.user.is_authenticated):
+            # One replica for the whole request, so a page reads one snapshot
+            replica = random.choice(settings.DATABASE_REPLICAS)
+        routing = _RequestRouting(replica)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        if routing.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
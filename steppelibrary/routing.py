@@ -0,0 +1,60 @@
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.middleware.common import CommonMiddleware
+from django.middleware.security import SecurityMiddleware
+
+from loans import sse
+from steppelibrary.metrics import MetricsMiddleware
+
+# Anonymous read-only JSON polled by kiosks. Django runs every MiddlewareMixin
+# hook through a thread-sensitive sync_to_async hop, which serialises all
+# concurrent requests on one thread, so these paths get a short async-only stack.
+KIOSK_PATH_PREFIX = '/catalog/api/kiosk/'
+
+
+class InlineMiddlewareMixin:
+    # For hooks that only read the request and settings and set headers: they can run in the event loop
+    async def __acall__(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
+
+class InlineSecurityMiddleware(InlineMiddlewareMixin, SecurityMiddleware):
+    pass
+
+
+class InlineCommonMiddleware(InlineMiddlewareMixin, CommonMiddleware):
+    # Validates the Host header against ALLOWED_HOSTS, as on every other path
+    pass
+
+
+# Outermost first, as in MIDDLEWARE
+KIOSK_MIDDLEWARE = [MetricsMiddleware, InlineSecurityMiddleware, InlineCommonMiddleware]
+
+
+class KioskASGIHandler(ASGIHandler):
+    def load_middleware(self, is_async=False):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+        handler = convert_exception_to_response(self._get_response_async)
+        for middleware in reversed(KIOSK_MIDDLEWARE):
+            handler = convert_exception_to_response(middleware(handler))
+        self._middleware_chain = handler
+
+
+django_application = ASGIHandler()
+kiosk_application = KioskASGIHandler()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        if scope['path'].startswith(KIOSK_PATH_PREFIX):
+            await kiosk_application(scope, receive, send)
+            return
+        if sse.resolve(scope['path']) is not None:
+            await sse.application(scope, receive, send)
+            return
+    await django_application(scope, receive, send)
@@ -2,6 +2,7 @@
 Django settings for steppelibrary project.
 """
 
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -21,17 +22,21 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'crispy_forms',
     'crispy_bootstrap5',
+    'steppelibrary',
     'catalog',
     'loans',
     'accounts',
 ]
 
 MIDDLEWARE = [
+    'steppelibrary.profiling.ProfilingMiddleware',
+    'steppelibrary.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'steppelibrary.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,6 +66,49 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+# A local read replica: a copy of db.sqlite3 refreshed by `manage.py sync_replica`
+if os.environ.get('STEPPELIBRARY_SQLITE_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['steppelibrary.routers.PrimaryReplicaRouter']
+# Aliases in DATABASES that serve reads; empty means everything stays on default
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# App labels or app_label.model names whose reads by anonymous visitors may go to a replica
+REPLICA_READS = ['catalog']
+# How long a browser reads from the primary after it wrote
+REPLICA_STICKY_SECONDS = 15
+
+# Applied to every new SQLite connection by steppelibrary.db.configure_sqlite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+# Write transactions opened with steppelibrary.db.immediate_atomic use BEGIN IMMEDIATE
+SQLITE_IMMEDIATE_TRANSACTIONS = True
+# Cold start (django.setup() plus URLconf) allowed by the startup test; see `manage.py startup_profile`
+STARTUP_BUDGET_MS = 600
+# Request profiles (steppelibrary.profiling): where they are kept, how many,
+# the share of all requests profiled unasked and how long a staff token lasts
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_KEEP = 50
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_TOKEN_SECONDS = 60 * 60
+# Prometheus samples of the web workers and management commands, summed by
+# /metrics; must be on local disk and shared by the processes of one host;
+# `manage.py clear_metrics` empties it. PROMETHEUS_MULTIPROC_DIR in the environment takes precedence.
+METRICS_DIR = Path(os.environ.get('STEPPELIBRARY_METRICS_DIR', BASE_DIR / 'metrics'))
+# /metrics wants "Authorization: Bearer <token>" and is off while this is empty
+METRICS_TOKEN = os.environ.get('STEPPELIBRARY_METRICS_TOKEN', '')
+# Unfiltered admin changelists of tables at least this big show an estimated total
+ADMIN_ESTIMATED_COUNT_FROM = 50000
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -80,9 +128,20 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # Book covers, named by content hash; see steppelibrary.storage
+    'covers': {'BACKEND': 'steppelibrary.storage.ContentAddressedStorage'},
+}
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.ProfileModelBackend',
+]
+
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
@@ -93,3 +152,39 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOAN_PERIOD_DAYS = 14
 FINE_PER_DAY_KZT = 200
 RESERVATION_EXPIRY_HOURS = 48
+POPULARITY_HALF_LIFE_DAYS = 14
+
+# Periodic jobs run by `manage.py run_scheduler`: the management command of the
+# same name (or 'command', with 'args'), every N seconds or on a cron
+# expression in local time
+SCHEDULER_JOBS = {
+    'calculate_fines': {'cron': '5 0 * * *'},
+    'expire_reservations': {'every': 15 * 60},
+    'queue_due_reminders': {'cron': '0 9 * * *'},
+    'send_notifications': {'every': 60},
+    'update_circulation_stats': {'every': 60 * 60},
+    'update_return_profiles': {'cron': '30 3 * * *'},
+    'update_recommendations': {'cron': '0 4 * * *'},
+    'archive_loans': {'cron': '0 2 * * 0'},
+    'refresh_table_stats': {'every': 60 * 60},
+}
+# Up to this many seconds are added to each next run, so jobs and schedulers do not fire in lockstep
+SCHEDULER_JITTER_SECONDS = 30
+# A job whose scheduler died may be taken over after this long
+SCHEDULER_LEASE_SECONDS = 60 * 60
+
+# Notifications
+DEFAULT_FROM_EMAIL = 'SteppeLibrary <library@steppe.edu>'
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DUE_REMINDER_DAYS = 2
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_RETRY_BASE_SECONDS = 60
+
+# Seconds a kiosk availability answer is reused by the process
+KIOSK_CACHE_SECONDS = 2
+# Seconds a scan preview is reused; status changes clear it sooner
+SCAN_PREVIEW_CACHE_SECONDS = 10
+
+# Offline scanner stations: older scan times are clamped to this many hours ago
+STATION_MAX_OFFLINE_HOURS = 72
+STATION_SYNC_BATCH = 200
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+from django.conf import settings
+
+
+# Run in a fresh interpreter: what a worker, a test run or a management command pays before doing anything
+PROBE = '''
+import time
+started = time.perf_counter()
+import django
+django.setup()
+ready = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(ready - started, time.perf_counter() - ready)
+'''
+
+ImportCost = namedtuple('ImportCost', 'name self_us cumulative_us depth')
+Startup = namedtuple('Startup', 'setup_ms urls_ms imports')
+
+
+def _parse(stderr):
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append(ImportCost(name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def measure(importtime=True):
+    """Cold-start this project in a subprocess: django.setup() and URLconf time, and every import's cost."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+    result = subprocess.run(
+        command + ['-c', PROBE], capture_output=True, text=True, env=env, cwd=settings.BASE_DIR, check=True,
+    )
+    setup, urls = (float(value) * 1000 for value in result.stdout.split()[-2:])
+    return Startup(setup, urls, _parse(result.stderr) if importtime else [])
+
+
+def by_package(imports):
+    """Self time summed per top-level package, largest first."""
+    totals = {}
+    for cost in imports:
+        package = cost.name.split('.')[0]
+        totals[package] = totals.get(package, 0) + cost.self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
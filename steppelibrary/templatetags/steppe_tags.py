@@ -0,0 +1,18 @@
+from django import template
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/pagination.html', takes_context=True)
+def pagination(context, page, on_each_side=2):
+    """Links to the first, last and neighbouring pages, keeping the other GET parameters."""
+    # Encoded once per render instead of once per link
+    query = context['request'].GET.copy()
+    query.pop('page', None)
+    paginator = page.paginator
+    return {
+        'page': page,
+        'page_range': paginator.get_elided_page_range(page.number, on_each_side=on_each_side, on_ends=1),
+        'ellipsis': paginator.ELLIPSIS,
+        'query': f'{query.urlencode()}&' if query else '',
+    }
@@ -0,0 +1,420 @@
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection, connections, router
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client.parser import text_string_to_metric_families
+
+from accounts.models import UserProfile
+from catalog.api import kiosk_cache
+from catalog.models import Author, Book, BookInstance
+from loans import scheduler, services
+from loans.models import Loan, Reservation
+from . import asgi, metrics, profiling, startup
+from .admin import EstimatedCountPaginator
+from .db import immediate_atomic, refresh_table_stats
+from .multiprocess import share_metrics
+from .routers import PIN_COOKIE, ReplicaRoutingMiddleware
+
+
+def data_queries(context):
+    # Savepoints come from TestCase wrapping every test in a transaction
+    return [q['sql'] for q in context.captured_queries
+            if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'BEGIN'))]
+
+
+def scrape(client):
+    # Callers run with METRICS_TOKEN='test': /metrics is closed without a token
+    response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer test')
+    assert response['Content-Type'].split(';')[0] == 'text/plain', response
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.content.decode())
+        for sample in family.samples
+    }
+
+
+@override_settings(METRICS_TOKEN='test')
+class KioskASGITests(TransactionTestCase):
+    # ASGIHandler runs each request's sync code in a thread of its own, so the
+    # data has to be committed for the kiosk views to see it
+    def setUp(self):
+        self.book = Book.objects.create(title='Абай жолы', isbn='9786010000901')
+        BookInstance.objects.create(book=self.book, inventory_number='INV-K', qr_code='qr.png')
+        kiosk_cache.clear()
+
+    def get(self, path, host=b'testserver'):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'root_path': '', 'headers': [(b'host', host)],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+
+        async def run():
+            communicator = ApplicationCommunicator(asgi.application, scope)
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(timeout=5)
+            await communicator.receive_output(timeout=5)
+            return start['status'], {name.lower(): value for name, value in start['headers']}
+        return async_to_sync(run)()
+
+    def requests_counted(self, status):
+        labels = {'view': 'catalog:api_kiosk_book', 'method': 'GET', 'status': status}
+        return scrape(self.client).get(('steppe_http_requests_total', tuple(sorted(labels.items()))), 0)
+
+    def test_kiosk_paths_keep_security_headers_and_metrics(self):
+        before = self.requests_counted('200'), self.requests_counted('404')
+        status, headers = self.get(reverse('catalog:api_kiosk_book', args=[self.book.pk]))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'x-content-type-options'], b'nosniff')
+        status, headers = self.get(reverse('catalog:api_kiosk_book', args=[self.book.pk + 1000]))
+        self.assertEqual(status, 404)
+        self.assertEqual(headers[b'x-content-type-options'], b'nosniff')
+        self.assertEqual(self.requests_counted('200') - before[0], 1)
+        self.assertEqual(self.requests_counted('404') - before[1], 1)
+
+
+    @override_settings(ALLOWED_HOSTS=['library.example'])
+    def test_kiosk_paths_check_the_host(self):
+        path = reverse('catalog:api_kiosk_book', args=[self.book.pk])
+        self.assertEqual(self.get(path, host=b'evil.example')[0], 400)
+        self.assertEqual(self.get(path, host=b'library.example')[0], 200)
+
+
+class SqliteConnectionTests(TestCase):
+    def test_new_connection_gets_the_pragmas(self):
+        fresh = connections.create_connection('default')
+        self.addCleanup(fresh.close)
+        fresh.ensure_connection()
+        with fresh.cursor() as cursor:
+            values = {}
+            for name in ('busy_timeout', 'cache_size', 'synchronous', 'temp_store'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        pragmas = settings.SQLITE_PRAGMAS
+        # synchronous and temp_store read back as numbers: NORMAL is 1, MEMORY is 2
+        self.assertEqual(values, {
+            'busy_timeout': pragmas['busy_timeout'], 'cache_size': pragmas['cache_size'],
+            'synchronous': 1, 'temp_store': 2,
+        })
+
+
+class ImmediateAtomicTests(TransactionTestCase):
+    def begins(self, context):
+        return [q['sql'] for q in context.captured_queries if q['sql'].startswith('BEGIN')]
+
+    def test_takes_the_write_lock_up_front(self):
+        with CaptureQueriesContext(connection) as context:
+            with immediate_atomic():
+                self.assertTrue(connection.in_atomic_block)
+        self.assertEqual(self.begins(context), ['BEGIN IMMEDIATE'])
+        # Later transactions are deferred again
+        self.assertIsNone(connection.transaction_mode)
+
+    def test_nested_block_is_a_savepoint(self):
+        with CaptureQueriesContext(connection) as context:
+            with immediate_atomic():
+                with immediate_atomic():
+                    pass
+        self.assertEqual(self.begins(context), ['BEGIN IMMEDIATE'])
+        self.assertTrue(any(q['sql'].startswith('SAVEPOINT') for q in context.captured_queries))
+
+
+class AdminChangelistTests(TestCase):
+    CHANGELISTS = [
+        'catalog_book', 'catalog_bookinstance', 'catalog_author', 'loans_loan', 'loans_fine',
+        'loans_reservation', 'loans_archivedloan', 'loans_notification', 'auth_user',
+    ]
+    QUERY_BUDGET = 8
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(self.admin)
+        self.added = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            n = self.added = self.added + 1
+            book = Book.objects.create(title=f'Книга {n}', isbn=f'97860100{n:05d}')
+            book.authors.add(Author.objects.create(first_name='Имя', last_name=f'Автор {n}'))
+            reader = User.objects.create_user(f'reader{n}', first_name='Имя', last_name=f'Читатель {n}')
+            instance = BookInstance.objects.create(book=book, inventory_number=f'INV-A{n}', qr_code='qr.png')
+            loan = services.issue_loan(instance, reader, when=timezone.now() - timedelta(days=40))
+            services.return_loan(loan)
+            Reservation.objects.create(user=reader, book=book)
+
+    def changelist_queries(self):
+        counts = {}
+        for name in self.CHANGELISTS:
+            app_label, model = name.split('_', 1)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(f'/admin/{app_label}/{model}/')
+            self.assertEqual(response.status_code, 200, name)
+            counts[name] = len(data_queries(context))
+        return counts
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.add_rows(3)
+        small = self.changelist_queries()
+        self.add_rows(12)
+        large = self.changelist_queries()
+        self.assertEqual(large, small)
+        for name, count in large.items():
+            self.assertLessEqual(count, self.QUERY_BUDGET, name)
+
+    def test_unfiltered_total_is_estimated_on_big_tables(self):
+        self.add_rows(3)
+        refresh_table_stats()
+        BookInstance.objects.create(book=Book.objects.first(), inventory_number='INV-NEW', qr_code='qr.png')
+        with self.settings(ADMIN_ESTIMATED_COUNT_FROM=1):
+            self.assertEqual(EstimatedCountPaginator(BookInstance.objects.all(), 100).count, 3)
+            filtered = BookInstance.objects.filter(inventory_number__startswith='INV-')
+            self.assertEqual(EstimatedCountPaginator(filtered, 100).count, 4)
+        self.assertEqual(EstimatedCountPaginator(BookInstance.objects.all(), 100).count, 4)
+
+    def test_pages_past_a_stale_estimate_stay_reachable(self):
+        self.add_rows(3)
+        refresh_table_stats()
+        for n in range(3):
+            BookInstance.objects.create(book=Book.objects.first(), inventory_number=f'INV-NEW{n}', qr_code='qr.png')
+        with self.settings(ADMIN_ESTIMATED_COUNT_FROM=1):
+            paginator = EstimatedCountPaginator(BookInstance.objects.order_by('inventory_number'), 2)
+            self.assertEqual(paginator.num_pages, 2)
+            page = paginator.page(3)
+        self.assertEqual([i.inventory_number for i in page], ['INV-NEW1', 'INV-NEW2'])
+        self.assertEqual(paginator.count, 6)
+
+    def test_statistics_are_refreshed_by_the_scheduler(self):
+        self.assertIn('refresh_table_stats', [job.name for job in scheduler.jobs()])
+        self.add_rows(3)
+        call_command('refresh_table_stats', stdout=StringIO())
+        with self.settings(ADMIN_ESTIMATED_COUNT_FROM=1):
+            self.assertEqual(EstimatedCountPaginator(BookInstance.objects.all(), 100).count, 3)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def route(self, request, view=None, user=None):
+        request.user = user or AnonymousUser()
+        seen = {}
+
+        def get_response(request):
+            seen['before'] = router.db_for_read(Book)
+            if view:
+                view()
+            seen['after'] = router.db_for_read(Book)
+            seen['loan'] = router.db_for_read(Loan)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return seen, response
+
+    def test_safe_reads_of_catalog_go_to_the_replica(self):
+        seen, response = self.route(self.factory.get('/'))
+        self.assertEqual(seen, {'before': 'replica', 'after': 'replica', 'loan': 'default'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        # Outside a request, e.g. in commands, everything reads from the primary
+        self.assertEqual(router.db_for_read(Book), 'default')
+
+    def test_a_write_pins_the_rest_of_the_request_and_the_browser(self):
+        seen, response = self.route(self.factory.get('/'), view=lambda: router.db_for_write(Book))
+        self.assertEqual((seen['before'], seen['after']), ('replica', 'default'))
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+        pinned = self.factory.get('/')
+        pinned.COOKIES[PIN_COOKIE] = '1'
+        seen, _ = self.route(pinned)
+        self.assertEqual(seen['before'], 'default')
+
+        seen, response = self.route(self.factory.post('/'))
+        self.assertEqual(seen['before'], 'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_signed_in_users_read_from_the_primary(self):
+        seen, _ = self.route(self.factory.get('/'), user=User(username='librarian'))
+        self.assertEqual(seen['before'], 'default')
+
+    def test_routing_is_configurable_per_model(self):
+        with self.settings(REPLICA_READS=['loans.loan']):
+            seen, _ = self.route(self.factory.get('/'))
+        self.assertEqual((seen['before'], seen['loan']), ('default', 'replica'))
+
+
+class StartupBudgetTests(SimpleTestCase):
+    HEAVY = {'qrcode', 'PIL'}
+
+    def test_cold_start_stays_within_budget(self):
+        profile = startup.measure()
+        loaded = {cost.name.split('.')[0] for cost in profile.imports}
+        self.assertFalse(loaded & self.HEAVY, 'imported at startup instead of on first use')
+        # Best of three: a busy machine only ever makes a run slower
+        best = min(sum(startup.measure(importtime=False)[:2]) for _ in range(3))
+        self.assertLess(best, settings.STARTUP_BUDGET_MS)
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = self.settings(PROFILE_DIR=directory.name, PROFILE_KEEP=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.librarian = User.objects.create_user('librarian')
+        UserProfile.objects.filter(user=self.librarian).update(role='librarian')
+        self.client.force_login(self.librarian)
+        self.token = profiling.make_token(self.librarian)
+
+    def test_only_signed_requests_are_profiled(self):
+        self.client.get('/staff/')
+        self.client.get('/staff/', {'_profile': 'forged'})
+        self.assertEqual(profiling.recent(), [])
+
+        response = self.client.get('/staff/', {'_profile': self.token, 'page': '2'})
+        [profile] = profiling.recent()
+        self.assertEqual(response['X-Steppe-Profile'], profile['name'])
+        self.assertEqual((profile['path'], profile['status'], profile['trigger']), ('/staff/?page=2', 200, 'token'))
+
+        response = self.client.get(f'/staff/profiles/{profile["name"]}/collapsed/')
+        stacks = b''.join(response.streaming_content).decode()
+        view_stacks = [line for line in stacks.splitlines() if 'staff_panel (loans/views.py:' in line]
+        self.assertTrue(view_stacks)
+        self.assertTrue(all(line.startswith('handle (steppelibrary/profiling.py:') for line in view_stacks))
+        self.assertEqual(self.client.get('/staff/profiles/..%2Fsecret/pstats/').status_code, 404)
+
+    def test_token_dies_with_the_librarian_role(self):
+        UserProfile.objects.filter(user=self.librarian).update(role='student')
+        self.client.get('/catalog/', HTTP_X_STEPPE_PROFILE=self.token)
+        UserProfile.objects.filter(user=self.librarian).update(role='librarian')
+        User.objects.filter(pk=self.librarian.pk).update(is_active=False)
+        self.client.get('/catalog/', HTTP_X_STEPPE_PROFILE=self.token)
+        self.assertEqual(profiling.recent(), [])
+
+    def test_ring_keeps_the_newest(self):
+        for _ in range(3):
+            self.client.get('/catalog/', HTTP_X_STEPPE_PROFILE=self.token)
+        names = [profile['name'] for profile in profiling.recent()]
+        self.assertEqual(len(names), 2)
+        self.assertEqual(len(list(Path(settings.PROFILE_DIR).iterdir())), 6)
+        self.assertContains(self.client.get('/staff/profiles/'), names[0])
+
+
+class PaginationTagTests(SimpleTestCase):
+    def render(self, url, number, count):
+        page = Paginator(range(count), 10).get_page(number)
+        template = Template('{% load steppe_tags %}{% pagination page %}')
+        return template.render(Context({'request': RequestFactory().get(url), 'page': page}))
+
+    def test_window_is_bounded_and_keeps_filters(self):
+        small, large = self.render('/catalog/?page=50', 50, 1000), self.render('/catalog/?page=50', 50, 100000)
+        self.assertEqual(small.count('page-link'), large.count('page-link'))
+        self.assertIn('?page=10000"', large)
+        self.assertNotIn('?page=5000"', large)
+
+        html = self.render('/catalog/?q=T%261&genre=2&page=3', 3, 1000)
+        self.assertIn('href="?q=T%261&amp;genre=2&amp;page=4"', html)
+        self.assertNotIn('page=3&amp;', html)
+
+
+@override_settings(METRICS_TOKEN='test')
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Абай жолы', isbn='9786010000801')
+        self.instance = BookInstance.objects.create(book=self.book, inventory_number='INV-M', qr_code='qr.png')
+        self.reader = User.objects.create_user('reader')
+        self.librarian = User.objects.create_user('librarian')
+        UserProfile.objects.filter(user=self.librarian).update(role='librarian')
+
+    def test_counts_circulation_and_requests(self):
+        before = scrape(self.client)
+        with self.captureOnCommitCallbacks(execute=True):
+            loan = services.issue_loan(self.instance, self.reader)
+        Loan.objects.filter(pk=loan.pk).update(due_date=timezone.now() - timedelta(days=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            services.return_loan(Loan.objects.select_related('book_instance__book').get(pk=loan.pk))
+        self.client.force_login(self.librarian)
+        self.client.get('/staff/')
+        after = scrape(self.client)
+
+        def delta(name, **labels):
+            key = (name, tuple(sorted(labels.items())))
+            return after.get(key, 0) - before.get(key, 0)
+
+        self.assertEqual(delta('steppe_loans_issued_total'), 1)
+        self.assertEqual(delta('steppe_loans_returned_total'), 1)
+        self.assertEqual(delta('steppe_fines_issued_total'), 1)
+        staff = {'view': 'loans:staff_panel', 'method': 'GET'}
+        self.assertEqual(delta('steppe_http_requests_total', status='200', **staff), 1)
+        self.assertEqual(delta('steppe_http_request_duration_seconds_count', **staff), 1)
+        self.assertGreater(delta('steppe_db_queries_per_request_sum', view='loans:staff_panel'), 0)
+
+    def test_sums_the_files_of_worker_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for loans in (1, 2):
+            subprocess.run(
+                [sys.executable, '-c', 'import django; django.setup(); '
+                 f'from steppelibrary import metrics; metrics.LOANS_ISSUED.inc({loans})'],
+                env={**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory.name}, cwd=settings.BASE_DIR, check=True,
+            )
+        with mock.patch.object(metrics, 'MULTIPROC_DIR', directory.name):
+            self.assertEqual(scrape(self.client)[('steppe_loans_issued_total', ())], 3)
+            self.assertGreaterEqual(metrics.clear(), 2)
+            self.assertNotIn(('steppe_loans_issued_total', ()), scrape(self.client))
+
+    def test_management_commands_share_their_counts(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = {key: value for key, value in os.environ.items() if key != 'PROMETHEUS_MULTIPROC_DIR'}
+        # manage.py itself points the command at METRICS_DIR
+        env['STEPPELIBRARY_METRICS_DIR'] = directory.name
+        for _ in range(2):
+            subprocess.run(
+                [sys.executable, 'manage.py', 'shell', '-c',
+                 'from steppelibrary import metrics; metrics.RESERVATIONS_EXPIRED.inc()'],
+                env=env, cwd=settings.BASE_DIR, check=True,
+            )
+        with mock.patch.object(metrics, 'MULTIPROC_DIR', directory.name):
+            self.assertEqual(scrape(self.client)[('steppe_reservations_expired_total', ())], 2)
+
+    def test_one_off_processes_count_in_memory(self):
+        env = {key: value for key, value in os.environ.items() if key != 'PROMETHEUS_MULTIPROC_DIR'}
+        result = subprocess.run(
+            [sys.executable, '-c', 'import django; django.setup(); '
+             'from steppelibrary import metrics; print(metrics.MULTIPROC_DIR)'],
+            env=env, cwd=settings.BASE_DIR, check=True, capture_output=True, text=True,
+        )
+        self.assertEqual(result.stdout.strip(), 'None')
+        # Importing asgi.py from a process that already counts in memory changes nothing
+        with mock.patch.dict(os.environ, env, clear=True):
+            share_metrics()
+            self.assertNotIn('PROMETHEUS_MULTIPROC_DIR', os.environ)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_endpoint_is_closed_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_guards_the_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
@@ -6,14 +6,17 @@ from django.shortcuts import render
 from django.db.models import Count
 
 from catalog.models import Book, Genre
+from steppelibrary.metrics import metrics_view
 
 
 def home(request):
     books = Book.objects.prefetch_related('authors', 'instances').order_by('-date_added')[:8]
+    popular = Book.objects.prefetch_related('authors', 'instances').filter(popularity__gt=0).order_by('-popularity', 'title')[:8]
     genres = Genre.objects.annotate(book_count=Count('books')).filter(book_count__gt=0)
     total_books = Book.objects.count()
     return render(request, 'home.html', {
         'featured_books': books,
+        'popular_books': popular,
         'genres': genres,
         'total_books': total_books,
     })
@@ -22,6 +25,7 @@ def home(request):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', home, name='home'),
+    path('metrics', metrics_view, name='metrics'),
     path('catalog/', include('catalog.urls')),
     path('accounts/', include('accounts.urls')),
     path('', include('loans.urls')),
@@ -11,6 +11,9 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from steppelibrary.multiprocess import share_metrics
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'steppelibrary.settings')
+share_metrics()
 
 application = get_wsgi_application()
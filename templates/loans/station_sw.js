@@ -0,0 +1,78 @@
+{% load static %}// Scanner station service worker: keeps the station page and its assets
+// available offline. Scans themselves never go through the cache; the page
+// queues them in IndexedDB and posts them to the sync endpoint.
+var CACHE = 'steppe-station-v1';
+var PAGE = '{% url "loans:station" %}';
+var SHELL = [
+    PAGE,
+    '{% static "css/style.css" %}',
+    '{% static "js/qr-scanner.js" %}',
+    '{% static "js/station.js" %}',
+    '{% static "img/Steppe.png" %}',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js',
+    'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.min.css',
+    'https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js'
+];
+
+self.addEventListener('install', function (event) {
+    event.waitUntil(caches.open(CACHE).then(function (cache) {
+        return Promise.all(SHELL.map(function (url) {
+            // Cross-origin assets are cached as opaque responses
+            var request = new Request(url, url.indexOf('http') === 0 ? { mode: 'no-cors' } : { credentials: 'same-origin' });
+            return fetch(request).then(function (response) {
+                return cache.put(url, response);
+            }).catch(function () {
+                // One missing asset must not block the station from installing
+            });
+        }));
+    }).then(function () {
+        return self.skipWaiting();
+    }));
+});
+
+self.addEventListener('activate', function (event) {
+    event.waitUntil(caches.keys().then(function (keys) {
+        return Promise.all(keys.filter(function (key) {
+            return key.indexOf('steppe-station-') === 0 && key !== CACHE;
+        }).map(function (key) {
+            return caches.delete(key);
+        }));
+    }).then(function () {
+        return self.clients.claim();
+    }));
+});
+
+self.addEventListener('fetch', function (event) {
+    var request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    if (request.mode === 'navigate') {
+        // Network first so the page carries a fresh CSRF token; the cached copy when offline
+        event.respondWith(fetch(request).then(function (response) {
+            if (response.ok && !response.redirected) {
+                var copy = response.clone();
+                caches.open(CACHE).then(function (cache) {
+                    cache.put(PAGE, copy);
+                });
+            }
+            return response;
+        }).catch(function () {
+            return caches.match(PAGE);
+        }));
+        return;
+    }
+    // Assets: cache first, filling the cache with anything fetched on the way (icon fonts)
+    event.respondWith(caches.match(request).then(function (cached) {
+        return cached || fetch(request).then(function (response) {
+            if (response.ok || response.type === 'opaque') {
+                var copy = response.clone();
+                caches.open(CACHE).then(function (cache) {
+                    cache.put(request, copy);
+                });
+            }
+            return response;
+        });
+    }));
+});